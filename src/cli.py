@@ -0,0 +1,258 @@
+"""CLI de administración. Uso: python -m src.cli <comando> [opciones]"""
+import argparse, json, sys
+
+def _print(obj) -> None:
+    print(json.dumps(obj, ensure_ascii=False, indent=2))
+
+def cmd_cache_stats(args) -> int:
+    from .core.maintenance import cache_usage
+    usage = cache_usage()
+    if args.json:
+        _print(usage)
+        return 0
+    print(f"{'proveedor':<16}{'filas':>10}{'bytes':>14}{'cuota':>14}")
+    for provider, p in sorted(usage["providers"].items()):
+        quota = p["quota"] if p["quota"] is not None else "-"
+        print(f"{provider:<16}{p['rows']:>10}{p['bytes']:>14}{quota:>14}")
+    print(f"total: {usage['total_bytes']} bytes (tope {usage['max_bytes']}); "
+          f"archivo: {usage['file_bytes']} bytes, libres: {usage['free_bytes']}")
+    return 0
+
+def cmd_cache_maintain(args) -> int:
+    from .core.maintenance import run_maintenance
+    _print(run_maintenance())
+    return 0
+
+def cmd_cache_migrate(args) -> int:
+    from .core.database import cache_migrate_payloads
+    _print(cache_migrate_payloads(args.batch))
+    return 0
+
+def cmd_evidence_compile(args) -> int:
+    import time
+    from .utils.evidence import compile_disk_index
+    from .core.config import EVIDENCE_INDEX_DB
+    t = time.time()
+    n = compile_disk_index(args.out or EVIDENCE_INDEX_DB)
+    _print({"entries": n, "path": args.out or EVIDENCE_INDEX_DB, "elapsed_s": round(time.time() - t, 3)})
+    return 0
+
+def cmd_kb_import(args) -> int:
+    from .utils.kb_import import import_file
+    def progress(rows: int, elapsed: float) -> None:
+        print(f"  {rows} filas · {int(rows / elapsed) if elapsed else rows} filas/s", file=sys.stderr)
+    for path in args.paths:
+        _print(import_file(args.source.upper(), path, fmt=args.format, force=args.force,
+                           prune=not args.no_prune, progress=progress))
+    return 0
+
+def cmd_kb_stats(args) -> int:
+    from .core.kb import stats
+    _print(stats())
+    return 0
+
+def cmd_prefetch(args) -> int:
+    import asyncio
+    from .core import http_clients
+    from .core.database import cache_init
+    from .services import prefetch
+    cache_init()
+    variants = []
+    for path in args.file or []:
+        variants += prefetch.read_variants(path)
+    if args.panels or not args.file:
+        variants += prefetch.panel_variants(args.tumor or None)
+    def progress(p) -> None:
+        print(f"  {p['done']}/{p['total']} variantes · {p['variants_per_s']} var/s", file=sys.stderr)
+
+    async def run():
+        try:
+            return await prefetch.prefetch(variants, providers=args.provider or None,
+                                           margin=args.margin, progress=progress)
+        finally:
+            await http_clients.shutdown()
+    _print(asyncio.run(run()))
+    return 0
+
+def cmd_analyze_batch(args) -> int:
+    import asyncio
+    from .core import http_clients
+    from .core.database import cache_init
+    from .services import cohort
+    from .utils.vcf_parser import iter_lines
+    cache_init()
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+
+    async def run():
+        try:
+            with open(args.path, "rb") as f:
+                patients = cohort.read_patients(cohort.aiter_sync(iter_lines(f)), args.path, args.tumor)
+                async for res in cohort.analyze_cohort(patients, window=args.window):
+                    out.write(json.dumps(res, ensure_ascii=False) + "\n")
+                    if res["type"] == "summary":
+                        print(f"  {res['patients']} pacientes · {res['patients_per_s']} pacientes/s", file=sys.stderr)
+        finally:
+            await http_clients.shutdown()
+    try:
+        asyncio.run(run())
+    finally:
+        if args.out:
+            out.close()
+    return 0
+
+def cmd_export_zip(args) -> int:
+    import asyncio, time
+    from .core import jobs
+    from .services import bulk_export, report_pdf
+    if args.job:
+        job = jobs.get(args.job)
+        if job is None or job["kind"] != "cohort" or job["status"] != jobs.DONE:
+            print(f"trabajo {args.job}: no es una cohorte terminada", file=sys.stderr)
+            return 1
+        path = job["result_path"]
+    elif args.path:
+        path = args.path
+    else:
+        print("falta PATH o --job", file=sys.stderr)
+        return 1
+
+    async def run() -> int:
+        written = 0
+        try:
+            with open(args.out, "wb") as out:
+                async for chunk in bulk_export.zip_stream(bulk_export.job_reports(path),
+                                                          bulk_export.parse_formats(args.formats),
+                                                          concurrency=args.concurrency):
+                    out.write(chunk)
+                    written += len(chunk)
+        finally:
+            report_pdf.shutdown()
+        return written
+    t = time.time()
+    written = asyncio.run(run())
+    _print({"out": args.out, "bytes": written, "elapsed_s": round(time.time() - t, 3)})
+    return 0
+
+def _synthetic_reports(n: int):
+    """Informes de ejemplo para medir la extracción: hotspots de los paneles entre texto libre."""
+    import random
+    from .utils.tumor_utils import HOTSPOTS_POR_GEN
+    rnd = random.Random(0)
+    pool = [(g, v) for g, vs in HOTSPOTS_POR_GEN.items() for v in vs]
+    filler = ("Muestra FFPE con 40% de celularidad tumoral. Se secuenció un panel NGS de ADN y ARN "
+              "sin alteraciones adicionales reportables. ")
+    for i in range(n):
+        hits = rnd.sample(pool, 3)
+        parts = [f"{g} {v}" if v.startswith("EX") else f"{g} mutación p.{v}" for g, v in hits]
+        yield (f"Informe {i}. {filler * 3}Resultado: {', '.join(parts)}. PD-L1 TPS {rnd.randint(0, 100)}%. "
+               f"{'MSI-H. ' if i % 7 == 0 else 'MSS. '}{filler * 2}")
+
+def cmd_pathology_extract(args) -> int:
+    import time
+    from .core.config import PATHOLOGY_WORKERS
+    from .utils.pathology_utils import extract_many, get_extractor
+    workers = args.workers or PATHOLOGY_WORKERS
+    if args.bench:
+        texts = list(_synthetic_reports(args.bench))
+        ids = list(range(len(texts)))
+    elif args.path:
+        ids, texts = [], []
+        with open(args.path, encoding="utf-8", errors="ignore") as f:
+            if args.path.endswith((".ndjson", ".jsonl")):
+                for n, line in enumerate(f):
+                    if line.strip():
+                        obj = json.loads(line)
+                        ids.append(obj.get("id") or obj.get("pseudonym") or n)
+                        texts.append(obj.get("pathology_report") or obj.get("text") or "")
+            else:
+                ids, texts = [args.path], [f.read()]
+    else:
+        print("falta PATH o --bench", file=sys.stderr)
+        return 1
+    get_extractor()  # el diccionario de genes no cuenta en la medición
+    out = open(args.out, "w", encoding="utf-8") if args.out else (None if args.bench else sys.stdout)
+    variants = 0
+    t = time.perf_counter()
+    try:
+        for i, res in zip(ids, extract_many(texts, workers=workers)):
+            variants += len(res["variants"])
+            if out is not None:
+                out.write(json.dumps({"id": i, **res}, ensure_ascii=False) + "\n")
+    finally:
+        if args.out:
+            out.close()
+    elapsed = time.perf_counter() - t
+    summary = {"reports": len(texts), "variants": variants, "workers": workers,
+               "elapsed_s": round(elapsed, 3), "reports_per_s": round(len(texts) / elapsed, 1) if elapsed else None}
+    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Herramientas PGx")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("cache-stats", help="Filas y bytes del cache por proveedor")
+    p.add_argument("--json", action="store_true", help="Salida JSON completa")
+    p.set_defaults(func=cmd_cache_stats)
+
+    p = sub.add_parser("cache-maintain", help="Borra vencidos, aplica cuotas y hace vacuum incremental")
+    p.set_defaults(func=cmd_cache_maintain)
+
+    p = sub.add_parser("cache-migrate", help="Recodifica filas TEXT legacy a BLOB comprimido")
+    p.add_argument("--batch", type=int, default=1000)
+    p.set_defaults(func=cmd_cache_migrate)
+
+    p = sub.add_parser("evidence-compile", help="Precompila la evidencia local a un índice SQLite")
+    p.add_argument("--out", help="Ruta del índice (por defecto EVIDENCE_INDEX_DB)")
+    p.set_defaults(func=cmd_evidence_compile)
+
+    p = sub.add_parser("kb-import", help="Importa dumps de CIViC/ClinVar a la base local (streaming)")
+    p.add_argument("source", choices=["civic", "clinvar"])
+    p.add_argument("paths", nargs="+", help="TSV nocturno de CIViC, variant_summary.txt(.gz) o clinvar.vcf(.gz)")
+    p.add_argument("--format", choices=["civic-tsv", "clinvar-summary", "clinvar-vcf"], help="Por defecto se deduce")
+    p.add_argument("--force", action="store_true", help="Reimporta aunque el archivo no haya cambiado")
+    p.add_argument("--no-prune", action="store_true", help="No borra filas ausentes (archivos parciales)")
+    p.set_defaults(func=cmd_kb_import)
+
+    p = sub.add_parser("prefetch", help="Precarga el cache con los hotspots de los paneles o de archivos")
+    p.add_argument("--file", action="append", help="VCF o texto 'GEN VARIANTE [CHROM POS REF ALT]' (repetible)")
+    p.add_argument("--panels", action="store_true", help="Suma los hotspots de los paneles aunque haya --file")
+    p.add_argument("--tumor", action="append", help="Limita los paneles a estos tumores (repetible)")
+    p.add_argument("--provider", action="append", choices=["CIVIC", "CLINVAR", "ONCOKB", "VEP"])
+    from .core.config import PREFETCH_REFRESH_MARGIN
+    p.add_argument("--margin", type=float, default=PREFETCH_REFRESH_MARGIN,
+                   help="Refresca también lo que vence dentro de estos segundos")
+    p.set_defaults(func=cmd_prefetch)
+
+    p = sub.add_parser("analyze-batch", help="Analiza una cohorte (NDJSON de pacientes o VCF multi-muestra)")
+    p.add_argument("path", help="NDJSON (un paciente por línea) o VCF(.gz) con una columna por muestra")
+    p.add_argument("--tumor", help="Tumor de las muestras del VCF (o por defecto para el NDJSON)")
+    p.add_argument("--window", type=int, help="Pacientes por ventana (por defecto COHORT_WINDOW)")
+    p.add_argument("--out", help="Archivo NDJSON de salida (por defecto stdout)")
+    p.set_defaults(func=cmd_analyze_batch)
+
+    p = sub.add_parser("export-zip", help="Exporta los reportes de una cohorte a un ZIP (PDF/JSON + resumen)")
+    p.add_argument("path", nargs="?", help="NDJSON de payloads de /export/pdf o salida de analyze-batch")
+    p.add_argument("--job", help="Id de un trabajo de cohorte terminado (en vez de PATH)")
+    p.add_argument("--out", required=True, help="Archivo ZIP de salida")
+    p.add_argument("--formats", default="pdf,json", help="pdf, json o ambos (separados por coma)")
+    p.add_argument("--concurrency", type=int, help="Reportes en vuelo (por defecto EXPORT_CONCURRENCY)")
+    p.set_defaults(func=cmd_export_zip)
+
+    p = sub.add_parser("pathology-extract", help="Extrae variantes y biomarcadores de informes de patología")
+    p.add_argument("path", nargs="?", help="NDJSON (pathology_report o text por línea) o un informe en texto")
+    p.add_argument("--out", help="NDJSON de salida (por defecto stdout)")
+    p.add_argument("--workers", type=int, default=None, help="Procesos (por defecto PATHOLOGY_WORKERS)")
+    p.add_argument("--bench", type=int, metavar="N", help="Mide informes/s con N informes sintéticos")
+    p.set_defaults(func=cmd_pathology_extract)
+
+    p = sub.add_parser("kb-stats", help="Filas e imports de la base local")
+    p.set_defaults(func=cmd_kb_stats)
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,16 +5,56 @@ APP_TITLE = "PGx Multi-Input · Strict + IA + Diccionario"
 # -------- HTTP / Networking --------
 HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "18.0"))
 HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))  # segundos, se duplica por intento
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8.0"))
+# Pools keep-alive por proveedor (HTTP/2 solo si está instalado el extra httpx[http2])
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "0") == "1"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30.0"))
+
+# -------- Resiliencia por proveedor --------
+# Circuit breaker: se abre tras N fallos consecutivos y prueba de nuevo pasado el reset
+CB_FAILURE_THRESHOLD = int(os.getenv("CB_FAILURE_THRESHOLD", "5"))
+CB_RESET_TIMEOUT = float(os.getenv("CB_RESET_TIMEOUT", "30.0"))
+# Los fallos upstream se recuerdan poco tiempo y nunca se guardan como "sin resultados"
+CACHE_NEGATIVE_TTL = float(os.getenv("CACHE_NEGATIVE_TTL", "60.0"))
+
+# -------- Monitor de salud --------
+# Los proveedores se sondean en segundo plano; /health responde desde el último snapshot
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "30.0"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", "5.0"))
+HEALTH_HISTORY = int(os.getenv("HEALTH_HISTORY", "120"))  # muestras guardadas por proveedor
+
+# -------- Anotación concurrente --------
+# Máximo de consultas (variante, proveedor) simultáneas y tope de tiempo por análisis
+ANNOTATION_CONCURRENCY = int(os.getenv("ANNOTATION_CONCURRENCY", "16"))
+ANNOTATION_DEADLINE = float(os.getenv("ANNOTATION_DEADLINE", "25.0"))
+# Registros distintos de un VCF que /analyze/unified y /analyze/stream procesan dentro del request
+# (los sin anotar van a VEP); con más se responde 413 y el VCF va por /jobs/analyze. 0 = sin tope
+ANALYZE_VCF_MAX_RECORDS = int(os.getenv("ANALYZE_VCF_MAX_RECORDS", "500"))
 
 # -------- External APIs --------
 CIVIC_URL = os.getenv("CIVIC_URL", "https://civicdb.org/api/graphql")
+# Variantes por consulta GraphQL multi-alias (consultas muy grandes las rechaza por complejidad)
+CIVIC_BATCH_SIZE = int(os.getenv("CIVIC_BATCH_SIZE", "25"))
+CIVIC_BATCH_CONCURRENCY = int(os.getenv("CIVIC_BATCH_CONCURRENCY", "4"))
 VEP_URL = os.getenv("VEP_URL", "https://rest.ensembl.org/vep/human/region")
+VEP_BATCH_SIZE = int(os.getenv("VEP_BATCH_SIZE", "200"))  # máximo que acepta el POST de Ensembl
+VEP_BATCH_CONCURRENCY = int(os.getenv("VEP_BATCH_CONCURRENCY", "4"))
 CLINVAR_EUTILS = os.getenv("CLINVAR_EUTILS", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi")
 CLINVAR_SUMMARY = os.getenv("CLINVAR_SUMMARY", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi")
 NCBI_API_KEY = os.getenv("NCBI_API_KEY", "")  # opcional
+# NCBI admite 3 req/s sin API key y 10 req/s con ella; el cupo se comparte entre workers
+NCBI_RATE_LIMIT = float(os.getenv("NCBI_RATE_LIMIT", "10" if NCBI_API_KEY else "3"))
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "1") == "1"
+CLINVAR_BATCH_SIZE = int(os.getenv("CLINVAR_BATCH_SIZE", "50"))  # variantes por esummary combinado
 CTGOV_V2 = os.getenv("CTGOV_V2", "https://clinicaltrials.gov/api/v2/studies")
 ONCOKB_URL = os.getenv("ONCOKB_URL", "https://www.oncokb.org/api/v1")
 ONCOKB_TOKEN = os.getenv("ONCOKB_TOKEN", "")  # recomendado
+ONCOKB_BATCH_SIZE = int(os.getenv("ONCOKB_BATCH_SIZE", "100"))  # consultas por POST de annotate
+ONCOKB_BATCH_CONCURRENCY = int(os.getenv("ONCOKB_BATCH_CONCURRENCY", "2"))
+ONCOKB_REFERENCE_GENOME = os.getenv("ONCOKB_REFERENCE_GENOME", "GRCh38")  # el mismo que VEP_URL
 
 # -------- LLM (opcional) --------
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
@@ -32,6 +72,21 @@ CACHE_DB = os.path.abspath(
     os.getenv("PGX_CACHE_DB")
     or os.path.join(os.path.dirname(__file__), "..", "..", "data", "pgx_cache.sqlite")
 )
+# Conexiones SQLite reutilizadas por hilo, en modo WAL
+CACHE_BUSY_TIMEOUT_MS = int(os.getenv("CACHE_BUSY_TIMEOUT_MS", "5000"))
+CACHE_MMAP_SIZE = int(os.getenv("CACHE_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SYNCHRONOUS = os.getenv("CACHE_SYNCHRONOUS", "NORMAL")  # OFF | NORMAL | FULL
+# Tier en memoria (LRU) delante de SQLite, acotado por entradas y bytes
+CACHE_MEM_MAX_ENTRIES = int(os.getenv("CACHE_MEM_MAX_ENTRIES", "5000"))
+CACHE_MEM_MAX_BYTES = int(os.getenv("CACHE_MEM_MAX_BYTES", str(64 * 1024 * 1024)))
+# Codificación de payloads: BLOB versionado y comprimido ("auto" usa zstd si está instalado, si no zlib)
+CACHE_CODEC = os.getenv("CACHE_CODEC", "auto")  # auto | zstd | zlib | none
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", "3"))
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "256"))
+# Single-flight entre workers: lease en SQLite para que un solo proceso consulte cada clave
+CACHE_LEASES = os.getenv("CACHE_LEASES", "0") == "1"
+CACHE_LEASE_TTL = float(os.getenv("CACHE_LEASE_TTL", str(HTTP_TIMEOUT + 5)))
+CACHE_LEASE_POLL = float(os.getenv("CACHE_LEASE_POLL", "0.2"))
 CACHE_TTLS = {
     "VEP": 30 * 24 * 3600,
     "CIVIC": 14 * 24 * 3600,
@@ -41,6 +96,87 @@ CACHE_TTLS = {
     "GLOSS": 120 * 24 * 3600,
     "EVIDENCE_LOCAL": 365 * 24 * 3600,
 }
+# Stale-while-revalidate: CACHE_TTLS es el TTL "blando"; hasta el TTL "duro" el valor
+# vencido se sirve al instante y se refresca en segundo plano.
+CACHE_STALE_FACTOR = float(os.getenv("CACHE_STALE_FACTOR", "2"))
+CACHE_HARD_TTLS = {p: int(ttl * CACHE_STALE_FACTOR) for p, ttl in CACHE_TTLS.items()}
+CACHE_REFRESH_QUEUE = int(os.getenv("CACHE_REFRESH_QUEUE", "256"))
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "2"))
+
+# Mantenimiento en segundo plano: borrado de vencidos, tope de bytes global y por
+# proveedor (LRU por atime) y vacuum incremental. Intervalo 0 = deshabilitado.
+CACHE_MAINT_INTERVAL = float(os.getenv("CACHE_MAINT_INTERVAL", "3600"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_VACUUM_PAGES = int(os.getenv("CACHE_VACUUM_PAGES", "2000"))
+# Formato: "CIVIC=100000000,CLINVAR=200000000" (bytes); proveedores sin cuota solo respetan el global
+CACHE_PROVIDER_QUOTAS = {
+    k.strip().upper(): int(v)
+    for k, v in (item.split("=", 1) for item in os.getenv("CACHE_PROVIDER_QUOTAS", "").split(",") if "=" in item)
+}
+
+# -------- Precarga del cache --------
+# Variantes hotspot de los paneles (o de PREFETCH_FILE) traídas en lote antes de que lleguen requests
+PREFETCH_ON_STARTUP = os.getenv("PREFETCH_ON_STARTUP", "0") == "1"
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "0"))  # 0 = solo al arrancar
+PREFETCH_FILE = os.getenv("PREFETCH_FILE", "")
+PREFETCH_CHUNK = int(os.getenv("PREFETCH_CHUNK", "500"))  # variantes por tanda
+# Se refrescan también las entradas a menos de este margen (s) de su TTL blando
+PREFETCH_REFRESH_MARGIN = float(os.getenv("PREFETCH_REFRESH_MARGIN", str(24 * 3600)))
+
+# -------- Análisis por cohorte (/analyze/batch) --------
+# Pacientes que se leen, deduplican y anotan juntos; acota la memoria del lote
+COHORT_WINDOW = int(os.getenv("COHORT_WINDOW", "200"))
+# Tope de tiempo por ventana (más holgado que el de un análisis individual)
+COHORT_DEADLINE = float(os.getenv("COHORT_DEADLINE", "300"))
+# Registros de un VCF multi-muestra que se acumulan en memoria antes de volcarlos al SQLite temporal
+COHORT_SPILL_BATCH = int(os.getenv("COHORT_SPILL_BATCH", "5000"))
+
+# -------- Exportación PDF --------
+# Pool donde se renderizan los PDF (process | thread) y cuántos a la vez
+PDF_EXECUTOR = os.getenv("PDF_EXECUTOR", "process").strip().lower()
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+# PDFs ya renderizados, por hash del payload; se desalojan los menos usados al pasar el tope
+PDF_CACHE_DIR = os.path.abspath(os.getenv("PGX_PDF_CACHE_DIR") or os.path.join(os.path.dirname(CACHE_DB), "pdf_cache"))
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Reportes en vuelo durante una exportación masiva (ZIP): acota memoria y trabajo encolado
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", str(PDF_WORKERS * 2)))
+
+# -------- Cola de trabajos (análisis largos fuera del request) --------
+# SQLite junto al cache; entradas y resultados de cada trabajo en JOBS_DIR
+JOBS_DB = os.path.abspath(os.getenv("PGX_JOBS_DB") or os.path.join(os.path.dirname(CACHE_DB), "pgx_jobs.sqlite"))
+JOBS_DIR = os.path.abspath(os.getenv("PGX_JOBS_DIR") or os.path.join(os.path.dirname(CACHE_DB), "jobs"))
+# Procesos worker que lanza la app al arrancar (0 = solo workers externos: python -m src.worker)
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "1"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "0.5"))  # s entre consultas con la cola vacía
+JOBS_HEARTBEAT = float(os.getenv("JOBS_HEARTBEAT", "5"))  # s entre latidos de un trabajo en curso
+# Un trabajo sin latido en este tiempo se considera huérfano (worker caído) y vuelve a la cola
+JOBS_STALE_AFTER = float(os.getenv("JOBS_STALE_AFTER", "60"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_RETENTION = float(os.getenv("JOBS_RETENTION", str(7 * 24 * 3600)))  # s que se guardan los terminados
+
+# -------- Base de conocimiento local (dumps de CIViC / ClinVar) --------
+# network: solo red (actual); local-first: tablas locales y red si no hay fila; local: sin red
+PROVIDER_MODE = os.getenv("PROVIDER_MODE", "network").strip().lower()
+KB_DB = os.path.abspath(
+    os.getenv("PGX_KB_DB")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "data", "local_kb.sqlite")
+)
+KB_ASSEMBLY = os.getenv("KB_ASSEMBLY", "GRCh38")  # filas de variant_summary que se importan
+KB_PROGRESS_EVERY = int(os.getenv("KB_PROGRESS_EVERY", "100000"))  # filas entre reportes de avance
+
+# -------- Informes de patología --------
+# Símbolos de genes: hgnc_complete_set.txt de HGNC (TSV con symbol/alias_symbol/prev_symbol) o
+# un símbolo por línea; si no existe se usa la lista incorporada de genes oncológicos
+HGNC_GENES_FILE = os.path.abspath(
+    os.getenv("PGX_HGNC_GENES")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "data", "hgnc_complete_set.txt")
+)
+PATHOLOGY_WORKERS = int(os.getenv("PATHOLOGY_WORKERS", "1"))  # procesos para extracción por lotes
+# Vocabulario completo de OncoTree (JSON de /api/tumorTypes o TSV con code/name); opcional
+ONCOTREE_FILE = os.path.abspath(
+    os.getenv("PGX_ONCOTREE")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "data", "oncotree_tumor_types.json")
+)
 
 # -------- Internal evidence --------
 # Carpeta donde guardás tus JSON internos
@@ -52,3 +188,11 @@ EVIDENCE_FILES = {
     "cancer": "cancer_evidence.json",
     "pharmgx": "pharmgx_evidence.json",
 }
+# Cada cuántos segundos se revisa el mtime de los JSON para recargar el índice
+EVIDENCE_CHECK_INTERVAL = float(os.getenv("EVIDENCE_CHECK_INTERVAL", "2"))
+# A partir de este tamaño el índice va a un SQLite compacto en disco en vez de a memoria
+EVIDENCE_INDEX_MIN_BYTES = int(os.getenv("EVIDENCE_INDEX_MIN_BYTES", str(32 * 1024 * 1024)))
+EVIDENCE_INDEX_DB = os.path.abspath(
+    os.getenv("PGX_EVIDENCE_INDEX_DB")
+    or os.path.join(os.path.dirname(__file__), "..", "..", "data", "evidence_index.sqlite")
+)
@@ -1,52 +1,420 @@
 
-import sqlite3, json, time, os
-from .config import CACHE_DB, CACHE_TTLS
+import sqlite3, json, time, os, threading, zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .config import (
+    CACHE_DB, CACHE_TTLS, CACHE_HARD_TTLS, CACHE_BUSY_TIMEOUT_MS, CACHE_MMAP_SIZE, CACHE_SYNCHRONOUS,
+    CACHE_MEM_MAX_ENTRIES, CACHE_MEM_MAX_BYTES,
+    CACHE_CODEC, CACHE_COMPRESS_LEVEL, CACHE_COMPRESS_MIN_BYTES,
+)
+
+# Serializador y compresor opcionales: si no están instalados se usa json / zlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Una conexión por hilo (sqlite3 no permite compartirlas entre hilos) y por proceso
+_local = threading.local()
+_conns: List[sqlite3.Connection] = []
+_conns_lock = threading.Lock()
+
+# SQLite limita la cantidad de parámetros por sentencia
+_MAX_PARAMS = 900
+
+class _MemoryLRU:
+    """LRU en proceso acotado por cantidad de entradas y bytes (tamaño del JSON serializado).
+    Guarda el ts de la fila para respetar el TTL del proveedor: get() devuelve (ts, valor)
+    mientras no pase el TTL duro y el llamador decide si está vencido."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Tuple[str, str], Tuple[int, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, pk: Tuple[str, str], now: float) -> Optional[Tuple[int, Any]]:
+        with self._lock:
+            entry = self._data.get(pk)
+            if entry is None:
+                self.misses += 1
+                return None
+            ts, value, size = entry
+            if not _usable(pk[0], ts, now):
+                self._drop(pk)
+                self.misses += 1
+                return None
+            self._data.move_to_end(pk)
+            self.hits += 1
+            return ts, value
+
+    def put(self, pk: Tuple[str, str], ts: int, value: Any, size: int) -> None:
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(pk)
+            self._data[pk] = (ts, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                old, (_, _, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def invalidate(self, pk: Tuple[str, str]) -> None:
+        with self._lock:
+            self._drop(pk)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, pk: Tuple[str, str]) -> None:
+        entry = self._data.pop(pk, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._data), "bytes": self._bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            }
+
+_mem = _MemoryLRU(CACHE_MEM_MAX_ENTRIES, CACHE_MEM_MAX_BYTES)
+
+# -------- Codec de payloads --------
+# BLOB = versión (1 byte) + compresor (1 byte) + cuerpo. Las filas TEXT legacy
+# (json.dumps) se siguen leyendo tal cual.
+_CODEC_VERSION = 1
+_RAW, _ZLIB, _ZSTD = b"n", b"z", b"s"
+
+def _codec_id() -> bytes:
+    if CACHE_CODEC == "none":
+        return _RAW
+    if CACHE_CODEC in ("zstd", "auto") and zstandard is not None:
+        return _ZSTD
+    return _ZLIB
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            pass
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+def _loads(raw) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def encode_payload(value: Any) -> bytes:
+    raw = _dumps(value)
+    codec = _codec_id() if len(raw) >= CACHE_COMPRESS_MIN_BYTES else _RAW
+    if codec == _ZSTD:
+        body = zstandard.ZstdCompressor(level=CACHE_COMPRESS_LEVEL).compress(raw)
+    elif codec == _ZLIB:
+        body = zlib.compress(raw, CACHE_COMPRESS_LEVEL)
+    else:
+        body = raw
+    return bytes((_CODEC_VERSION,)) + codec + body
+
+def decode_payload(data) -> Tuple[Any, int]:
+    """Devuelve (valor, tamaño serializado sin comprimir). Acepta filas TEXT legacy."""
+    if isinstance(data, str):
+        return json.loads(data), len(data)
+    if data[0] != _CODEC_VERSION:
+        raise ValueError(f"payload de cache con versión desconocida: {data[0]}")
+    codec, body = data[1:2], data[2:]
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise ValueError("payload zstd pero zstandard no está instalado")
+        raw = zstandard.ZstdDecompressor().decompress(body)
+    elif codec == _ZLIB:
+        raw = zlib.decompress(body)
+    else:
+        raw = body
+    return _loads(raw), len(raw)
+
+# Último acceso por clave; se vuelca a la columna atime en el mantenimiento
+# (evita una escritura por cada lectura)
+_touched: Dict[Tuple[str, str], int] = {}
+_touched_lock = threading.Lock()
+
+def _touch(pk: Tuple[str, str], now: float) -> None:
+    with _touched_lock:
+        _touched[pk] = int(now)
+
+def pop_touched() -> Dict[Tuple[str, str], int]:
+    global _touched
+    with _touched_lock:
+        out, _touched = _touched, {}
+    return out
 
 def _ensure_dir():
     os.makedirs(os.path.dirname(CACHE_DB), exist_ok=True)
 
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(CACHE_DB, timeout=CACHE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={int(CACHE_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={CACHE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA mmap_size={int(CACHE_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def get_conn() -> sqlite3.Connection:
+    """Conexión persistente del hilo actual (se reabre tras un fork)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        _ensure_dir()
+        conn = _connect()
+        _local.conn, _local.pid = conn, os.getpid()
+        with _conns_lock:
+            _conns.append(conn)
+    return conn
+
+def cache_close() -> None:
+    """Cierra todas las conexiones abiertas por este proceso (shutdown)."""
+    with _conns_lock:
+        for conn in _conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        _conns.clear()
+    _local.conn = None
+
 def cache_init():
-    _ensure_dir()
-    conn = sqlite3.connect(CACHE_DB)
-    cur = conn.cursor()
-    cur.execute('''
+    conn = get_conn()
+    # auto_vacuum solo se puede cambiar antes de crear tablas o seguido de VACUUM (una vez)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        try:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        except Exception:
+            pass
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS cache (
         provider TEXT,
         key TEXT,
         ts INTEGER,
         data TEXT,
+        atime INTEGER,
+        PRIMARY KEY(provider, key)
+    )''')
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+    if "atime" not in cols:
+        conn.execute("ALTER TABLE cache ADD COLUMN atime INTEGER")
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leases (
+        provider TEXT,
+        key TEXT,
+        owner TEXT,
+        expires REAL,
         PRIMARY KEY(provider, key)
     )''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS ratelimit (
+        name TEXT PRIMARY KEY,
+        tat REAL
+    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS cache_ts ON cache(provider, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache(provider, atime)")
     conn.commit()
-    conn.close()
+
+def _fresh(provider: str, ts: int, now: float) -> bool:
+    return (now - ts) <= CACHE_TTLS.get(provider, 7*24*3600)
+
+def _usable(provider: str, ts: int, now: float) -> bool:
+    """Dentro del TTL duro: se puede servir (vencido o no)."""
+    return (now - ts) <= CACHE_HARD_TTLS.get(provider, CACHE_TTLS.get(provider, 7*24*3600))
+
+def cache_stats() -> Dict[str, int]:
+    """Contadores del tier en memoria (hits/misses/evictions, entradas y bytes)."""
+    return _mem.stats()
 
 def cache_get(provider: str, key: str):
+    now = time.time()
+    hit = _mem.get((provider, key), now)
+    if hit is not None and _fresh(provider, hit[0], now):
+        _touch((provider, key), now)
+        return hit[1], True
     try:
-        conn = sqlite3.connect(CACHE_DB)
-        cur = conn.cursor()
-        cur.execute("SELECT ts, data FROM cache WHERE provider=? AND key=?", (provider, key))
+        cur = get_conn().execute("SELECT ts, data FROM cache WHERE provider=? AND key=?", (provider, key))
         row = cur.fetchone()
-        conn.close()
         if not row:
             return None, False
         ts, data = row
-        ttl = CACHE_TTLS.get(provider, 7*24*3600)
-        if (time.time() - ts) > ttl:
+        if not _fresh(provider, ts, now):
             return None, False
-        return json.loads(data), True
+        value, size = decode_payload(data)
+        _mem.put((provider, key), ts, value, size)
+        _touch((provider, key), now)
+        return value, True
     except Exception:
         return None, False
 
 def cache_set(provider: str, key: str, data: dict) -> None:
+    _mem.invalidate((provider, key))
+    try:
+        conn = get_conn()
+        ts = int(time.time())
+        with conn:
+            conn.execute("REPLACE INTO cache (provider, key, ts, data, atime) VALUES (?, ?, ?, ?, ?)",
+                         (provider, key, ts, encode_payload(data), ts))
+    except Exception:
+        pass
+
+def cache_lookup_many(pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[Any, bool]]:
+    """Resuelve muchas claves (provider, key) en una sola consulta. Devuelve {clave: (valor, vencido)}
+    para todo lo que esté dentro del TTL duro; vencido=True si pasó el TTL blando."""
+    out: Dict[Tuple[str, str], Tuple[Any, bool]] = {}
+    now = time.time()
+    pending = []
+    for pk in dict.fromkeys(pairs):
+        hit = _mem.get(pk, now)
+        if hit is not None:
+            out[pk] = (hit[1], not _fresh(pk[0], hit[0], now))
+            _touch(pk, now)
+        else:
+            pending.append(pk)
+    pairs = pending
+    if not pairs:
+        return out
+    try:
+        conn = get_conn()
+        step = _MAX_PARAMS // 2
+        for i in range(0, len(pairs), step):
+            chunk = pairs[i:i + step]
+            values = ",".join(["(?,?)"] * len(chunk))
+            params = [x for pair in chunk for x in pair]
+            cur = conn.execute(
+                f"SELECT provider, key, ts, data FROM cache WHERE (provider, key) IN (VALUES {values})", params)
+            for provider, key, ts, data in cur:
+                if _usable(provider, ts, now):
+                    try:
+                        value, size = decode_payload(data)
+                    except Exception:
+                        continue
+                    out[(provider, key)] = (value, not _fresh(provider, ts, now))
+                    _mem.put((provider, key), ts, value, size)
+                    _touch((provider, key), now)
+    except Exception:
+        pass
+    return out
+
+def cache_ts_many(pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    """Solo el ts de escritura de cada clave presente (sin decodificar payloads)."""
+    pairs = list(dict.fromkeys(pairs))
+    out: Dict[Tuple[str, str], int] = {}
+    try:
+        conn = get_conn()
+        step = _MAX_PARAMS // 2
+        for i in range(0, len(pairs), step):
+            chunk = pairs[i:i + step]
+            values = ",".join(["(?,?)"] * len(chunk))
+            params = [x for pair in chunk for x in pair]
+            for provider, key, ts in conn.execute(
+                    f"SELECT provider, key, ts FROM cache WHERE (provider, key) IN (VALUES {values})", params):
+                out[(provider, key)] = ts
+    except Exception:
+        pass
+    return out
+
+def cache_get_many(pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Any]:
+    """Como cache_lookup_many pero solo con los aciertos vigentes."""
+    return {pk: value for pk, (value, stale) in cache_lookup_many(pairs).items() if not stale}
+
+def cache_set_many(rows: Iterable[Tuple[str, str, Any]]) -> None:
+    """Escribe muchas entradas (provider, key, data) en una única transacción."""
+    ts = int(time.time())
+    params = [(provider, key, ts, encode_payload(data), ts) for provider, key, data in rows]
+    if not params:
+        return
+    for provider, key, _, _, _ in params:
+        _mem.invalidate((provider, key))
+    try:
+        conn = get_conn()
+        with conn:
+            conn.executemany("REPLACE INTO cache (provider, key, ts, data, atime) VALUES (?, ?, ?, ?, ?)", params)
+    except Exception:
+        pass
+
+def lease_acquire(provider: str, key: str, owner: str, ttl: float) -> bool:
+    """Toma el lease de una clave si está libre o vencido. False si lo tiene otro worker."""
+    now = time.time()
     try:
-        conn = sqlite3.connect(CACHE_DB)
-        cur = conn.cursor()
-        cur.execute("REPLACE INTO cache (provider, key, ts, data) VALUES (?, ?, ?, ?)",
-                    (provider, key, int(time.time()), json.dumps(data)))
-        conn.commit()
-        conn.close()
+        conn = get_conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO leases (provider, key, owner, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(provider, key) DO UPDATE SET owner=excluded.owner, expires=excluded.expires "
+                "WHERE leases.expires < ?", (provider, key, owner, now + ttl, now))
+            return cur.rowcount == 1
+    except Exception:
+        # Sin lease no bloqueamos: el llamador consulta por su cuenta
+        return True
+
+def lease_release(provider: str, key: str, owner: str) -> None:
+    try:
+        conn = get_conn()
+        with conn:
+            conn.execute("DELETE FROM leases WHERE provider=? AND key=? AND owner=?", (provider, key, owner))
     except Exception:
         pass
 
+def rate_reserve(name: str, interval: float, burst: int) -> float:
+    """Reserva un turno en el limitador compartido `name` (GCRA: se guarda el instante teórico
+    de la próxima llegada). Devuelve los segundos que hay que esperar antes de usarlo."""
+    now = time.time()
+    try:
+        conn = get_conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tat FROM ratelimit WHERE name=?", (name,)).fetchone()
+            tat = max(row[0] if row else now, now) + interval
+            conn.execute("REPLACE INTO ratelimit (name, tat) VALUES (?, ?)", (name, tat))
+        return max(0.0, tat - now - burst * interval)
+    except Exception:
+        # Sin base no frenamos: los 429 los absorben los reintentos de http_clients
+        return 0.0
+
+def cache_migrate_payloads(batch: int = 1000) -> Dict[str, int]:
+    """Migración única: recodifica las filas TEXT legacy al formato BLOB actual."""
+    conn = get_conn()
+    migrated = failed = before = after = 0
+    last = 0
+    while True:
+        rows = conn.execute("SELECT rowid, data FROM cache WHERE rowid > ? AND typeof(data)='text' "
+                            "ORDER BY rowid LIMIT ?", (last, batch)).fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        updates = []
+        for rowid, data in rows:
+            try:
+                blob = encode_payload(json.loads(data))
+            except Exception:
+                failed += 1
+                continue
+            before += len(data)
+            after += len(blob)
+            updates.append((blob, rowid))
+        with conn:
+            conn.executemany("UPDATE cache SET data=? WHERE rowid=?", updates)
+        migrated += len(updates)
+    # Devolvemos al sistema las páginas liberadas por la recodificación (sin desalojar nada)
+    freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # executescript avanza el pragma hasta el final; execute solo libera una página
+    conn.executescript("PRAGMA incremental_vacuum;")
+    return {"migrated": migrated, "failed": failed, "bytes_before": before, "bytes_after": after,
+            "pages_freed": freed - conn.execute("PRAGMA freelist_count").fetchone()[0]}
+
 # Init on import
 cache_init()
@@ -0,0 +1,86 @@
+import asyncio, time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from .config import HEALTH_INTERVAL, HEALTH_TIMEOUT, HEALTH_HISTORY
+from . import resilience
+
+# Monitor de salud en segundo plano: sondea a los proveedores cada HEALTH_INTERVAL y guarda
+# historial de latencia/disponibilidad. /health lee el snapshot sin salir a la red.
+
+# ping(timeout) -> True/False, o None si el proveedor no está configurado
+Ping = Callable[[float], Awaitable[Optional[bool]]]
+
+_pings: Dict[str, Ping] = {}
+_history: Dict[str, Deque[Tuple[float, bool, float]]] = {}
+_snapshot: Dict[str, Dict[str, Any]] = {}
+_task: Optional[asyncio.Task] = None
+
+def register(provider: str, ping: Ping) -> None:
+    _pings[provider] = ping
+    _history.setdefault(provider, deque(maxlen=HEALTH_HISTORY))
+
+async def _probe(provider: str, ping: Ping) -> None:
+    t0 = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(ping(HEALTH_TIMEOUT), HEALTH_TIMEOUT + 1)
+    except Exception:
+        result = False
+    ok = bool(result)
+    latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+    hist = _history[provider]
+    hist.append((time.time(), ok, latency_ms))
+    # El monitor también alimenta al circuit breaker del proveedor
+    if result is not None:
+        b = resilience.breaker(provider)
+        if ok:
+            if b.state != resilience.CLOSED:
+                b.record_success()
+        else:
+            b.record_failure()
+    oks = [s[1] for s in hist]
+    lat = [s[2] for s in hist if s[1]]
+    # Se reemplaza el dict completo: los lectores nunca ven un estado a medio escribir
+    _snapshot[provider] = {
+        "ok": ok,
+        "checked_at": hist[-1][0],
+        "latency_ms": latency_ms,
+        "availability": round(sum(oks) / len(oks), 3),
+        "avg_latency_ms": round(sum(lat) / len(lat), 1) if lat else None,
+        "samples": len(hist),
+    }
+
+async def probe_all() -> None:
+    await asyncio.gather(*(_probe(p, ping) for p, ping in _pings.items()))
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    breakers = resilience.breakers_snapshot()
+    out = {}
+    for provider in _pings:
+        s = dict(_snapshot.get(provider) or {"ok": False, "checked_at": None, "samples": 0})
+        s["breaker"] = breakers.get(provider, {"state": resilience.CLOSED, "failures": 0})["state"]
+        out[provider] = s
+    return out
+
+def history(provider: str) -> list:
+    return [{"ts": ts, "ok": ok, "latency_ms": ms} for ts, ok, ms in _history.get(provider, ())]
+
+async def _loop() -> None:
+    while True:
+        try:
+            await probe_all()
+        except Exception:
+            pass
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+def start() -> None:
+    global _task
+    if _task is None and HEALTH_INTERVAL > 0:
+        _task = asyncio.get_running_loop().create_task(_loop())
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,129 @@
+import asyncio, random, time
+from typing import Any, Dict, Optional
+import httpx
+
+from .config import (
+    HTTP_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX,
+    HTTP_HTTP2, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+)
+
+# Registro de clientes HTTP de larga vida: un pool keep-alive por proveedor,
+# creado en el startup de la app y cerrado en el shutdown.
+PROVIDERS = ("CIVIC", "CLINVAR", "ONCOKB", "VEP")
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_sync_clients: Dict[str, httpx.Client] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+# Limitadores de tasa por proveedor (ver ratelimit.TokenBucket); cada intento consume un turno
+_limiters: Dict[str, Any] = {}
+
+def set_limiter(provider: str, limiter: Any) -> None:
+    _limiters[provider] = limiter
+
+def _http2() -> bool:
+    if not HTTP_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+def get_async_client(provider: str) -> httpx.AsyncClient:
+    """Cliente async compartido del proveedor. Se crea perezosamente si no hubo startup
+    (p.ej. desde la CLI) y se rehace si cambió el event loop."""
+    global _loop
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        # Los clientes de otro loop no se pueden reutilizar; se descartan sin cerrar
+        _async_clients.clear()
+        _loop = loop
+    c = _async_clients.get(provider)
+    if c is None or c.is_closed:
+        c = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=_limits(), http2=_http2())
+        _async_clients[provider] = c
+    return c
+
+def get_client(provider: str) -> httpx.Client:
+    """Cliente síncrono compartido del proveedor (pings y rutas legacy)."""
+    c = _sync_clients.get(provider)
+    if c is None or c.is_closed:
+        c = httpx.Client(timeout=HTTP_TIMEOUT, limits=_limits(), http2=_http2())
+        _sync_clients[provider] = c
+    return c
+
+def _backoff(attempt: int, r: Optional[httpx.Response] = None) -> float:
+    """Backoff exponencial con jitter completo; respeta Retry-After si viene numérico."""
+    if r is not None:
+        ra = r.headers.get("Retry-After")
+        if ra and ra.isdigit():
+            return min(float(ra), HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+async def arequest(provider: str, method: str, url: str, retries: Optional[int] = None, **kwargs: Any) -> httpx.Response:
+    """Request async con reintentos ante 429/5xx y errores de transporte (HTTP_RETRIES)."""
+    retries = HTTP_RETRIES if retries is None else retries
+    client = get_async_client(provider)
+    limiter = _limiters.get(provider)
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            r = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        if r.status_code not in RETRY_STATUS or attempt >= retries:
+            return r
+        await asyncio.sleep(_backoff(attempt, r))
+    return r
+
+def request(provider: str, method: str, url: str, retries: Optional[int] = None, **kwargs: Any) -> httpx.Response:
+    """Versión síncrona de arequest."""
+    retries = HTTP_RETRIES if retries is None else retries
+    client = get_client(provider)
+    limiter = _limiters.get(provider)
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire_sync()
+        try:
+            r = client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+        if r.status_code not in RETRY_STATUS or attempt >= retries:
+            return r
+        time.sleep(_backoff(attempt, r))
+    return r
+
+async def startup() -> None:
+    for p in PROVIDERS:
+        get_async_client(p)
+
+async def shutdown() -> None:
+    global _loop
+    for c in list(_async_clients.values()):
+        try:
+            await c.aclose()
+        except Exception:
+            pass
+    _async_clients.clear()
+    _loop = None
+    for c in list(_sync_clients.values()):
+        try:
+            c.close()
+        except Exception:
+            pass
+    _sync_clients.clear()
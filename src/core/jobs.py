@@ -0,0 +1,202 @@
+import json, os, sqlite3, threading, time, uuid
+from typing import Any, Dict, List, Optional
+
+from .config import JOBS_DB, JOBS_DIR, CACHE_BUSY_TIMEOUT_MS, JOBS_MAX_ATTEMPTS
+
+# Cola de trabajos persistente en SQLite: la app encola y consulta, los workers (procesos
+# aparte, ver src/worker.py) reclaman por prioridad, informan avance con latidos y dejan el
+# resultado en un archivo de JOBS_DIR. Como todo el estado está en la base, un reinicio de la
+# app o de un worker no pierde trabajos: los que quedaron "running" sin latido vuelven a la cola.
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINAL = (DONE, FAILED, CANCELLED)
+
+class Cancelled(Exception):
+    """Se pidió cancelar el trabajo en curso."""
+
+_local = threading.local()
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(JOBS_DB), exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=CACHE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           isolation_level=None)
+    conn.execute(f"PRAGMA busy_timeout={int(CACHE_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def get_conn() -> sqlite3.Connection:
+    """Conexión del hilo actual (se reabre tras un fork); crea las tablas la primera vez."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = _connect()
+        init(conn)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def init(conn: sqlite3.Connection) -> None:
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        params TEXT,
+        input_path TEXT,
+        result_path TEXT,
+        progress TEXT,
+        error TEXT,
+        cancel INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        created REAL, started REAL, heartbeat REAL, finished REAL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_queue ON jobs(status, priority DESC, created);
+    ''')
+    os.makedirs(JOBS_DIR, exist_ok=True)
+
+def path_for(job_id: str, suffix: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.{suffix}")
+
+def _row(r: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if r is None:
+        return None
+    job = dict(r)
+    job["params"] = json.loads(job["params"]) if job["params"] else {}
+    job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+    job["cancel"] = bool(job["cancel"])
+    return job
+
+def new_id() -> str:
+    return uuid.uuid4().hex
+
+def submit(kind: str, params: Dict[str, Any], priority: int = 0,
+           input_path: Optional[str] = None, job_id: Optional[str] = None) -> str:
+    """Encola un trabajo; mayor prioridad sale antes y, a igual prioridad, el más viejo."""
+    job_id = job_id or new_id()
+    get_conn().execute(
+        "INSERT INTO jobs (id, kind, status, priority, params, input_path, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (job_id, kind, QUEUED, int(priority), json.dumps(params, ensure_ascii=False), input_path, time.time()))
+    return job_id
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    return _row(get_conn().execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone())
+
+def list_jobs(status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    sql, args = "SELECT * FROM jobs", []
+    if status:
+        sql, args = sql + " WHERE status=?", [status]
+    rows = get_conn().execute(sql + " ORDER BY created DESC LIMIT ?", (*args, limit))
+    return [_row(r) for r in rows]  # type: ignore[misc]
+
+def counts() -> Dict[str, int]:
+    return {s: n for s, n in get_conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+
+def claim(worker: str) -> Optional[Dict[str, Any]]:
+    """Toma el próximo trabajo de la cola (transacción inmediata: un solo worker lo gana)."""
+    conn = get_conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        r = conn.execute(f"SELECT id FROM jobs WHERE status='{QUEUED}' "
+                         "ORDER BY priority DESC, created ASC LIMIT 1").fetchone()
+        if r is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute("UPDATE jobs SET status=?, worker=?, started=?, heartbeat=?, attempts=attempts+1 WHERE id=?",
+                      (RUNNING, worker, now, now, r["id"]))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return get(r["id"])
+
+def heartbeat(job_id: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+    """Renueva el latido (y el avance, si se pasa). Devuelve True si se pidió cancelar."""
+    conn = get_conn()
+    if progress is None:
+        conn.execute("UPDATE jobs SET heartbeat=? WHERE id=? AND status=?", (time.time(), job_id, RUNNING))
+    else:
+        conn.execute("UPDATE jobs SET heartbeat=?, progress=? WHERE id=? AND status=?",
+                     (time.time(), json.dumps(progress, ensure_ascii=False), job_id, RUNNING))
+    r = conn.execute("SELECT cancel, status FROM jobs WHERE id=?", (job_id,)).fetchone()
+    return r is None or bool(r["cancel"]) or r["status"] != RUNNING
+
+def finish(job_id: str, result_path: Optional[str], progress: Optional[Dict[str, Any]] = None) -> None:
+    get_conn().execute(
+        "UPDATE jobs SET status=?, result_path=?, progress=COALESCE(?, progress), finished=? WHERE id=? AND status=?",
+        (DONE, result_path, json.dumps(progress, ensure_ascii=False) if progress is not None else None,
+         time.time(), job_id, RUNNING))
+
+def fail(job_id: str, error: str) -> None:
+    get_conn().execute("UPDATE jobs SET status=?, error=?, finished=? WHERE id=? AND status=?",
+                       (FAILED, error[:2000], time.time(), job_id, RUNNING))
+
+def mark_cancelled(job_id: str) -> None:
+    get_conn().execute("UPDATE jobs SET status=?, finished=? WHERE id=? AND status=?",
+                       (CANCELLED, time.time(), job_id, RUNNING))
+
+def requeue(job_id: str) -> None:
+    """Devuelve a la cola un trabajo interrumpido por el apagado del worker (no cuenta como intento)."""
+    get_conn().execute(
+        "UPDATE jobs SET status=?, worker=NULL, attempts=MAX(attempts-1, 0) WHERE id=? AND status=?",
+        (QUEUED, job_id, RUNNING))
+
+def cancel(job_id: str) -> Optional[Dict[str, Any]]:
+    """Cancela: un trabajo en cola pasa directo a cancelled; uno en curso queda marcado y el
+    worker lo corta en el próximo latido."""
+    conn = get_conn()
+    now = time.time()
+    conn.execute("UPDATE jobs SET status=?, cancel=1, finished=? WHERE id=? AND status=?",
+                 (CANCELLED, now, job_id, QUEUED))
+    conn.execute("UPDATE jobs SET cancel=1 WHERE id=? AND status=?", (job_id, RUNNING))
+    return get(job_id)
+
+def recover_stale(stale_after: float, max_attempts: int = JOBS_MAX_ATTEMPTS) -> int:
+    """Trabajos 'running' sin latido (worker muerto o app reiniciada): vuelven a la cola, o
+    fallan si ya agotaron los intentos. Devuelve cuántos se recuperaron."""
+    conn = get_conn()
+    limit = time.time() - stale_after
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cancelled = conn.execute(
+            "UPDATE jobs SET status=?, finished=? WHERE status=? AND heartbeat < ? AND cancel=1",
+            (CANCELLED, time.time(), RUNNING, limit)).rowcount
+        failed = conn.execute(
+            "UPDATE jobs SET status=?, error='worker perdido: intentos agotados', finished=? "
+            "WHERE status=? AND heartbeat < ? AND attempts >= ?",
+            (FAILED, time.time(), RUNNING, limit, max_attempts)).rowcount
+        requeued = conn.execute(
+            "UPDATE jobs SET status=?, worker=NULL WHERE status=? AND heartbeat < ?",
+            (QUEUED, RUNNING, limit)).rowcount
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return cancelled + failed + requeued
+
+def purge(retention: float) -> int:
+    """Borra los trabajos terminados hace más de `retention` segundos y sus archivos."""
+    conn = get_conn()
+    limit = time.time() - retention
+    rows = conn.execute(
+        f"SELECT id, input_path, result_path FROM jobs WHERE status IN {FINAL} AND finished < ?", (limit,)).fetchall()
+    for r in rows:
+        for path in (r["input_path"], r["result_path"]):
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    conn.executemany("DELETE FROM jobs WHERE id=?", [(r["id"],) for r in rows])
+    return len(rows)
+
+def public(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Vista del trabajo para la API (sin rutas internas)."""
+    return {
+        "id": job["id"], "kind": job["kind"], "status": job["status"], "priority": job["priority"],
+        "progress": job["progress"], "error": job["error"], "attempts": job["attempts"],
+        "cancel_requested": job["cancel"], "created": job["created"], "started": job["started"],
+        "finished": job["finished"], "has_result": job["status"] == DONE and bool(job["result_path"]),
+    }
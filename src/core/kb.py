@@ -0,0 +1,135 @@
+import os, sqlite3, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import KB_DB, PROVIDER_MODE
+
+# Base de conocimiento local: tablas indexadas con los dumps de CIViC (TSV nocturno) y ClinVar
+# (variant_summary / VCF). Vive en un SQLite aparte del cache: se reemplaza por release y no
+# tiene TTL. Los servicios la consultan antes que la red según PROVIDER_MODE.
+
+NETWORK, LOCAL_FIRST, LOCAL = "network", "local-first", "local"
+
+_local = threading.local()
+_sources: Dict[str, Tuple[float, bool]] = {}
+_SOURCES_TTL = 30.0
+
+def mode() -> str:
+    return PROVIDER_MODE if PROVIDER_MODE in (NETWORK, LOCAL_FIRST, LOCAL) else NETWORK
+
+def network_allowed(hit: bool) -> bool:
+    """¿Hay que salir a la red? local-first solo si la base local no tenía la variante."""
+    m = mode()
+    return m == NETWORK or (m == LOCAL_FIRST and not hit)
+
+def connect(path: str = KB_DB) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def get_conn() -> Optional[sqlite3.Connection]:
+    """Conexión del hilo actual; None si todavía no se importó nada."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        if not os.path.exists(KB_DB):
+            return None
+        conn = connect()
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def init(conn: sqlite3.Connection) -> None:
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS civic_evidence (
+        evidence_id INTEGER PRIMARY KEY,
+        gene TEXT, variant TEXT, disease TEXT, therapies TEXT,
+        evidence_type TEXT, evidence_level TEXT, significance TEXT,
+        statement TEXT, citation TEXT, url TEXT, rating INTEGER,
+        release INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS civic_gene_variant ON civic_evidence(gene, variant);
+    CREATE TABLE IF NOT EXISTS clinvar_variant (
+        variation_id INTEGER PRIMARY KEY,
+        gene TEXT, protein_change TEXT, name TEXT,
+        clinical_significance TEXT, review_status TEXT, last_evaluated TEXT,
+        chrom TEXT, pos INTEGER, ref TEXT, alt TEXT,
+        release INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS clinvar_gene_pc ON clinvar_variant(gene, protein_change);
+    CREATE INDEX IF NOT EXISTS clinvar_coords ON clinvar_variant(chrom, pos, ref, alt);
+    CREATE TABLE IF NOT EXISTS kb_imports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source TEXT, file TEXT, size INTEGER, mtime INTEGER,
+        rows INTEGER, removed INTEGER, started REAL, finished REAL, format TEXT
+    );
+    ''')
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(kb_imports)")}
+    if "format" not in cols:
+        # Bases anteriores: el formato se deduce igual que kb_import.detect_format
+        with conn:
+            conn.execute("ALTER TABLE kb_imports ADD COLUMN format TEXT")
+            conn.execute("UPDATE kb_imports SET format = CASE WHEN source='CIVIC' THEN 'civic-tsv' "
+                         "WHEN lower(file) LIKE '%.vcf%' THEN 'clinvar-vcf' ELSE 'clinvar-summary' END")
+
+def has_source(source: str) -> bool:
+    """True si hay al menos un import terminado de la fuente (se recuerda unos segundos)."""
+    now = time.monotonic()
+    hit = _sources.get(source)
+    if hit and now - hit[0] < _SOURCES_TTL:
+        return hit[1]
+    conn = get_conn()
+    ok = False
+    if conn is not None:
+        try:
+            ok = conn.execute("SELECT 1 FROM kb_imports WHERE source=? AND finished IS NOT NULL LIMIT 1",
+                              (source,)).fetchone() is not None
+        except sqlite3.Error:
+            ok = False
+    _sources[source] = (now, ok)
+    return ok
+
+def civic_items(gene: str, variant: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """Evidencia de CIViC en el mismo esquema reducido que civic_service._reduce."""
+    conn = get_conn()
+    if conn is None:
+        return []
+    rows = conn.execute(
+        "SELECT evidence_level, evidence_type, therapies, disease, citation, url, statement, significance "
+        "FROM civic_evidence WHERE gene=? AND variant=? "
+        "ORDER BY evidence_level ASC, rating DESC, evidence_id ASC LIMIT ?", (gene, variant, limit))
+    return [{
+        "evidenceLevel": level, "evidenceType": etype,
+        "drugNames": [d for d in (therapies or "").split(",") if d],
+        "disease": disease, "year": None, "journal": citation, "url": url,
+        "desc": statement, "significance": significance,
+    } for level, etype, therapies, disease, citation, url, statement, significance in rows]
+
+def clinvar_docs(gene: str, protein_change: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """Variantes de ClinVar con la forma de los documentos de esummary que usa la app."""
+    conn = get_conn()
+    if conn is None:
+        return []
+    rows = conn.execute(
+        "SELECT variation_id, gene, protein_change, name, clinical_significance, review_status, last_evaluated "
+        "FROM clinvar_variant WHERE gene=? AND protein_change=? ORDER BY variation_id LIMIT ?",
+        (gene, protein_change, limit))
+    return [{
+        "uid": str(vid), "title": name, "genes": [{"symbol": g}], "protein_change": pc,
+        "germline_classification": {"description": sig, "review_status": review, "last_evaluated": last},
+        "source": "local",
+    } for vid, g, pc, name, sig, review, last in rows]
+
+def stats() -> Dict[str, Any]:
+    conn = get_conn()
+    if conn is None:
+        return {"path": KB_DB, "mode": mode(), "imports": []}
+    init(conn)
+    imports = [dict(zip(("source", "file", "rows", "removed", "finished"), r)) for r in conn.execute(
+        "SELECT source, file, rows, removed, finished FROM kb_imports ORDER BY id DESC LIMIT 10")]
+    return {
+        "path": KB_DB, "mode": mode(),
+        "civic_rows": conn.execute("SELECT COUNT(*) FROM civic_evidence").fetchone()[0],
+        "clinvar_rows": conn.execute("SELECT COUNT(*) FROM clinvar_variant").fetchone()[0],
+        "imports": imports,
+    }
@@ -0,0 +1,112 @@
+import asyncio, time
+from typing import Any, Dict, List, Optional
+
+from .config import (
+    CACHE_TTLS, CACHE_HARD_TTLS, CACHE_MAINT_INTERVAL, CACHE_MAX_BYTES, CACHE_PROVIDER_QUOTAS, CACHE_VACUUM_PAGES,
+)
+from .database import get_conn, pop_touched, cache_stats
+
+# TTL por defecto para proveedores no listados en CACHE_TTLS (igual que cache_get)
+DEFAULT_TTL = 7*24*3600
+_ROW_BYTES = "length(data) + length(key)"
+
+_task: Optional[asyncio.Task] = None
+
+def cache_usage() -> Dict[str, Any]:
+    """Filas y bytes por proveedor, más el tamaño del archivo y el tier en memoria."""
+    conn = get_conn()
+    providers = {}
+    for provider, rows, nbytes, oldest in conn.execute(
+            f"SELECT provider, COUNT(*), COALESCE(SUM({_ROW_BYTES}), 0), MIN(ts) FROM cache GROUP BY provider"):
+        providers[provider] = {"rows": rows, "bytes": nbytes, "oldest_ts": oldest,
+                               "quota": CACHE_PROVIDER_QUOTAS.get(provider)}
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "providers": providers,
+        "total_bytes": sum(p["bytes"] for p in providers.values()),
+        "max_bytes": CACHE_MAX_BYTES,
+        "file_bytes": page_size * pages,
+        "free_bytes": page_size * free,
+        "memory": cache_stats(),
+    }
+
+def _flush_atimes(conn) -> int:
+    touched = pop_touched()
+    if touched:
+        with conn:
+            conn.executemany("UPDATE cache SET atime=? WHERE provider=? AND key=?",
+                             [(ts, p, k) for (p, k), ts in touched.items()])
+    return len(touched)
+
+def _delete_expired(conn, now: float) -> int:
+    # Se borra recién pasado el TTL duro: hasta entonces el valor se sirve como stale
+    deleted = 0
+    with conn:
+        for provider, ttl in CACHE_HARD_TTLS.items():
+            deleted += conn.execute("DELETE FROM cache WHERE provider=? AND ts < ?",
+                                    (provider, int(now - ttl))).rowcount
+        marks = ",".join("?" * len(CACHE_TTLS))
+        deleted += conn.execute(f"DELETE FROM cache WHERE provider NOT IN ({marks}) AND ts < ?",
+                                (*CACHE_TTLS.keys(), int(now - DEFAULT_TTL))).rowcount
+    return deleted
+
+def _evict_lru(conn, excess: int, provider: Optional[str] = None) -> int:
+    """Borra las filas menos usadas hasta liberar `excess` bytes."""
+    if excess <= 0:
+        return 0
+    where, params = ("WHERE provider=?", (provider,)) if provider else ("", ())
+    rowids: List[int] = []
+    freed = 0
+    for rowid, size in conn.execute(
+            f"SELECT rowid, {_ROW_BYTES} FROM cache {where} ORDER BY COALESCE(atime, ts) ASC", params):
+        rowids.append(rowid)
+        freed += size
+        if freed >= excess:
+            break
+    with conn:
+        for i in range(0, len(rowids), 500):
+            chunk = rowids[i:i + 500]
+            conn.execute(f"DELETE FROM cache WHERE rowid IN ({','.join('?' * len(chunk))})", chunk)
+    return len(rowids)
+
+def run_maintenance(now: Optional[float] = None) -> Dict[str, Any]:
+    """Una pasada completa: atime, vencidos, cuotas por proveedor, tope global y vacuum."""
+    now = now or time.time()
+    conn = get_conn()
+    report: Dict[str, Any] = {"touched": _flush_atimes(conn), "expired": _delete_expired(conn, now), "evicted": {}}
+    usage = dict(conn.execute(f"SELECT provider, COALESCE(SUM({_ROW_BYTES}), 0) FROM cache GROUP BY provider"))
+    for provider, quota in CACHE_PROVIDER_QUOTAS.items():
+        n = _evict_lru(conn, usage.get(provider, 0) - quota, provider)
+        if n:
+            report["evicted"][provider] = n
+    total = conn.execute(f"SELECT COALESCE(SUM({_ROW_BYTES}), 0) FROM cache").fetchone()[0]
+    n = _evict_lru(conn, total - CACHE_MAX_BYTES)
+    if n:
+        report["evicted"]["*"] = n
+    # executescript avanza el pragma hasta el final; execute solo libera una página
+    conn.executescript(f"PRAGMA incremental_vacuum({int(CACHE_VACUUM_PAGES)});")
+    report["elapsed_s"] = round(time.time() - now, 3)
+    return report
+
+async def _loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except Exception:
+            # Un fallo puntual (p.ej. base bloqueada) no debe matar la tarea
+            pass
+
+def start() -> None:
+    global _task
+    if CACHE_MAINT_INTERVAL > 0 and _task is None:
+        _task = asyncio.get_running_loop().create_task(_loop(CACHE_MAINT_INTERVAL))
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,41 @@
+import asyncio, threading, time
+from typing import Optional
+
+from .config import RATE_LIMIT_SHARED
+from .database import rate_reserve
+
+# Token bucket por API externa. Con RATE_LIMIT_SHARED=1 el estado vive en SQLite y lo
+# comparten todos los workers de uvicorn (y la CLI); si no, es local al proceso.
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: int = 1, shared: Optional[bool] = None):
+        self.name = name
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.burst = max(1, burst)
+        self.shared = RATE_LIMIT_SHARED if shared is None else shared
+        self._tat = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve_local(self) -> float:
+        with self._lock:
+            now = time.time()
+            self._tat = max(self._tat, now) + self.interval
+            return max(0.0, self._tat - now - self.burst * self.interval)
+
+    def reserve(self) -> float:
+        """Reserva un turno y devuelve cuánto esperar para usarlo."""
+        if not self.interval:
+            return 0.0
+        if self.shared:
+            return rate_reserve(self.name, self.interval, self.burst)
+        return self._reserve_local()
+
+    async def acquire(self) -> None:
+        wait = await asyncio.to_thread(self.reserve) if self.shared else self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,142 @@
+import threading, time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from .config import CB_FAILURE_THRESHOLD, CB_RESET_TIMEOUT, CACHE_NEGATIVE_TTL
+
+# Distingue "el proveedor falló" de "el proveedor respondió vacío":
+# - los fetchers levantan UpstreamError ante errores de red / HTTP != 200;
+# - los fallos se recuerdan poco tiempo (CACHE_NEGATIVE_TTL) en memoria, nunca en el cache;
+# - un circuit breaker por proveedor corta tras fallos consecutivos y prueba en half-open.
+
+class UpstreamError(Exception):
+    """El proveedor no respondió correctamente (no significa 'sin resultados')."""
+
+class CircuitOpenError(UpstreamError):
+    """Se saltea el proveedor porque su circuito está abierto."""
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: int = CB_FAILURE_THRESHOLD, reset_timeout: float = CB_RESET_TIMEOUT):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = CLOSED
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """True si se puede llamar al proveedor. En half-open deja pasar una sola prueba."""
+        state = self.state
+        with self._lock:
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._state = CLOSED
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.threshold:
+                self._state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """La prueba se canceló sin resultado: se permite otra."""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_negative: Dict[Tuple[str, str], float] = {}
+_lock = threading.Lock()
+
+def breaker(provider: str) -> CircuitBreaker:
+    with _lock:
+        b = _breakers.get(provider)
+        if b is None:
+            b = _breakers[provider] = CircuitBreaker(provider)
+        return b
+
+def breakers_snapshot() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        items = list(_breakers.items())
+    return {name: b.snapshot() for name, b in items}
+
+def _negative_hit(pk: Tuple[str, str]) -> bool:
+    with _lock:
+        exp = _negative.get(pk)
+        if exp is None:
+            return False
+        if exp < time.monotonic():
+            del _negative[pk]
+            return False
+        return True
+
+def _negative_set(pk: Tuple[str, str]) -> None:
+    with _lock:
+        _negative[pk] = time.monotonic() + CACHE_NEGATIVE_TTL
+        # Acotamos el tamaño: limpiamos vencidos cuando crece
+        if len(_negative) > 10000:
+            now = time.monotonic()
+            for k in [k for k, exp in _negative.items() if exp < now]:
+                del _negative[k]
+
+def _before(provider: str, key: str) -> CircuitBreaker:
+    if _negative_hit((provider, key)):
+        raise UpstreamError(f"{provider}: fallo reciente para {key}")
+    b = breaker(provider)
+    if not b.allow():
+        raise CircuitOpenError(f"{provider}: circuito abierto")
+    return b
+
+def _failed(b: CircuitBreaker, provider: str, key: str, exc: Exception) -> UpstreamError:
+    b.record_failure()
+    _negative_set((provider, key))
+    return exc if isinstance(exc, UpstreamError) else UpstreamError(f"{provider}: {exc!r}")
+
+async def call(provider: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """Ejecuta fetch() protegido por el breaker y el cache negativo del proveedor."""
+    b = _before(provider, key)
+    try:
+        out = await fetch()
+    except Exception as exc:
+        raise _failed(b, provider, key, exc)
+    except BaseException:
+        b.release_probe()
+        raise
+    b.record_success()
+    return out
+
+def call_sync(provider: str, key: str, fetch: Callable[[], Any]) -> Any:
+    """Versión síncrona de call (rutas legacy)."""
+    b = _before(provider, key)
+    try:
+        out = fetch()
+    except Exception as exc:
+        raise _failed(b, provider, key, exc)
+    except BaseException:
+        b.release_probe()
+        raise
+    b.record_success()
+    return out
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+from .config import CACHE_REFRESH_QUEUE, CACHE_REFRESH_WORKERS
+from .database import cache_set
+from . import singleflight, resilience
+
+# Cola acotada y deduplicada de refrescos en segundo plano para entradas servidas como
+# stale (entre el TTL blando y el duro). Si la cola está llena el refresco se descarta:
+# el valor se volverá a pedir en la próxima lectura vencida.
+
+Fetch = Callable[[], Awaitable[Any]]
+
+_queue: Optional["asyncio.Queue[Tuple[Tuple[str, str], Fetch]]"] = None
+_queued: Set[Tuple[str, str]] = set()
+_workers: List[asyncio.Task] = []
+
+def schedule(provider: str, key: str, fetch: Fetch) -> bool:
+    """Encola el refresco de una clave. False si ya estaba encolada, la cola está llena
+    o no hay workers (p.ej. fuera de la app)."""
+    pk = (provider, key)
+    if _queue is None or pk in _queued:
+        return False
+    try:
+        _queue.put_nowait((pk, fetch))
+    except asyncio.QueueFull:
+        return False
+    _queued.add(pk)
+    return True
+
+async def _worker() -> None:
+    while True:
+        pk, fetch = await _queue.get()
+        try:
+            out, written = await singleflight.do(pk[0], pk[1], lambda: resilience.call(pk[0], pk[1], fetch))
+            if not written:
+                await asyncio.to_thread(cache_set, pk[0], pk[1], out)
+        except Exception:
+            # Si falla el refresco se sigue sirviendo el valor vencido hasta el TTL duro
+            pass
+        finally:
+            _queued.discard(pk)
+            _queue.task_done()
+
+def pending() -> int:
+    return len(_queued)
+
+def start() -> None:
+    global _queue
+    if _queue is not None or CACHE_REFRESH_WORKERS <= 0:
+        return
+    _queue = asyncio.Queue(maxsize=CACHE_REFRESH_QUEUE)
+    loop = asyncio.get_running_loop()
+    for _ in range(CACHE_REFRESH_WORKERS):
+        _workers.append(loop.create_task(_worker()))
+
+async def stop() -> None:
+    global _queue
+    for t in _workers:
+        t.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queued.clear()
+    _queue = None
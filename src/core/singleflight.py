@@ -0,0 +1,105 @@
+import asyncio, os, time, uuid
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+from .config import CACHE_LEASES, CACHE_LEASE_TTL, CACHE_LEASE_POLL
+from .database import cache_get, cache_set, cache_set_many, lease_acquire, lease_release
+from .resilience import UpstreamError
+
+# Coalescencia de consultas idénticas en vuelo: los llamadores concurrentes que piden la
+# misma clave de proveedor esperan una única llamada upstream. Con CACHE_LEASES=1 un lease
+# en SQLite extiende el efecto a los demás workers de uvicorn.
+
+_inflight: Dict[Tuple[str, str], "asyncio.Task"] = {}
+_OWNER = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+async def _wait_other_worker(provider: str, key: str) -> Tuple[Any, bool]:
+    """Otro worker tiene el lease: esperamos a que escriba el cache o venza el lease."""
+    deadline = time.monotonic() + CACHE_LEASE_TTL
+    while time.monotonic() < deadline:
+        await asyncio.sleep(CACHE_LEASE_POLL)
+        data, ok = await asyncio.to_thread(cache_get, provider, key)
+        if ok:
+            return data, True
+    return None, False
+
+async def _flight(provider: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    if not CACHE_LEASES:
+        # La tarea compartida escribe el cache: si el líder se cancela (deadline) la consulta
+        # igual termina y alguien tiene que guardarla
+        out = await fetch()
+        await asyncio.to_thread(cache_set, provider, key, out)
+        return out, True
+    if not await asyncio.to_thread(lease_acquire, provider, key, _OWNER, CACHE_LEASE_TTL):
+        data, ok = await _wait_other_worker(provider, key)
+        if ok:
+            return data, True
+    try:
+        out = await fetch()
+        # Con lease escribimos enseguida para liberar a los otros workers
+        await asyncio.to_thread(cache_set, provider, key, out)
+        return out, True
+    finally:
+        await asyncio.to_thread(lease_release, provider, key, _OWNER)
+
+async def do(provider: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """Ejecuta fetch() una sola vez por clave en vuelo. Devuelve (resultado, escrito), donde
+    escrito=True indica que el cache ya lo escribió la consulta compartida (o el worker con
+    el lease) y el llamador no debe volver a escribirlo."""
+    pk = (provider, key)
+    task = _inflight.get(pk)
+    if task is not None and not task.done():
+        data, _ = await asyncio.shield(task)
+        return data, True
+    # La consulta corre como tarea propia: si el líder se cancela (deadline) los demás siguen
+    task = asyncio.ensure_future(_flight(provider, key, fetch))
+    _inflight[pk] = task
+    task.add_done_callback(lambda t: _inflight.pop(pk, None) if _inflight.get(pk) is t else None)
+    return await asyncio.shield(task)
+
+async def _batch(provider: str, keys: List[str], fetch_many: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    # Igual que _flight: el lote escribe su propio resultado, en una transacción
+    res = await fetch_many(keys)
+    if res:
+        await asyncio.to_thread(cache_set_many, [(provider, k, v) for k, v in res.items()])
+    return res
+
+async def _pick(batch: "asyncio.Future", provider: str, key: str) -> Tuple[Any, bool]:
+    res = await asyncio.shield(batch)
+    if key not in res:
+        raise UpstreamError(f"{provider}: sin resultado para {key} en el lote")
+    return res[key], True
+
+async def do_many(
+    provider: str, keys: List[str], fetch_many: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+) -> Tuple[Dict[str, Any], Set[str]]:
+    """Versión por lotes de do: las claves que ya están en vuelo se esperan y el resto sale en
+    una sola llamada fetch_many(claves) -> {clave: resultado}, que queda registrada clave por
+    clave para los llamadores siguientes. Devuelve (resultados, escritas): las claves que
+    fallaron quedan ausentes y las escritas ya están en el cache (ver do). Sin leases."""
+    tasks: Dict[str, "asyncio.Task"] = {}
+    mine: List[str] = []
+    for key in dict.fromkeys(keys):
+        task = _inflight.get((provider, key))
+        if task is not None and not task.done():
+            tasks[key] = task
+        else:
+            mine.append(key)
+    if mine:
+        batch = asyncio.ensure_future(_batch(provider, mine, fetch_many))
+        for key in mine:
+            pk = (provider, key)
+            task = tasks[key] = asyncio.ensure_future(_pick(batch, provider, key))
+            _inflight[pk] = task
+            task.add_done_callback(lambda t, pk=pk: _inflight.pop(pk, None) if _inflight.get(pk) is t else None)
+    results: Dict[str, Any] = {}
+    written: Set[str] = set()
+    outs = await asyncio.gather(*(asyncio.shield(t) for t in tasks.values()), return_exceptions=True)
+    for key, out in zip(tasks, outs):
+        if isinstance(out, BaseException):
+            if not isinstance(out, Exception):
+                raise out
+            continue
+        results[key] = out[0]
+        if out[1]:
+            written.add(key)
+    return results, written
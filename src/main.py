@@ -1,4 +1,4 @@
-import os
+import asyncio, os
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,11 +6,17 @@ from fastapi.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 
 from .core.config import APP_TITLE, OPENAI_API_KEY
-from .core.database import cache_init
+from .core.database import cache_init, cache_close
+from .core import http_clients, maintenance, revalidate, health as health_monitor
 from .routers import analyze as analyze_router
 from .routers import ai as ai_router
 from .routers import export as export_router
-from .services import civic_service, vep_service, oncokb_service, clinvar_service
+from .routers import admin as admin_router
+from .routers import jobs as jobs_router
+from .services import civic_service, vep_service, oncokb_service, clinvar_service, prefetch, report_pdf
+from .services.pipeline import SOURCE_NAMES
+from .utils import evidence
+from . import worker
 
 app = FastAPI(title=APP_TITLE)
 
@@ -26,10 +32,41 @@ templates_dir = os.path.join(base_dir, "templates")
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 templates = Jinja2Templates(directory=templates_dir)
 
+# Proveedores sondeados por el monitor de salud
+health_monitor.register("CIVIC", civic_service.ping_async)
+health_monitor.register("VEP", vep_service.ping_async)
+health_monitor.register("ONCOKB", oncokb_service.ping_async)
+health_monitor.register("CLINVAR", clinvar_service.ping_async)
+
 # Routers
 app.include_router(analyze_router.router)
 app.include_router(ai_router.router)
 app.include_router(export_router.router)
+app.include_router(admin_router.router)
+app.include_router(jobs_router.router)
+
+@app.on_event("startup")
+async def _startup():
+    await http_clients.startup()
+    # El índice de evidencia local se arma una vez acá; después se recarga solo si cambian los JSON
+    await asyncio.to_thread(evidence.warm)
+    maintenance.start()
+    revalidate.start()
+    health_monitor.start()
+    prefetch.start()
+    # Workers de la cola en procesos aparte: el parseo y los PDF no compiten con los requests
+    worker.start_embedded()
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await asyncio.to_thread(worker.stop_embedded)
+    await prefetch.stop()
+    await health_monitor.stop()
+    await maintenance.stop()
+    await revalidate.stop()
+    await http_clients.shutdown()
+    report_pdf.shutdown()
+    cache_close()
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -37,17 +74,20 @@ async def index(request: Request):
 
 @app.get("/health")
 async def health():
+    # Responde desde el snapshot del monitor: no sale a la red
+    snap = health_monitor.snapshot()
     return {
         "ok": True,
         "ia": bool(OPENAI_API_KEY),
-        "sources": {
-            "CIViC": bool(civic_service.ping()),
-            "VEP": bool(vep_service.ping()),
-            "OncoKB": bool(oncokb_service.ping()),
-            "ClinVar": bool(clinvar_service.ping()),
-        }
+        "sources": {SOURCE_NAMES[p]: bool(s["ok"]) for p, s in snap.items()},
+        "providers": {SOURCE_NAMES[p]: s for p, s in snap.items()},
     }
 
+@app.get("/health/history/{provider}")
+async def health_history(provider: str):
+    key = {v.lower(): k for k, v in SOURCE_NAMES.items()}.get(provider.lower(), provider.upper())
+    return {"provider": SOURCE_NAMES.get(key, key), "samples": health_monitor.history(key)}
+
 cache_init()
 
 def get_app():
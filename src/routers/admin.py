@@ -0,0 +1,21 @@
+import asyncio
+from fastapi import APIRouter
+
+from ..core import maintenance
+from ..services import report_pdf
+
+router = APIRouter()
+
+@router.get("/admin/cache")
+async def admin_cache():
+    """Filas y bytes por proveedor del cache SQLite + contadores del tier en memoria."""
+    return await asyncio.to_thread(maintenance.cache_usage)
+
+@router.post("/admin/cache/maintenance")
+async def admin_cache_maintenance():
+    return await asyncio.to_thread(maintenance.run_maintenance)
+
+@router.get("/admin/pdf-cache")
+async def admin_pdf_cache():
+    """Aciertos, desalojos y bytes del cache de PDFs renderizados (contadores de este proceso)."""
+    return report_pdf.cache.stats()
@@ -1,14 +1,15 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body, Request
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from typing import Any, Dict, List, Optional
-import json
+import asyncio, json, time
 
 from ..models.schemas import ManualVariant, Biomarker, Patient
-from ..utils.tumor_utils import validar_tumor, obtener_biomarcadores_sugeridos
-from ..utils.vcf_parser import process_vcf_file
-from ..utils.pathology_utils import extract_variants_from_text, extract_biomarkers_from_text
-from ..utils.evidence import local_actions_for_variant
+from ..utils.tumor_utils import validar_tumor, normalizar_tumor, sugerir_tumores, obtener_biomarcadores_sugeridos
+from ..core.config import ANALYZE_VCF_MAX_RECORDS
+from ..utils.vcf_parser import process_vcf_file, aiter_lines, detach_upload, VcfTooLarge
+from ..utils.pathology_utils import extract_variants_from_text, extract_biomarkers_from_text, extract_many
 from ..services import civic_service, vep_service, oncokb_service, clinvar_service
+from ..services import pipeline, cohort
 
 router = APIRouter()
 
@@ -26,13 +27,9 @@ async def demo_vcf(key: str):
 @router.post("/suggest/tumors")
 async def suggest_tumors(payload: Dict[str, Any] = Body(...)):
     q = (payload.get("query") or "").lower().strip()
-    from ..utils.tumor_utils import TUMORES_VALIDOS
     if not q or len(q) < 2:
         return {"suggestions": []}
-    matches = [t for t in TUMORES_VALIDOS if q in t]
-    if "pul" in q: matches = [t for t in TUMORES_VALIDOS if "pulmón" in t]
-    if "mama" in q: matches = [t for t in TUMORES_VALIDOS if "mama" in t]
-    return {"suggestions": matches[:8]}
+    return {"suggestions": sugerir_tumores(q, 8)}
 
 @router.post("/suggest/biomarkers")
 async def suggest_biomarkers(payload: Dict[str, Any] = Body(...)):
@@ -59,24 +56,27 @@ async def analyze_demo():
     }
 
 # ---------------- ANALYZE UNIFIED ----------------
-@router.post("/analyze/unified")
-async def analyze_unified(
-    pseudonym: str = Form(...),
-    diagnosis: Optional[str] = Form(""),
-    tumor_type: str = Form(...),
-    vcf: Optional[UploadFile] = File(None),
-    manual_variants: Optional[str] = Form(None),
-    biomarkers: Optional[str] = Form(None),
-    pathology_report: Optional[str] = Form(None),
+async def _collect_inputs(
+    vcf: Optional[UploadFile],
+    manual_variants: Optional[str],
+    biomarkers: Optional[str],
+    pathology_report: Optional[str],
+    resolve: bool = True,
 ):
-    ok, msg, sug = validar_tumor(tumor_type)
-    if not ok:
-        raise HTTPException(status_code=400, detail={"error": msg, "details": sug})
-
+    """Variantes (VCF + manuales + informe de patología) y biomarcadores del formulario. Con
+    resolve=False los registros sin anotar quedan con sus coordenadas (los resuelve el stream)."""
     detected_variants: List[dict] = []
 
     if vcf is not None:
-        detected_variants.extend(await process_vcf_file(vcf))
+        # Un VCF grande (WES/WGS sin anotar serían miles de consultas a VEP) no se procesa en el
+        # request: se corta al superar el tope y se indica la cola de trabajos
+        try:
+            records = await process_vcf_file(vcf, ANALYZE_VCF_MAX_RECORDS)
+        except VcfTooLarge as e:
+            raise HTTPException(status_code=413, detail={"error": f"{e}: envíelo a /jobs/analyze",
+                                                         "max_records": e.limit})
+        # Los registros sin anotar salen de VEP con gen y cambio proteico
+        detected_variants.extend(await pipeline.fill_from_vep(records) if resolve else records)
 
     if manual_variants:
         try:
@@ -101,137 +101,117 @@ async def analyze_unified(
         except Exception:
             bios = []
 
-    # Si no detectamos nada, mantenemos un ejemplo para que la UI no quede vacía
-    if not detected_variants:
+    # Solo sin ninguna entrada se muestra un ejemplo para que la UI no quede vacía; si llegó un
+    # VCF, variantes o un informe sin hallazgos el resultado queda vacío (nunca datos de demo)
+    if not detected_variants and vcf is None and not manual_variants and not pathology_report:
         detected_variants = [{"gene":"EGFR","protein_change":"L858R","zygosity":"unknown"}]
+    return detected_variants, bios
+
+@router.post("/analyze/unified")
+async def analyze_unified(
+    pseudonym: str = Form(...),
+    diagnosis: Optional[str] = Form(""),
+    tumor_type: str = Form(...),
+    vcf: Optional[UploadFile] = File(None),
+    manual_variants: Optional[str] = Form(None),
+    biomarkers: Optional[str] = Form(None),
+    pathology_report: Optional[str] = Form(None),
+):
+    ok, msg, sug = validar_tumor(tumor_type)
+    if not ok:
+        raise HTTPException(status_code=400, detail={"error": msg, "details": sug})
+    tumor_type = normalizar_tumor(tumor_type)
+
+    detected_variants, bios = await _collect_inputs(vcf, manual_variants, biomarkers, pathology_report)
 
     # ----- Construcción de acciones con fuentes externas + local -----
-    details = []
-    refs_common = [{"label":"NCCN", "url":"https://www.nccn.org/"}]
-
-    for var in detected_variants:
-        gene = (var.get("gene") or "").upper()
-        pc = (var.get("protein_change") or "").upper()
-        # Local evidence (si existe)
-        local_actions = local_actions_for_variant(gene, pc, tumor_type)
-        for act in (local_actions or []):
-            details.append({
-                "action": act.get("action",""),
-                "drug": act.get("drug",""),
-                "variant": {"gene": gene, "protein_change": pc},
-                "strict_badge": bool(act.get("strict", True)),
-                "mechanistic_badge": bool(act.get("mechanistic", True)),
-                "references": (act.get("references") or refs_common),
-                "study_meta": act.get("study_meta") or {"level":"-"},
-                "sources": act.get("sources") or ["LocalEvidence"],
-                "clinical_context": act.get("clinical_context") or {},
-            })
-
-        # CIViC
-        civic = civic_service.query_variant(gene, pc)
-        if civic and civic.get("items"):
-            top = civic["items"][0]
-            drug = (top.get("drugNames") or [None])[0]
-            details.append({
-                "action": "Terapia/Asociación (CIViC)",
-                "drug": drug or "—",
-                "variant": {"gene": gene, "protein_change": pc},
-                "strict_badge": True if top.get("evidenceLevel") in ("A","B","1","2") else False,
-                "mechanistic_badge": True,
-                "references": [{"label": top.get("journal") or "CIViC", "url": top.get("url")}] + refs_common,
-                "study_meta": {"level": top.get("evidenceLevel") or "-", "year": top.get("year")},
-                "sources": ["CIViC"],
-                "clinical_context": {"why_now": top.get("desc") or "", "timing": top.get("disease") or ""}
-            })
-
-        # ClinVar (resumen)
-        clin = clinvar_service.find_variant_summary(gene, pc)
-        if clin:
-            details.append({
-                "action": "Significado Clínico (ClinVar)",
-                "drug": "—",
-                "variant": {"gene": gene, "protein_change": pc},
-                "strict_badge": False,
-                "mechanistic_badge": False,
-                "references": [{"label":"ClinVar", "url":"https://www.ncbi.nlm.nih.gov/clinvar/"}],
-                "study_meta": {"level": "db", "year": "-"},
-                "sources": ["ClinVar"],
-                "clinical_context": {"why_now": "Resumen de registros", "timing": ""}
-            })
-
-        # OncoKB (si hay token)
-        okb = oncokb_service.annotate(gene, pc)
-        if okb and isinstance(okb, dict) and okb.get("data"):
-            details.append({
-                "action": "Anotación (OncoKB)",
-                "drug": "—",
-                "variant": {"gene": gene, "protein_change": pc},
-                "strict_badge": False,
-                "mechanistic_badge": True,
-                "references": [{"label":"OncoKB", "url":"https://www.oncokb.org/"}],
-                "study_meta": {"level": "KB", "year": "-"},
-                "sources": ["OncoKB"],
-                "clinical_context": {"why_now": "Anotación estandarizada", "timing": ""}
-            })
-
-        # VEP (consecuencias)
-        # Si el VCF no trae coordenadas, esto no aplica; mantenemos flujo
-        # (el parser actual devuelve variante dummy; esta llamada es opcional)
-        # vep = vep_service.annotate_region(chrom, pos, ref, alt)  # si tuvieras coords reales
-
-        # Determinístico mínimo (por si nada devolvió)
-        if not local_actions and not civic and not clin and not okb:
-            if gene == "EGFR" and ("L858R" in pc or "EX19DEL" in pc or "DEL" in pc):
-                details.append({
-                    "action": "Terapia dirigida",
-                    "drug": "Osimertinib",
-                    "variant": {"gene": gene, "protein_change": pc},
-                    "strict_badge": True,
-                    "mechanistic_badge": True,
-                    "references": refs_common,
-                    "study_meta": {"level":"1", "study_type":"Phase III", "year": 2018, "sample_size": 682, "disease": "NSCLC"},
-                    "sources": ["Rule"],
-                    "clinical_context": {"why_now": "Mutación clásica sensible", "timing":"primera línea", "alternatives": ["Gefitinib","Erlotinib"]}
-                })
-            elif gene == "KRAS" and "G12D" in pc:
-                details.append({
-                    "action": "Ensayos clínicos",
-                    "drug": "KRASi (en desarrollo)",
-                    "variant": {"gene": gene, "protein_change": pc},
-                    "strict_badge": False,
-                    "mechanistic_badge": True,
-                    "references": refs_common,
-                    "study_meta": {"level":"Investigacional"},
-                    "sources": ["Rule"],
-                    "clinical_context": {"why_now": "Mutación KRAS clásica", "timing":"segundas líneas", "alternatives": ["Quimioterapia"]}
-                })
-            elif gene == "BRAF" and "V600E" in pc:
-                details.append({
-                    "action": "Terapia combinada",
-                    "drug": "Dabrafenib + Trametinib",
-                    "variant": {"gene": gene, "protein_change": pc},
-                    "strict_badge": True,
-                    "mechanistic_badge": True,
-                    "references": refs_common,
-                    "study_meta": {"level":"2"},
-                    "sources": ["Rule"],
-                    "clinical_context": {"why_now": "Activación MAPK", "timing":"segundas líneas", "alternatives": ["Vemurafenib"]}
-                })
-
-    summary = (
-        f"Paciente {pseudonym}. Tumor: {tumor_type}. Variantes detectadas: "
-        + (", ".join([f"{v.get('gene','?')} {v.get('protein_change','?')}" for v in detected_variants]) or "ninguna")
-        + ". Biomarcadores: "
-        + (", ".join([b.get('name','') for b in (bios or [])]) or "no reportados")
-        + "."
-    )
-
-    payload = {
-        "summary": summary,
-        "details": details,
-        "timeline": [
-            {"title": "Ingreso de datos", "description": "Se procesaron entradas múltiples", "tags": ["VCF","Manual","Biomarcadores"]},
-            {"title": "Anotación", "description": "Fuentes: Local / CIViC / ClinVar / OncoKB / VEP", "tags": ["Fuentes"]},
-        ],
-    }
+    # Todas las consultas (variante, proveedor) salen en paralelo; el orden de details
+    # sigue siendo el de detected_variants y, dentro de cada una, Local/CIViC/ClinVar/OncoKB.
+    annotations, meta = await pipeline.annotate_variants(detected_variants)
+    payload = pipeline.build_report(pseudonym, tumor_type, detected_variants, bios, annotations, meta)
     return JSONResponse(payload)
+
+# ---------------- ANALYZE STREAM ----------------
+@router.post("/analyze/stream")
+async def analyze_stream(
+    request: Request,
+    pseudonym: str = Form(...),
+    diagnosis: Optional[str] = Form(""),
+    tumor_type: str = Form(...),
+    vcf: Optional[UploadFile] = File(None),
+    manual_variants: Optional[str] = Form(None),
+    biomarkers: Optional[str] = Form(None),
+    pathology_report: Optional[str] = Form(None),
+):
+    """Mismo formulario que /analyze/unified, pero los details se envían por fuente a medida
+    que llegan (evidencia local y cache en milisegundos), los registros de VCF sin anotar a
+    medida que VEP los resuelve (event=variant) y al final el payload completo (event=report).
+    SSE si el cliente pide text/event-stream; si no, NDJSON."""
+    ok, msg, sug = validar_tumor(tumor_type)
+    if not ok:
+        raise HTTPException(status_code=400, detail={"error": msg, "details": sug})
+    tumor_type = normalizar_tumor(tumor_type)
+
+    # El VCF se lee antes de responder (Starlette cierra los archivos del form al salir), pero
+    # VEP no: los registros sin anotar se resuelven ya dentro del stream
+    detected_variants, bios = await _collect_inputs(vcf, manual_variants, biomarkers, pathology_report,
+                                                    resolve=False)
+    events = pipeline.stream_report(pseudonym, tumor_type, detected_variants, bios)
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def body():
+        async for ev in events:
+            data = json.dumps(ev, ensure_ascii=False)
+            yield (f"event: {ev['event']}\ndata: {data}\n\n" if sse else data + "\n").encode("utf-8")
+    # Sin buffering en proxies (nginx) para que cada evento salga apenas se genera
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type="text/event-stream" if sse else "application/x-ndjson",
+                             headers=headers)
+
+# ---------------- Extracción de informes de patología ----------------
+@router.post("/analyze/pathology")
+async def analyze_pathology(payload: Dict[str, Any] = Body(...)):
+    """Variantes y biomarcadores de uno (`text`) o muchos informes (`reports`: textos u objetos
+    {id, text}), con offsets de cada hallazgo en su texto. No consulta proveedores."""
+    reports = payload.get("reports")
+    if reports is None:
+        reports = [payload.get("text") or ""]
+    if not isinstance(reports, list):
+        raise HTTPException(status_code=400, detail={"error": "reports debe ser una lista"})
+    ids = [r.get("id", i) if isinstance(r, dict) else i for i, r in enumerate(reports)]
+    texts = [str((r.get("text") if isinstance(r, dict) else r) or "") for r in reports]
+    t = time.monotonic()
+    results = await asyncio.to_thread(lambda: list(extract_many(texts, workers=1)))
+    elapsed = time.monotonic() - t
+    return {
+        "results": [{"id": i, **res} for i, res in zip(ids, results)],
+        "reports": len(texts), "elapsed_s": round(elapsed, 4),
+    }
+
+# ---------------- ANALYZE BATCH (cohorte) ----------------
+@router.post("/analyze/batch")
+async def analyze_batch(
+    file: UploadFile = File(...),
+    tumor_type: Optional[str] = Form(None),
+    window: Optional[int] = Form(None),
+):
+    """Cohorte en NDJSON (un paciente por línea) o VCF multi-muestra (un paciente por muestra,
+    todos con `tumor_type`). Responde NDJSON: una línea por paciente a medida que se cierra cada
+    ventana y una línea final con el resumen del lote."""
+    if tumor_type or await asyncio.to_thread(cohort.sniff_format, file.file, file.filename) == cohort.VCF:
+        # Un VCF no trae el tumor de cada muestra: sin tumor_type se rechaza antes de empezar
+        ok, msg, sug = validar_tumor(tumor_type or "")
+        if not ok:
+            raise HTTPException(status_code=400, detail={"error": msg, "details": sug})
+        tumor_type = normalizar_tumor(tumor_type)
+    # El lote se lee mientras se transmite la respuesta
+    spool = detach_upload(file)
+
+    async def body():
+        try:
+            patients = cohort.read_patients(aiter_lines(spool), file.filename, tumor_type)
+            async for chunk in cohort.ndjson_lines(cohort.analyze_cohort(patients, window=window)):
+                yield chunk
+        finally:
+            spool.close()
+    return StreamingResponse(body(), media_type="application/x-ndjson")
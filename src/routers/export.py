@@ -1,48 +1,80 @@
+from fastapi import APIRouter, Body, Request, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from typing import Any, Dict, Optional
+import asyncio, io, json, os
 
-from fastapi import APIRouter, Body
-from fastapi.responses import StreamingResponse, JSONResponse
-from typing import Any, Dict
-import io, json
-
-# PDF generation
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+from ..core import jobs
+from ..services import report_pdf, bulk_export
+from ..utils.vcf_parser import aiter_lines, detach_upload
 
 router = APIRouter()
 
+_CHUNK = 64 * 1024
+
 @router.post("/export/pdf")
-async def export_pdf(payload: Dict[str, Any] = Body(...)):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-    story.append(Paragraph("Reporte PGx", styles["Title"]))
-    story.append(Spacer(1, 12))
-    patient = payload.get("patient", {})
-    result = payload.get("result", {})
-    story.append(Paragraph(f"Paciente: {patient.get('pseudonym','-')}", styles["Normal"]))
-    story.append(Paragraph(f"Tumor: {patient.get('tumor_type','-')}", styles["Normal"]))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph("Resumen", styles["Heading2"]))
-    story.append(Paragraph(result.get("summary","-"), styles["Normal"]))
-    story.append(Spacer(1, 12))
-    details = result.get("details") or []
-    data = [["Acción","Fármaco","Variante","Nivel","Año"]]
-    for d in details:
-        meta = d.get("study_meta",{})
-        var = d.get("variant",{})
-        data.append([d.get("action",""), d.get("drug",""), f"{var.get('gene','')} {var.get('protein_change','')}", meta.get("level","-"), str(meta.get("year","-"))])
-    if len(data) > 1:
-        table = Table(data, hAlign='LEFT')
-        table.setStyle(TableStyle([('BACKGROUND',(0,0),(-1,0), colors.lightgrey), ('GRID',(0,0),(-1,-1), 0.5, colors.grey)]))
-        story.append(table)
-    doc.build(story)
-    buffer.seek(0)
-    return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition":"attachment; filename=report.pdf"})
+async def export_pdf(request: Request, payload: Dict[str, Any] = Body(...)):
+    # El ETag es el hash del payload canónico: si el cliente ya tiene este reporte no se
+    # renderiza ni se envía nada
+    digest = report_pdf.payload_hash(payload)
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    inm = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    # Render fuera del event loop (pool acotado); se abre el archivo ya cacheado y se envía por
+    # bloques. Con el archivo abierto un desalojo concurrente no corta la descarga.
+    try:
+        f = open(await report_pdf.render_cached(payload, digest), "rb")
+    except FileNotFoundError:
+        f = open(await report_pdf.render_cached(payload, digest), "rb")
+
+    def chunks():
+        with f:
+            while True:
+                chunk = f.read(_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+    headers.update({"Content-Length": str(os.fstat(f.fileno()).st_size),
+                    "Content-Disposition": "attachment; filename=report.pdf"})
+    return StreamingResponse(chunks(), media_type="application/pdf", headers=headers)
 
 @router.post("/export/json")
 async def export_json(payload: Dict[str, Any] = Body(...)):
     blob = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
     return StreamingResponse(io.BytesIO(blob), media_type="application/json", headers={"Content-Disposition":"attachment; filename=report.json"})
+
+@router.post("/export/zip")
+async def export_zip(
+    file: Optional[UploadFile] = File(None),
+    job_id: Optional[str] = Form(None),
+    formats: Optional[str] = Form(None),
+):
+    """ZIP de una cohorte: `file` es un NDJSON de payloads de /export/pdf o la salida de
+    /analyze/batch; `job_id` toma el resultado de un trabajo de cohorte terminado. El ZIP se
+    escribe a medida que cada reporte está listo (PDF y/o JSON) y cierra con summary.csv/.ndjson."""
+    chosen = bulk_export.parse_formats(formats)
+    if job_id:
+        job = await asyncio.to_thread(jobs.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail={"error": "Trabajo inexistente"})
+        if job["kind"] != "cohort" or job["status"] != jobs.DONE or not job["result_path"]:
+            raise HTTPException(status_code=409, detail={"error": "El trabajo no es una cohorte terminada",
+                                                          "status": job["status"]})
+        reports = bulk_export.job_reports(job["result_path"])
+        body = bulk_export.zip_stream(reports, chosen)
+    elif file is not None:
+        spool = detach_upload(file)
+
+        async def body_from_upload():
+            try:
+                async for chunk in bulk_export.zip_stream(bulk_export.reports_from_lines(aiter_lines(spool)), chosen):
+                    yield chunk
+            finally:
+                spool.close()
+        body = body_from_upload()
+    else:
+        raise HTTPException(status_code=400, detail={"error": "Falta file o job_id"})
+    return StreamingResponse(body, media_type="application/zip",
+                             headers={"Content-Disposition": "attachment; filename=cohort_reports.zip",
+                                      "X-Accel-Buffering": "no"})
@@ -0,0 +1,126 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Body, Query
+from fastapi.responses import FileResponse
+from typing import Any, Dict, Optional
+import asyncio, json, os, shutil, time
+
+from ..core import jobs
+from ..core.config import JOBS_POLL_INTERVAL
+from ..services import cohort
+from ..utils.tumor_utils import validar_tumor, normalizar_tumor
+from ..worker import RESULT_MEDIA_TYPES
+
+# Análisis largos fuera del request: se encolan, los corre un worker y acá se consulta el
+# estado, se espera (long-poll), se baja el resultado o se cancela.
+
+router = APIRouter()
+
+def _check_tumor(tumor_type: Optional[str]) -> str:
+    """Nombre canónico del tumor (400 si no se reconoce)."""
+    ok, msg, sug = validar_tumor(tumor_type or "")
+    if not ok:
+        raise HTTPException(status_code=400, detail={"error": msg, "details": sug})
+    return normalizar_tumor(tumor_type or "")
+
+async def _save_upload(upload: UploadFile, job_id: str) -> str:
+    path = jobs.path_for(job_id, "in")
+    def copy() -> None:
+        upload.file.seek(0)
+        with open(path, "wb") as out:
+            shutil.copyfileobj(upload.file, out, 1 << 20)
+    await asyncio.to_thread(copy)
+    return path
+
+async def _submit(kind: str, params: Dict[str, Any], priority: int, upload: Optional[UploadFile] = None):
+    job_id = jobs.new_id()
+    input_path = await _save_upload(upload, job_id) if upload is not None else None
+    await asyncio.to_thread(jobs.submit, kind, params, priority, input_path, job_id)
+    return {"id": job_id, "status": jobs.QUEUED}
+
+def _json_list(raw: Optional[str]) -> list:
+    try:
+        value = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    return value if isinstance(value, list) else []
+
+@router.post("/jobs/analyze")
+async def submit_analyze(
+    pseudonym: str = Form(...),
+    tumor_type: str = Form(...),
+    vcf: Optional[UploadFile] = File(None),
+    manual_variants: Optional[str] = Form(None),
+    biomarkers: Optional[str] = Form(None),
+    pathology_report: Optional[str] = Form(None),
+    priority: int = Form(0),
+):
+    """Mismos campos que /analyze/unified; el VCF se parsea en el worker."""
+    params = {
+        "pseudonym": pseudonym, "tumor_type": _check_tumor(tumor_type), "manual_variants": _json_list(manual_variants),
+        "biomarkers": _json_list(biomarkers), "pathology_report": pathology_report or "",
+    }
+    return await _submit("analyze", params, priority, vcf)
+
+@router.post("/jobs/cohort")
+async def submit_cohort(
+    file: UploadFile = File(...),
+    tumor_type: Optional[str] = Form(None),
+    window: Optional[int] = Form(None),
+    priority: int = Form(0),
+):
+    """Mismos campos que /analyze/batch; el resultado es el NDJSON completo."""
+    if tumor_type or await asyncio.to_thread(cohort.sniff_format, file.file, file.filename) == cohort.VCF:
+        # Como /analyze/batch: un VCF necesita tumor_type y se rechaza antes de encolarlo
+        tumor_type = _check_tumor(tumor_type)
+    params = {"filename": file.filename, "tumor_type": tumor_type, "window": window}
+    return await _submit("cohort", params, priority, file)
+
+@router.post("/jobs/pdf")
+async def submit_pdf(payload: Dict[str, Any] = Body(...), priority: int = Query(0)):
+    """Mismo cuerpo que /export/pdf."""
+    return await _submit("pdf", {"payload": payload}, priority)
+
+@router.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    rows = await asyncio.to_thread(jobs.list_jobs, status, limit)
+    return {"jobs": [jobs.public(j) for j in rows], "counts": await asyncio.to_thread(jobs.counts)}
+
+async def _get(job_id: str) -> Dict[str, Any]:
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": "Trabajo inexistente"})
+    return job
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return jobs.public(await _get(job_id))
+
+@router.get("/jobs/{job_id}/wait")
+async def job_wait(job_id: str, timeout: float = Query(30.0, ge=0, le=120)):
+    """Long-poll: responde cuando el trabajo termina o al vencer `timeout` (lo que pase antes)."""
+    deadline = time.monotonic() + timeout
+    job = await _get(job_id)
+    while job["status"] not in jobs.FINAL and time.monotonic() < deadline:
+        await asyncio.sleep(min(JOBS_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+        job = await _get(job_id)
+    return jobs.public(job)
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = await _get(job_id)
+    if job["status"] != jobs.DONE:
+        raise HTTPException(status_code=409, detail={"error": "El trabajo no terminó", "status": job["status"]})
+    path = job["result_path"]
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=410, detail={"error": "El resultado ya no está disponible"})
+    media_type = RESULT_MEDIA_TYPES.get(job["kind"], "application/octet-stream")
+    return FileResponse(path, media_type=media_type, filename=f"{job['kind']}-{job_id}{os.path.splitext(path)[1]}")
+
+@router.post("/jobs/{job_id}/cancel")
+async def job_cancel(job_id: str):
+    await _get(job_id)
+    return jobs.public(await asyncio.to_thread(jobs.cancel, job_id))
+
+@router.delete("/jobs/{job_id}")
+async def job_delete(job_id: str):
+    """Igual que cancel (se mantiene el registro hasta la purga por JOBS_RETENTION)."""
+    return await job_cancel(job_id)
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from ..core.database import cache_lookup_many, cache_set_many
+from ..core import singleflight, revalidate
+
+# Camino común de las consultas por lotes de los servicios: cache en una consulta, vencidos a
+# revalidación, faltantes coalescidos y en lote, y escritura en una sola transacción.
+
+async def lookup_many(
+    provider: str,
+    by_key: Dict[str, Tuple],
+    fetch_one: Callable[..., Awaitable[Any]],
+    fetch_many: Callable[[List[Tuple]], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """by_key = {cache_key: argumentos}. fetch_one(*argumentos) refresca una clave vencida y
+    fetch_many(lista de argumentos) -> {cache_key: resultado} trae los faltantes.
+    Devuelve {cache_key: resultado}; las claves que fallaron quedan ausentes."""
+    if not by_key:
+        return {}
+    found = await asyncio.to_thread(cache_lookup_many, [(provider, k) for k in by_key])
+    out: Dict[str, Any] = {}
+    for (_, k), (value, stale) in found.items():
+        out[k] = value
+        if stale:
+            revalidate.schedule(provider, k, lambda a=by_key[k]: fetch_one(*a))
+    misses = [k for k in by_key if k not in out]
+    if not misses:
+        return out
+    fetched, shared = await singleflight.do_many(provider, misses, lambda ks: fetch_many([by_key[k] for k in ks]))
+    to_write = [(provider, k, v) for k, v in fetched.items() if k not in shared]
+    if to_write:
+        await asyncio.to_thread(cache_set_many, to_write)
+    out.update(fetched)
+    return out
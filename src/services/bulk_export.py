@@ -0,0 +1,214 @@
+import asyncio, csv, io, json, re, tempfile, time, zipfile
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from ..core.config import EXPORT_CONCURRENCY
+from . import report_pdf
+
+# Exportación masiva: muchos reportes ({patient, result} o líneas del NDJSON de /analyze/batch)
+# a un ZIP que se escribe en la respuesta a medida que cada miembro está listo. Los PDF salen
+# del pool de report_pdf (y de su cache); en memoria hay como mucho EXPORT_CONCURRENCY
+# reportes en vuelo y los resúmenes de la cohorte se acumulan en archivos temporales.
+
+FORMATS = ("pdf", "json")
+
+SUMMARY_FIELDS = [
+    "pseudonym", "tumor_type", "variants", "details", "strict_actions", "top_action", "top_drug",
+    "stale_sources", "failed_sources", "error", "files",
+]
+
+class _Sink(io.RawIOBase):
+    """Destino de ZipFile sin seek: junta lo escrito hasta que se drena hacia la respuesta."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out, self._chunks = b"".join(self._chunks), []
+        return out
+
+def as_report(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Normaliza una entrada a {patient, result}; None para las líneas que no son reportes
+    (el resumen final del lote)."""
+    if obj.get("type") == "summary":
+        return None
+    if "result" in obj:
+        return {"patient": obj.get("patient") or {}, "result": obj.get("result") or {}}
+    patient = {"pseudonym": obj.get("pseudonym"), "tumor_type": obj.get("tumor_type")}
+    result = {k: v for k, v in obj.items() if k not in ("type", "pseudonym", "tumor_type")}
+    return {"patient": patient, "result": result}
+
+async def reports_from_lines(lines: AsyncIterable[str]) -> AsyncIterator[Dict[str, Any]]:
+    """Reportes de un NDJSON (payloads de /export/pdf o la salida de /analyze/batch)."""
+    n = 0
+    async for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        n += 1
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield {"patient": {"pseudonym": f"#{n}"}, "result": {"error": f"Línea {n} inválida: {e}"}}
+            continue
+        if isinstance(obj, dict):
+            report = as_report(obj)
+            if report is not None:
+                yield report
+
+async def job_reports(path: str) -> AsyncIterator[Dict[str, Any]]:
+    """Reportes del resultado NDJSON de un trabajo de cohorte (ver core/jobs)."""
+    from ..utils.vcf_parser import aiter_lines
+    with open(path, "rb") as f:
+        async for report in reports_from_lines(aiter_lines(f)):
+            yield report
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]+")
+
+def _member_base(pseudonym: Any, used: Set[str]) -> str:
+    base = _UNSAFE.sub("_", str(pseudonym or "paciente")).strip("._") or "paciente"
+    name, i = base[:80], 1
+    while name in used:
+        i += 1
+        name = f"{base[:80]}-{i}"
+    used.add(name)
+    return name
+
+def _summary_row(report: Dict[str, Any], files: List[str]) -> Dict[str, Any]:
+    patient, result = report["patient"], report["result"]
+    details = result.get("details") or []
+    variants = []
+    for d in details:
+        v = d.get("variant") or {}
+        label = f"{v.get('gene','')} {v.get('protein_change','')}".strip()
+        if label and label not in variants:
+            variants.append(label)
+    top = details[0] if details else {}
+    return {
+        "pseudonym": patient.get("pseudonym") or "", "tumor_type": patient.get("tumor_type") or "",
+        "variants": "; ".join(variants), "details": len(details),
+        "strict_actions": sum(1 for d in details if d.get("strict_badge")),
+        "top_action": top.get("action") or "", "top_drug": top.get("drug") or "",
+        "stale_sources": ", ".join(result.get("stale_sources") or []),
+        "failed_sources": ", ".join(result.get("failed_sources") or []),
+        "error": result.get("error") or "", "files": "; ".join(files),
+    }
+
+async def _pdf_path(report: Dict[str, Any]) -> Optional[str]:
+    if report["result"].get("error"):
+        return None
+    return await report_pdf.render_cached(report)
+
+def _add_pdf(zf: zipfile.ZipFile, path: str, arcname: str) -> bool:
+    # Los PDF ya vienen comprimidos: se guardan tal cual
+    try:
+        zf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+        return True
+    except FileNotFoundError:
+        # Desalojado del cache entre el render y la copia
+        return False
+
+async def zip_stream(
+    reports: AsyncIterable[Dict[str, Any]],
+    formats: Tuple[str, ...] = FORMATS,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """Bytes del ZIP: por paciente <pseudónimo>.pdf / .json (en orden de terminación) y al
+    final summary.csv y summary.ndjson con una fila por paciente."""
+    limit = max(1, concurrency or EXPORT_CONCURRENCY)
+    sink = _Sink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+    used: Set[str] = set()
+    csv_tmp = tempfile.SpooledTemporaryFile(max_size=4 << 20, mode="w+", newline="", encoding="utf-8")
+    ndjson_tmp = tempfile.SpooledTemporaryFile(max_size=4 << 20, mode="w+", encoding="utf-8")
+    writer = csv.DictWriter(csv_tmp, fieldnames=SUMMARY_FIELDS)
+    writer.writeheader()
+    pending: Dict["asyncio.Future[Optional[str]]", Tuple[Dict[str, Any], str]] = {}
+    started = time.monotonic()
+    count = 0
+
+    def write_member(report: Dict[str, Any], base: str, pdf: Optional[str]) -> bool:
+        files = []
+        if pdf is not None:
+            if not _add_pdf(zf, pdf, f"reports/{base}.pdf"):
+                return False
+            files.append(f"reports/{base}.pdf")
+        if "json" in formats:
+            zf.writestr(f"reports/{base}.json", json.dumps(report, ensure_ascii=False, indent=2))
+            files.append(f"reports/{base}.json")
+        row = _summary_row(report, files)
+        writer.writerow(row)
+        ndjson_tmp.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return True
+
+    async def finish_one() -> AsyncIterator[bytes]:
+        nonlocal count
+        done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+        for fut in done:
+            report, base = pending.pop(fut)
+            try:
+                pdf = fut.result()
+            except Exception as e:
+                report = {**report, "result": {**report["result"], "error": f"PDF: {type(e).__name__}: {e}"}}
+                pdf = None
+            # La compresión y la copia del PDF van a un hilo: el event loop queda libre
+            if not await asyncio.to_thread(write_member, report, base, pdf):
+                pdf = await report_pdf.render_cached(report)
+                await asyncio.to_thread(write_member, report, base, pdf)
+            count += 1
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+    try:
+        async for report in reports:
+            base = _member_base(report["patient"].get("pseudonym"), used)
+            if "pdf" in formats:
+                fut = asyncio.ensure_future(_pdf_path(report))
+            else:
+                fut = asyncio.get_running_loop().create_future()
+                fut.set_result(None)
+            pending[fut] = (report, base)
+            while len(pending) >= limit:
+                async for chunk in finish_one():
+                    yield chunk
+        while pending:
+            async for chunk in finish_one():
+                yield chunk
+
+        def write_summaries() -> None:
+            csv_tmp.seek(0)
+            with zf.open("summary.csv", "w") as dst:
+                for block in iter(lambda: csv_tmp.read(1 << 16), ""):
+                    dst.write(block.encode("utf-8"))
+            ndjson_tmp.seek(0)
+            with zf.open("summary.ndjson", "w") as dst:
+                for block in iter(lambda: ndjson_tmp.read(1 << 16), ""):
+                    dst.write(block.encode("utf-8"))
+            zf.writestr("manifest.json", json.dumps({
+                "reports": count, "formats": list(formats),
+                "elapsed_s": round(time.monotonic() - started, 3),
+            }))
+            zf.close()
+        await asyncio.to_thread(write_summaries)
+        yield sink.drain()
+    finally:
+        for fut in pending:
+            fut.cancel()
+        csv_tmp.close()
+        ndjson_tmp.close()
+
+def parse_formats(raw: Optional[str]) -> Tuple[str, ...]:
+    chosen = tuple(f for f in (x.strip().lower() for x in (raw or ",".join(FORMATS)).split(",")) if f in FORMATS)
+    return chosen or FORMATS
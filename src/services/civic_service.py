@@ -1,13 +1,14 @@
-import json
-from typing import Any, Dict, Optional
-import httpx
+import asyncio, hashlib, json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from ..core.config import CIVIC_URL, HTTP_TIMEOUT, HTTP_RETRIES
+from ..core.config import CIVIC_URL, CIVIC_BATCH_SIZE, CIVIC_BATCH_CONCURRENCY
 from ..core.database import cache_get, cache_set
+from ..core import http_clients, singleflight, resilience, kb
+from ..core.resilience import UpstreamError
+from . import batch_lookup
 
-_GQL_VARIANT = """
-query VariantEvidence($gene: String!, $variant: String!) {
-  evidenceItems(geneNames: [$gene], variantNames: [$variant], page: 0, size: 5) {
+# Selección común a la consulta individual y a la multi-variante (un alias por variante)
+_RECORDS = """
     records {
       id
       evidenceType
@@ -27,51 +28,203 @@ query VariantEvidence($gene: String!, $variant: String!) {
         url
       }
       evidenceLevel
-    }
+    }"""
+
+_GQL_VARIANT = """
+query VariantEvidence($gene: String!, $variant: String!) {
+  evidenceItems(geneNames: [$gene], variantNames: [$variant], page: 0, size: 5) {%s
   }
 }
-"""
-
-def _retry_client() -> httpx.Client:
-    return httpx.Client(timeout=HTTP_TIMEOUT)
+""" % _RECORDS
 
 def ping() -> bool:
     try:
-        with _retry_client() as c:
-            r = c.post(CIVIC_URL, json={"query":"{ stats { genes } }"})
-            return r.status_code == 200
+        r = http_clients.request("CIVIC", "POST", CIVIC_URL, retries=0, json={"query":"{ stats { genes } }"})
+        return r.status_code == 200
     except Exception:
         return False
 
+async def ping_async(timeout: float) -> bool:
+    r = await http_clients.arequest("CIVIC", "POST", CIVIC_URL, retries=0, timeout=timeout,
+                                    json={"query":"{ stats { genes } }"})
+    return r.status_code == 200
+
+def cache_key(gene: str, protein_change: str) -> str:
+    return f"CIVIC::{gene}::{protein_change}"
+
+def _payload(gene: str, protein_change: str) -> Dict[str, Any]:
+    return {"query": _GQL_VARIANT, "variables": {"gene": gene, "variant": protein_change}}
+
+def _reduce(j: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce la respuesta GraphQL a un esquema simple."""
+    return _reduce_items(j.get("data",{}).get("evidenceItems"))
+
+def _reduce_items(node: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    out = {"items": []}
+    items = (node or {}).get("records",[]) or []
+    for it in items:
+        out["items"].append({
+            "evidenceLevel": it.get("evidenceLevel"),
+            "evidenceType": it.get("evidenceType"),
+            "drugNames": [d.get("name") for d in (it.get("drugs") or []) if d.get("name")],
+            "disease": it.get("disease",{}).get("name"),
+            "year": (it.get("source") or {}).get("publicationYear"),
+            "journal": (it.get("source") or {}).get("journal"),
+            "url": (it.get("source") or {}).get("url"),
+            "desc": it.get("description"),
+            "significance": it.get("clinicalSignificance") or it.get("significance"),
+        })
+    return out
+
+def _parse(r) -> Dict[str, Any]:
+    if r.status_code != 200:
+        raise UpstreamError(f"CIVIC HTTP {r.status_code}")
+    j = r.json()
+    if j.get("errors") and not j.get("data"):
+        raise UpstreamError(f"CIVIC GraphQL: {j['errors'][0].get('message')}")
+    return _reduce(j)
+
+def local_lookup(gene: str, protein_change: str) -> Optional[Dict[str, Any]]:
+    """Respuesta desde la base local según PROVIDER_MODE; None si corresponde ir a la red."""
+    if kb.mode() == kb.NETWORK:
+        return None
+    items = kb.civic_items(gene, protein_change) if kb.has_source("CIVIC") else []
+    return None if kb.network_allowed(bool(items)) else {"items": items}
+
+def fetch(gene: str, protein_change: str) -> Dict[str, Any]:
+    """Consulta de red (sin cache). Levanta UpstreamError si CIViC falla."""
+    local = local_lookup(gene, protein_change)
+    if local is not None:
+        return local
+    r = http_clients.request("CIVIC", "POST", CIVIC_URL, json=_payload(gene, protein_change),
+                             headers={"Content-Type": "application/json"})
+    return _parse(r)
+
+async def fetch_async(gene: str, protein_change: str) -> Dict[str, Any]:
+    """Versión async de fetch; el pipeline resuelve el cache en lote."""
+    local = await asyncio.to_thread(local_lookup, gene, protein_change) if kb.mode() != kb.NETWORK else None
+    if local is not None:
+        return local
+    r = await http_clients.arequest("CIVIC", "POST", CIVIC_URL, json=_payload(gene, protein_change),
+                                    headers={"Content-Type": "application/json"})
+    return _parse(r)
+
 def query_variant(gene: str, protein_change: str) -> Dict[str, Any]:
     """Consulta CIViC para evidencia resumida. Usa cache y nunca rompe el flujo."""
-    key = f"CIVIC::{gene}::{protein_change}"
+    key = cache_key(gene, protein_change)
     data, ok = cache_get("CIVIC", key)
     if ok and data:
         return data
-    payload = {"query": _GQL_VARIANT, "variables": {"gene": gene, "variant": protein_change}}
-    out = {"items": []}
     try:
-        with _retry_client() as c:
-            r = c.post(CIVIC_URL, json=payload, headers={"Content-Type": "application/json"})
-            if r.status_code == 200:
-                j = r.json()
-                items = j.get("data",{}).get("evidenceItems",{}).get("records",[]) or []
-                # Reducimos a un esquema simple
-                for it in items:
-                    out["items"].append({
-                        "evidenceLevel": it.get("evidenceLevel"),
-                        "evidenceType": it.get("evidenceType"),
-                        "drugNames": [d.get("name") for d in (it.get("drugs") or []) if d.get("name")],
-                        "disease": it.get("disease",{}).get("name"),
-                        "year": (it.get("source") or {}).get("publicationYear"),
-                        "journal": (it.get("source") or {}).get("journal"),
-                        "url": (it.get("source") or {}).get("url"),
-                        "desc": it.get("description"),
-                        "significance": it.get("clinicalSignificance") or it.get("significance"),
-                    })
-    except Exception:
-        # No levantamos excepción: mantenemos flujo
-        pass
+        out = resilience.call_sync("CIVIC", key, lambda: fetch(gene, protein_change))
+    except UpstreamError:
+        # No levantamos excepción: mantenemos flujo, pero el fallo no se cachea como "sin evidencia"
+        return {"items": []}
     cache_set("CIVIC", key, out)
     return out
+
+async def query_variant_async(gene: str, protein_change: str) -> Dict[str, Any]:
+    """Versión async de query_variant: no bloquea el event loop."""
+    key = cache_key(gene, protein_change)
+    data, ok = cache_get("CIVIC", key)
+    if ok and data:
+        return data
+    try:
+        out, written = await singleflight.do(
+            "CIVIC", key, lambda: resilience.call("CIVIC", key, lambda: fetch_async(gene, protein_change)))
+    except UpstreamError:
+        return {"items": []}
+    if not written:
+        cache_set("CIVIC", key, out)
+    return out
+
+def _batch_payload(pairs: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Una sola consulta GraphQL con un alias vN por variante."""
+    params, fields, variables = [], [], {}
+    for i, (gene, pc) in enumerate(pairs):
+        params.append(f"$g{i}: String!, $v{i}: String!")
+        fields.append(f"  v{i}: evidenceItems(geneNames: [$g{i}], variantNames: [$v{i}], page: 0, size: 5) {{"
+                      f"{_RECORDS}\n  }}")
+        variables[f"g{i}"], variables[f"v{i}"] = gene, pc
+    query = "query BatchEvidence(%s) {\n%s\n}\n" % (", ".join(params), "\n".join(fields))
+    return {"query": query, "variables": variables}
+
+def _parse_batch(r, n: int) -> Dict[int, Dict[str, Any]]:
+    """{índice: resultado} de los alias que respondieron; los que traen error quedan afuera."""
+    if r.status_code != 200:
+        raise UpstreamError(f"CIVIC HTTP {r.status_code}")
+    j = r.json()
+    data = j.get("data") or {}
+    errors = j.get("errors") or []
+    if errors and not data:
+        raise UpstreamError(f"CIVIC GraphQL: {errors[0].get('message')}")
+    bad = {e["path"][0] for e in errors if e.get("path")}
+    out = {}
+    for i in range(n):
+        alias = f"v{i}"
+        node = data.get(alias)
+        # Con errores, un alias nulo es un fallo aunque el error no traiga path
+        if alias in bad or (errors and node is None):
+            continue
+        out[i] = _reduce_items(node)
+    return out
+
+async def _post_batch(pairs: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    async def go():
+        r = await http_clients.arequest("CIVIC", "POST", CIVIC_URL, json=_batch_payload(pairs),
+                                        headers={"Content-Type": "application/json"})
+        return _parse_batch(r, len(pairs))
+    keys = [cache_key(*p) for p in pairs]
+    # Clave del cache negativo: la de la variante si va sola, un hash del lote si no
+    rkey = keys[0] if len(keys) == 1 else "batch::" + hashlib.sha1("|".join(keys).encode()).hexdigest()[:16]
+    got = await resilience.call("CIVIC", rkey, go)
+    return {keys[i]: v for i, v in got.items()}
+
+async def _fetch_chunk(pairs: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    """Un lote. Si algunos alias fallan se reenvían partidos en mitades hasta aislar las
+    variantes problemáticas; un fallo del lote entero no se reintenta (ya lo hizo http_clients)."""
+    try:
+        out = await _post_batch(pairs)
+    except UpstreamError:
+        return {}
+    failed = [p for p in pairs if cache_key(*p) not in out]
+    if not failed or len(pairs) == 1:
+        return out
+    half = (len(failed) + 1) // 2
+    parts = [failed] if len(failed) == 1 else [failed[:half], failed[half:]]
+    for res in await asyncio.gather(*(_fetch_chunk(part) for part in parts)):
+        out.update(res)
+    return out
+
+async def fetch_many_async(pairs: Iterable[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    """Consulta de red (sin cache) de muchas variantes en lotes de hasta CIVIC_BATCH_SIZE.
+    Devuelve {cache_key: resultado}; las variantes que fallaron quedan ausentes."""
+    out: Dict[str, Dict[str, Any]] = {}
+    uniq = list(dict.fromkeys(pairs))
+    if kb.mode() != kb.NETWORK:
+        out.update(await asyncio.to_thread(_local_many, uniq))
+        uniq = [p for p in uniq if cache_key(*p) not in out]
+    chunks = [uniq[i:i + CIVIC_BATCH_SIZE] for i in range(0, len(uniq), CIVIC_BATCH_SIZE)]
+    sem = asyncio.Semaphore(CIVIC_BATCH_CONCURRENCY)
+
+    async def run(chunk: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        async with sem:
+            return await _fetch_chunk(chunk)
+
+    for res in await asyncio.gather(*(run(c) for c in chunks)):
+        out.update(res)
+    return out
+
+def _local_many(pairs: Iterable[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for gene, pc in pairs:
+        local = local_lookup(gene, pc)
+        if local is not None:
+            out[cache_key(gene, pc)] = local
+    return out
+
+async def query_variants_async(pairs: Iterable[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    """Versión por lotes de query_variant_async. Devuelve {cache_key: resultado}; las variantes
+    que fallaron quedan ausentes."""
+    return await batch_lookup.lookup_many(
+        "CIVIC", {cache_key(g, pc): (g, pc) for g, pc in pairs}, fetch_async, fetch_many_async)
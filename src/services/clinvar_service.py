@@ -1,34 +1,70 @@
-from typing import Any, Dict, List
-import httpx
+import asyncio, hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from urllib.parse import urlencode
 
-from ..core.config import CLINVAR_EUTILS, CLINVAR_SUMMARY, NCBI_API_KEY, HTTP_TIMEOUT
+from ..core.config import (
+    CLINVAR_EUTILS, CLINVAR_SUMMARY, NCBI_API_KEY, NCBI_RATE_LIMIT, CLINVAR_BATCH_SIZE,
+)
 from ..core.database import cache_get, cache_set
+from ..core import http_clients, resilience, ratelimit, kb
+from ..core.resilience import UpstreamError
+from . import batch_lookup
+
+# Todas las llamadas a E-utilities (pings incluidos) pasan por el cupo de NCBI
+http_clients.set_limiter("CLINVAR", ratelimit.TokenBucket("NCBI", NCBI_RATE_LIMIT))
+
+_SUMMARY_PAGE = 500  # ids por esummary del lote
 
 def ping() -> bool:
     try:
-        with httpx.Client(timeout=HTTP_TIMEOUT) as c:
-            r = c.get(CLINVAR_EUTILS, params={"db":"clinvar","term":"EGFR","retmode":"json"})
-            return r.status_code == 200
+        r = http_clients.request("CLINVAR", "GET", CLINVAR_EUTILS, retries=0,
+                                 params={"db":"clinvar","term":"EGFR","retmode":"json"})
+        return r.status_code == 200
     except Exception:
         return False
 
+async def ping_async(timeout: float) -> bool:
+    r = await http_clients.arequest("CLINVAR", "GET", CLINVAR_EUTILS, retries=0, timeout=timeout,
+                                    params={"db":"clinvar","term":"EGFR","retmode":"json"})
+    return r.status_code == 200
+
+def _search_params(term: str, retmax: int) -> Dict[str, str]:
+    params = {"db":"clinvar","term":term,"retmode":"json","retmax":str(retmax)}
+    if NCBI_API_KEY: params["api_key"] = NCBI_API_KEY
+    return params
+
+def _summary_params(ids: List[str]) -> Dict[str, str]:
+    params = {"db":"clinvar","retmode":"json","id":",".join(ids)}
+    if NCBI_API_KEY: params["api_key"] = NCBI_API_KEY
+    return params
+
+def _summary_docs(j: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # esummary devuelve {"result": {"uids": [...], "<uid>": {...}}}
+    result = j.get("result") or {}
+    return [result[uid] for uid in (result.get("uids") or []) if uid in result]
+
+def _json(r) -> Dict[str, Any]:
+    if r.status_code != 200:
+        raise UpstreamError(f"CLINVAR HTTP {r.status_code}")
+    j = r.json()
+    # E-utilities a veces responde 200 con {"error": ...} (p.ej. rate limit)
+    if isinstance(j, dict) and j.get("error"):
+        raise UpstreamError(f"CLINVAR: {j['error']}")
+    return j
+
+def _ids(j: Dict[str, Any]) -> List[str]:
+    return j.get("esearchresult",{}).get("idlist",[]) or []
+
 def search_ids(term: str, retmax: int = 5) -> List[str]:
     key = f"CLINVAR::search::{term}::{retmax}"
     data, ok = cache_get("CLINVAR", key)
     if ok and data is not None:
         return data
-    ids: List[str] = []
     try:
-        params = {"db":"clinvar","term":term,"retmode":"json","retmax":str(retmax)}
-        if NCBI_API_KEY: params["api_key"] = NCBI_API_KEY
-        with httpx.Client(timeout=HTTP_TIMEOUT) as c:
-            r = c.get(CLINVAR_EUTILS, params=params)
-            if r.status_code == 200:
-                j = r.json()
-                ids = j.get("esearchresult",{}).get("idlist",[]) or []
-    except Exception:
-        pass
+        ids = resilience.call_sync("CLINVAR", key, lambda: _ids(_json(
+            http_clients.request("CLINVAR", "GET", CLINVAR_EUTILS, params=_search_params(term, retmax)))))
+    except UpstreamError:
+        return []
     cache_set("CLINVAR", key, ids)
     return ids
 
@@ -38,21 +74,115 @@ def summaries(ids: List[str]) -> List[Dict[str, Any]]:
     data, ok = cache_get("CLINVAR", key)
     if ok and data is not None:
         return data
-    out: List[Dict[str, Any]] = []
     try:
-        params = {"db":"clinvar","retmode":"json","id":",".join(ids)}
-        if NCBI_API_KEY: params["api_key"] = NCBI_API_KEY
-        with httpx.Client(timeout=HTTP_TIMEOUT) as c:
-            r = c.get(CLINVAR_SUMMARY, params=params)
-            if r.status_code == 200:
-                j = r.json()
-                out = list((j.get("result") or {}).values())
-    except Exception:
-        pass
+        out = resilience.call_sync("CLINVAR", key, lambda: _summary_docs(_json(
+            http_clients.request("CLINVAR", "GET", CLINVAR_SUMMARY, params=_summary_params(ids)))))
+    except UpstreamError:
+        return []
     cache_set("CLINVAR", key, out)
     return out
 
+def local_lookup(gene: str, protein_change: str) -> Optional[List[Dict[str, Any]]]:
+    """Documentos desde la base local según PROVIDER_MODE; None si corresponde ir a la red."""
+    if kb.mode() == kb.NETWORK:
+        return None
+    docs = kb.clinvar_docs(gene, protein_change) if kb.has_source("CLINVAR") else []
+    return None if kb.network_allowed(bool(docs)) else docs
+
 def find_variant_summary(gene: str, protein_change: str) -> List[Dict[str, Any]]:
+    local = local_lookup(gene, protein_change)
+    if local is not None:
+        return local
     term = f"{gene}[gene] AND {protein_change}"
     ids = search_ids(term, 5)
     return summaries(ids)
+
+def cache_key(gene: str, protein_change: str) -> str:
+    # Clave por variante (esearch + esummary juntos) usada por el pipeline en lote
+    return f"CLINVAR::variant::{gene}::{protein_change}"
+
+def _term(gene: str, protein_change: str) -> str:
+    return f"{gene}[gene] AND {protein_change}"
+
+async def _search_async(gene: str, protein_change: str) -> List[str]:
+    """esearch de una variante: los 5 ids más relevantes."""
+    r = await http_clients.arequest("CLINVAR", "GET", CLINVAR_EUTILS,
+                                    params=_search_params(_term(gene, protein_change), 5))
+    return _ids(_json(r))
+
+async def fetch_async(gene: str, protein_change: str) -> List[Dict[str, Any]]:
+    """esearch + esummary de red (sin cache) para una variante. Levanta UpstreamError si falla."""
+    local = await asyncio.to_thread(local_lookup, gene, protein_change) if kb.mode() != kb.NETWORK else None
+    if local is not None:
+        return local
+    ids = await _search_async(gene, protein_change)
+    if not ids:
+        return []
+    r = await http_clients.arequest("CLINVAR", "GET", CLINVAR_SUMMARY, params=_summary_params(ids))
+    return _summary_docs(_json(r))
+
+async def _summaries_by_id(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """esummary de muchos ids (POST, en páginas de _SUMMARY_PAGE) -> {uid: documento}."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for start in range(0, len(ids), _SUMMARY_PAGE):
+        page = ids[start:start + _SUMMARY_PAGE]
+        # POST: con muchos ids la URL excede lo que acepta E-utilities
+        r = await http_clients.arequest("CLINVAR", "POST", CLINVAR_SUMMARY, data=_summary_params(page))
+        result = _json(r).get("result") or {}
+        out.update((uid, result[uid]) for uid in page if uid in result)
+    return out
+
+async def _fetch_chunk(pairs: List[Tuple[str, str]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Un lote: un esearch por variante (los mismos 5 ids que fetch_async, así el lote y el
+    camino individual guardan lo mismo bajo la misma clave) y un solo esummary con todos los
+    ids, repartido por variante. Los esearch salen juntos y los pace el limitador de NCBI.
+    No se usa un esearch combinado (términos con OR y usehistory/WebEnv): sus ids no dicen a
+    qué variante corresponden ni respetan el tope de 5 por variante."""
+    keys = [cache_key(*p) for p in pairs]
+
+    async def search(key: str, pair: Tuple[str, str]) -> Optional[List[str]]:
+        try:
+            return await resilience.call("CLINVAR", key, lambda: _search_async(*pair))
+        except UpstreamError:
+            return None
+
+    found = await asyncio.gather(*(search(k, p) for k, p in zip(keys, pairs)))
+    # Las variantes cuyo esearch falló quedan ausentes (no se cachean)
+    ids_by_key = {k: ids for k, ids in zip(keys, found) if ids is not None}
+    all_ids = list(dict.fromkeys(i for ids in ids_by_key.values() for i in ids))
+    docs: Dict[str, Dict[str, Any]] = {}
+    if all_ids:
+        rkey = "batch::" + hashlib.sha1("|".join(keys).encode()).hexdigest()[:16]
+        try:
+            docs = await resilience.call("CLINVAR", rkey, lambda: _summaries_by_id(all_ids))
+        except UpstreamError:
+            return {k: [] for k, ids in ids_by_key.items() if not ids}
+    return {k: [docs[i] for i in ids if i in docs] for k, ids in ids_by_key.items()}
+
+async def fetch_many_async(pairs: Iterable[Tuple[str, str]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Consulta de red (sin cache) de muchas variantes en lotes de hasta CLINVAR_BATCH_SIZE
+    variantes por esummary. Devuelve {cache_key: documentos}; las variantes que fallaron quedan ausentes.
+    El ritmo lo marca el limitador de NCBI, no hace falta acotar la concurrencia aparte."""
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    uniq = list(dict.fromkeys(pairs))
+    if kb.mode() != kb.NETWORK:
+        out.update(await asyncio.to_thread(_local_many, uniq))
+        uniq = [p for p in uniq if cache_key(*p) not in out]
+    chunks = [uniq[i:i + CLINVAR_BATCH_SIZE] for i in range(0, len(uniq), CLINVAR_BATCH_SIZE)]
+    for res in await asyncio.gather(*(_fetch_chunk(c) for c in chunks)):
+        out.update(res)
+    return out
+
+def _local_many(pairs: Iterable[Tuple[str, str]]) -> Dict[str, List[Dict[str, Any]]]:
+    out = {}
+    for gene, pc in pairs:
+        local = local_lookup(gene, pc)
+        if local is not None:
+            out[cache_key(gene, pc)] = local
+    return out
+
+async def find_variant_summaries_async(pairs: Iterable[Tuple[str, str]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Versión por lotes y con cache de fetch_async (cache, base local y red vía batch_lookup).
+    Devuelve {cache_key: documentos}."""
+    return await batch_lookup.lookup_many(
+        "CLINVAR", {cache_key(g, pc): (g, pc) for g, pc in pairs}, fetch_async, fetch_many_async)
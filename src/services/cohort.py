@@ -0,0 +1,258 @@
+import asyncio, json, os, sqlite3, tempfile, time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from ..core.config import COHORT_WINDOW, COHORT_DEADLINE, COHORT_SPILL_BATCH
+from ..utils.tumor_utils import validar_tumor, normalizar_tumor
+from ..utils.vcf_parser import VcfParser, iter_lines, variant_key
+from ..utils.pathology_utils import extract_variants_from_text
+from . import pipeline
+
+# Análisis de una cohorte completa (NDJSON de pacientes o VCF multi-muestra). Los pacientes se
+# procesan en ventanas de COHORT_WINDOW: dentro de cada ventana los pares (gen, cambio) se
+# deduplican y se anotan una sola vez por los caminos en lote del pipeline; lo que ya se anotó
+# en ventanas anteriores sale del cache, así que ninguna variante repetida vuelve a la red.
+# Los resultados se emiten por paciente, en el orden de entrada, al cerrar cada ventana.
+
+Patient = Dict[str, Any]
+
+NDJSON, VCF = "ndjson", "vcf"
+
+def detect_format(filename: Optional[str], first_line: str = "") -> str:
+    if ".vcf" in (filename or "").lower() or first_line.startswith("##fileformat=VCF"):
+        return VCF
+    return NDJSON
+
+def sniff_format(fileobj, filename: Optional[str]) -> str:
+    """detect_format de un archivo de lote sin consumirlo (vuelve al inicio): para validar
+    antes de empezar a responder."""
+    first = next((line for line in iter_lines(fileobj) if line.strip()), "")
+    fileobj.seek(0)
+    return detect_format(filename, first)
+
+def _variant(it: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Variante de entrada con el mismo criterio que /analyze/unified (sin 'p.', en mayúsculas)."""
+    if not (isinstance(it, dict) and it.get("gene") and it.get("protein_change")):
+        return None
+    var = {"gene": str(it["gene"]).upper(), "protein_change": str(it["protein_change"]).replace("p.", "").upper()}
+    if pipeline.has_coords(it):
+        var.update(chrom=str(it["chrom"]), pos=it["pos"], ref=it["ref"], alt=it["alt"])
+    return var
+
+def patient_from_json(obj: Dict[str, Any], default_tumor: Optional[str] = None, n: int = 0) -> Patient:
+    """Paciente de una línea NDJSON: pseudonym, tumor_type, variants (o manual_variants),
+    biomarkers y pathology_report, todos opcionales salvo el tumor (o el del lote)."""
+    variants = [v for v in map(_variant, (obj.get("variants") or []) + (obj.get("manual_variants") or [])) if v]
+    if obj.get("pathology_report"):
+        variants.extend(extract_variants_from_text(obj["pathology_report"]))
+    bios = obj.get("biomarkers") or []
+    return {
+        "pseudonym": str(obj.get("pseudonym") or obj.get("id") or f"#{n}"),
+        "tumor_type": obj.get("tumor_type") or default_tumor or "",
+        "variants": variants,
+        "biomarkers": bios if isinstance(bios, list) else [],
+    }
+
+async def ndjson_patients(lines: AsyncIterable[str], default_tumor: Optional[str] = None) -> AsyncIterator[Patient]:
+    n = 0
+    async for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        n += 1
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError("se esperaba un objeto")
+        except ValueError as e:
+            yield {"pseudonym": f"#{n}", "error": f"Línea {n} inválida: {e}"}
+            continue
+        yield patient_from_json(obj, default_tumor, n)
+
+class _SampleSpill:
+    """Registros por muestra volcados a un SQLite temporal: la memoria queda acotada a un tramo
+    de COHORT_SPILL_BATCH registros mientras se lee y a una muestra cuando se devuelven."""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="pgx-cohort-", suffix=".sqlite")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(
+            "PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;"
+            "CREATE TABLE spill (sample INTEGER NOT NULL, key TEXT NOT NULL, rec TEXT NOT NULL,"
+            " UNIQUE (sample, key));"
+        )
+
+    def _insert(self, rows: List[Tuple[int, str, str]]) -> None:
+        # Igual que process_vcf_file: una entrada por (gen, cambio) o coordenadas y muestra
+        self.conn.executemany("INSERT OR IGNORE INTO spill (sample, key, rec) VALUES (?, ?, ?)", rows)
+        self.conn.commit()
+
+    async def add(self, rows: List[Tuple[int, str, str]]) -> None:
+        if rows:
+            await asyncio.to_thread(self._insert, rows)
+
+    def _sample(self, i: int) -> List[Dict[str, Any]]:
+        cur = self.conn.execute("SELECT rec FROM spill WHERE sample = ? ORDER BY rowid", (i,))
+        return [json.loads(r) for (r,) in cur]
+
+    async def sample(self, i: int) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._sample, i)
+
+    def close(self) -> None:
+        self.conn.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+async def vcf_patients(lines: AsyncIterable[str], tumor_type: Optional[str] = None) -> AsyncIterator[Patient]:
+    """Un paciente por muestra del VCF. Las muestras están repartidas por todo el archivo, así que
+    ningún paciente está completo antes del final; los registros se vuelcan por muestra a un SQLite
+    temporal y se leen de vuelta de a una muestra, de modo que la memoria no crece con
+    sitios × muestras."""
+    parser = VcfParser()
+    spill = _SampleSpill()
+    try:
+        rows: List[Tuple[int, str, str]] = []
+        async for line in lines:
+            for i, rec in parser.parse_line_samples(line):
+                rows.append((i, json.dumps(variant_key(rec)), json.dumps(rec.to_dict())))
+            if len(rows) >= COHORT_SPILL_BATCH:
+                await spill.add(rows)
+                rows = []
+        await spill.add(rows)
+        for i, name in enumerate(parser.samples or ["muestra"]):
+            yield {
+                "pseudonym": name, "tumor_type": tumor_type or "",
+                "variants": await spill.sample(i), "biomarkers": [],
+            }
+    finally:
+        await asyncio.to_thread(spill.close)
+
+async def read_patients(lines: AsyncIterable[str], filename: Optional[str] = None,
+                        tumor_type: Optional[str] = None) -> AsyncIterator[Patient]:
+    """Pacientes del archivo de lote; el formato sale del nombre o de la primera línea."""
+    it = lines.__aiter__()
+    first = ""
+    async for line in it:
+        if line.strip():
+            first = line
+            break
+
+    async def chained() -> AsyncIterator[str]:
+        if first:
+            yield first
+        async for line in it:
+            yield line
+
+    if detect_format(filename, first) == VCF:
+        source = vcf_patients(chained(), tumor_type)
+    else:
+        source = ndjson_patients(chained(), tumor_type)
+    async for p in source:
+        yield p
+
+def _variant_key(var: Dict[str, Any]) -> Tuple:
+    v = pipeline.normalize_variant(var)
+    coords = (str(var["chrom"]), str(var["pos"]), var["ref"], var["alt"]) if pipeline.has_coords(var) else ()
+    return (v["gene"], v["protein_change"]) + coords
+
+def _patient_meta(variants: List[Dict[str, Any]], anns: List[Dict[str, Any]], meta: Dict[str, Any]) -> Dict[str, Any]:
+    """De las fuentes que fallaron en la ventana, las que le faltan a este paciente."""
+    missing = set()
+    for var, ann in zip(variants, anns):
+        for name, value in ann.items():
+            if value is None and (name != "VEP" or pipeline.has_coords(var)):
+                missing.add(pipeline.SOURCE_NAMES.get(name, name))
+    return {"stale_sources": meta["stale_sources"],
+            "failed_sources": [s for s in meta["failed_sources"] if s in missing]}
+
+async def _run_window(batch: List[Patient], deadline: float, stats: Dict[str, int]) -> List[Dict[str, Any]]:
+    ready: List[Patient] = []
+    out: List[Optional[Dict[str, Any]]] = []
+    for p in batch:
+        if "error" not in p:
+            ok, msg, sug = validar_tumor(p["tumor_type"])
+            if not ok:
+                p = {"pseudonym": p["pseudonym"], "error": msg, "suggestions": sug}
+            else:
+                p = {**p, "tumor_type": normalizar_tumor(p["tumor_type"])}
+        if "error" in p:
+            stats["errors"] += 1
+            out.append({"type": "patient", **p})
+            continue
+        ready.append(p)
+        out.append(None)
+
+    # Registros de VCF sin anotar: gen y cambio desde VEP, en un solo lote para la ventana
+    flat = await pipeline.fill_from_vep([v for p in ready for v in p["variants"]], deadline)
+    resolved = iter(flat)
+    ready = [{**p, "variants": [next(resolved) for _ in p["variants"]]} for p in ready]
+
+    # Una sola anotación por variante distinta de la ventana
+    unique: Dict[Tuple, Dict[str, Any]] = {}
+    for p in ready:
+        for var in p["variants"]:
+            unique.setdefault(_variant_key(var), var)
+        stats["variant_calls"] += len(p["variants"])
+    stats["window_unique_variants"] += len(unique)
+    by_key: Dict[Tuple, Dict[str, Any]] = {}
+    meta: Dict[str, Any] = {"stale_sources": [], "failed_sources": []}
+    if unique:
+        anns, meta = await pipeline.annotate_variants(list(unique.values()), deadline=deadline)
+        by_key = dict(zip(unique, anns))
+
+    it = iter(ready)
+    for i, slot in enumerate(out):
+        if slot is not None:
+            continue
+        p = next(it)
+        anns = [by_key[_variant_key(v)] for v in p["variants"]]
+        report = pipeline.build_report(p["pseudonym"], p["tumor_type"], p["variants"], p["biomarkers"],
+                                       anns, _patient_meta(p["variants"], anns, meta))
+        out[i] = {"type": "patient", "pseudonym": p["pseudonym"], "tumor_type": p["tumor_type"], **report}
+    return out  # type: ignore[return-value]
+
+async def analyze_patient(patient: Patient, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Un solo paciente por el mismo camino que el lote (lo usan los trabajos en cola)."""
+    stats = {"errors": 0, "variant_calls": 0, "window_unique_variants": 0}
+    return (await _run_window([patient], deadline or COHORT_DEADLINE, stats))[0]
+
+async def analyze_cohort(
+    patients: AsyncIterable[Patient],
+    window: Optional[int] = None,
+    deadline: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Resultados por paciente (type=patient) en el orden de entrada y, al final, un resumen
+    (type=summary). En memoria hay como mucho una ventana de pacientes."""
+    window = max(1, window or COHORT_WINDOW)
+    stats = {"patients": 0, "errors": 0, "variant_calls": 0, "window_unique_variants": 0, "windows": 0}
+    started = time.time()
+    batch: List[Patient] = []
+
+    async def flush() -> List[Dict[str, Any]]:
+        stats["windows"] += 1
+        return await _run_window(batch, deadline or COHORT_DEADLINE, stats)
+
+    async for p in patients:
+        stats["patients"] += 1
+        batch.append(p)
+        if len(batch) >= window:
+            for res in await flush():
+                yield res
+            batch = []
+    if batch:
+        for res in await flush():
+            yield res
+    elapsed = time.time() - started
+    yield {"type": "summary", **stats, "elapsed_s": round(elapsed, 3),
+           "patients_per_s": round(stats["patients"] / elapsed, 1) if elapsed else stats["patients"]}
+
+async def ndjson_lines(results: AsyncIterable[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for res in results:
+        yield (json.dumps(res, ensure_ascii=False) + "\n").encode("utf-8")
+
+async def aiter_sync(lines: Iterable[str]) -> AsyncIterator[str]:
+    """Adapta un iterador de líneas síncrono (archivo en disco, CLI) a la interfaz del lote."""
+    for line in lines:
+        yield line
@@ -1,38 +1,167 @@
-from typing import Any, Dict, List
-import httpx
+import asyncio, hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from ..core.config import ONCOKB_URL, ONCOKB_TOKEN, HTTP_TIMEOUT
+from ..core.config import ONCOKB_URL, ONCOKB_TOKEN, ONCOKB_BATCH_SIZE, ONCOKB_BATCH_CONCURRENCY, ONCOKB_REFERENCE_GENOME
 from ..core.database import cache_get, cache_set
+from ..core import http_clients, singleflight, resilience
+from ..core.resilience import UpstreamError
+from . import batch_lookup
+
+# El pipeline pasa (chrom, pos, ref, alt) además de (gen, cambio) cuando la variante los trae
+ACCEPTS_COORDS = True
 
 def ping() -> bool:
     # NO rompemos si no hay token. Si hay token y responde 200 -> OK; sin token devolvemos False (chip gris/rojo).
     if not ONCOKB_TOKEN:
         return False
     try:
-        with httpx.Client(timeout=HTTP_TIMEOUT) as c:
-            r = c.get(f"{ONCOKB_URL}/utils/info", headers={"Authorization": f"Bearer {ONCOKB_TOKEN}"})
-            return r.status_code == 200
+        r = http_clients.request("ONCOKB", "GET", f"{ONCOKB_URL}/utils/info", retries=0,
+                                 headers={"Authorization": f"Bearer {ONCOKB_TOKEN}"})
+        return r.status_code == 200
     except Exception:
         return False
 
+async def ping_async(timeout: float) -> Optional[bool]:
+    # Sin token no hay nada que sondear: None = no configurado (no cuenta como fallo)
+    if not ONCOKB_TOKEN:
+        return None
+    r = await http_clients.arequest("ONCOKB", "GET", f"{ONCOKB_URL}/utils/info", retries=0, timeout=timeout,
+                                    headers={"Authorization": f"Bearer {ONCOKB_TOKEN}"})
+    return r.status_code == 200
+
+def cache_key(gene: str, protein_change: str, *coords: str) -> str:
+    # La clave es por variante aunque la consulta haya ido por coordenadas
+    return f"ONCOKB::{gene}::{protein_change}"
+
+def _headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {ONCOKB_TOKEN}"}
+
+def _genomic_location(chrom: str, pos: str, ref: str, alt: str) -> str:
+    # Formato de OncoKB: "cromosoma,inicio,fin,ref,alt" (sin prefijo chr)
+    chrom = chrom[3:] if chrom.lower().startswith("chr") else chrom
+    end = int(pos) + max(len(ref), 1) - 1
+    return f"{chrom},{pos},{end},{ref},{alt}"
+
+def _get_params(gene: str, protein_change: str, coords: Tuple[str, ...]) -> Tuple[str, Dict[str, str]]:
+    if len(coords) == 4:
+        return "byGenomicChange", {"genomicLocation": _genomic_location(*coords),
+                                   "referenceGenome": ONCOKB_REFERENCE_GENOME}
+    return "byProteinChange", {"hugoSymbol": gene, "alteration": protein_change}
+
+def _parse(r) -> Dict[str, Any]:
+    if r.status_code != 200:
+        raise UpstreamError(f"ONCOKB HTTP {r.status_code}")
+    return r.json()
+
+def fetch(gene: str, protein_change: str, *coords: str) -> Dict[str, Any]:
+    """Consulta de red (sin cache). Sin token devuelve vacío sin salir a la red."""
+    if not ONCOKB_TOKEN:
+        return {"data": []}
+    endpoint, params = _get_params(gene, protein_change, coords)
+    r = http_clients.request("ONCOKB", "GET", f"{ONCOKB_URL}/annotate/mutations/{endpoint}",
+                             params=params, headers=_headers())
+    return _parse(r)
+
+async def fetch_async(gene: str, protein_change: str, *coords: str) -> Dict[str, Any]:
+    """Versión async de fetch; el pipeline resuelve el cache en lote."""
+    if not ONCOKB_TOKEN:
+        return {"data": []}
+    endpoint, params = _get_params(gene, protein_change, coords)
+    r = await http_clients.arequest("ONCOKB", "GET", f"{ONCOKB_URL}/annotate/mutations/{endpoint}",
+                                    params=params, headers=_headers())
+    return _parse(r)
+
 def annotate(gene: str, protein_change: str) -> Dict[str, Any]:
     """Anotación básica de OncoKB por gen/aaChange. Degrada graciosamente sin token."""
-    key = f"ONCOKB::{gene}::{protein_change}"
+    key = cache_key(gene, protein_change)
     data, ok = cache_get("ONCOKB", key)
     if ok and data:
         return data
-    out: Dict[str, Any] = {"data": []}
-    if not ONCOKB_TOKEN:
-        cache_set("ONCOKB", key, out)
-        return out
     try:
-        params = {"hugoSymbol": gene, "alteration": protein_change}
-        with httpx.Client(timeout=HTTP_TIMEOUT) as c:
-            r = c.get(f"{ONCOKB_URL}/annotate/mutations/byGenomicChange", params=params,
-                      headers={"Authorization": f"Bearer {ONCOKB_TOKEN}"})
-            if r.status_code == 200:
-                out = r.json()
-    except Exception:
-        pass
+        out = resilience.call_sync("ONCOKB", key, lambda: fetch(gene, protein_change))
+    except UpstreamError:
+        return {"data": []}
     cache_set("ONCOKB", key, out)
     return out
+
+async def annotate_async(gene: str, protein_change: str) -> Dict[str, Any]:
+    """Versión async de annotate: no bloquea el event loop."""
+    key = cache_key(gene, protein_change)
+    data, ok = cache_get("ONCOKB", key)
+    if ok and data:
+        return data
+    try:
+        out, written = await singleflight.do(
+            "ONCOKB", key, lambda: resilience.call("ONCOKB", key, lambda: fetch_async(gene, protein_change)))
+    except UpstreamError:
+        return {"data": []}
+    if not written:
+        cache_set("ONCOKB", key, out)
+    return out
+
+def _query(item: Tuple[str, ...]) -> Dict[str, Any]:
+    gene, pc, coords = item[0], item[1], item[2:]
+    if len(coords) == 4:
+        return {"id": cache_key(gene, pc), "genomicLocation": _genomic_location(*coords),
+                "referenceGenome": ONCOKB_REFERENCE_GENOME}
+    return {"id": cache_key(gene, pc), "gene": {"hugoSymbol": gene}, "alteration": pc}
+
+async def _post_batch(endpoint: str, queries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Un POST a annotate/mutations/<endpoint>; devuelve {cache_key: anotación}."""
+    async def go():
+        r = await http_clients.arequest("ONCOKB", "POST", f"{ONCOKB_URL}/annotate/mutations/{endpoint}",
+                                        json=queries, headers=_headers())
+        items = _parse(r)
+        if not isinstance(items, list):
+            raise UpstreamError("ONCOKB: respuesta de lote inesperada")
+        return items
+    ids = [q["id"] for q in queries]
+    rkey = "batch::" + hashlib.sha1("|".join(ids).encode()).hexdigest()[:16]
+    items = await resilience.call("ONCOKB", rkey, go)
+    out = {}
+    # OncoKB responde en el orden del pedido y repite el id en query.id
+    for i, it in enumerate(items):
+        if not isinstance(it, dict):
+            continue
+        key = (it.get("query") or {}).get("id") or (ids[i] if i < len(ids) else None)
+        if key in ids:
+            out[key] = it
+    return out
+
+async def fetch_many_async(items: Iterable[Tuple[str, ...]]) -> Dict[str, Dict[str, Any]]:
+    """Consulta de red (sin cache) de muchas variantes: las que traen coordenadas van a
+    byGenomicChange y el resto a byProteinChange, en POSTs de hasta ONCOKB_BATCH_SIZE.
+    Devuelve {cache_key: anotación}; las variantes de lotes que fallaron quedan ausentes."""
+    by_key: Dict[str, Tuple[str, ...]] = {}
+    for item in items:
+        by_key.setdefault(cache_key(*item), item)
+    if not ONCOKB_TOKEN:
+        return {k: {"data": []} for k in by_key}
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for item in by_key.values():
+        groups.setdefault("byGenomicChange" if len(item) == 6 else "byProteinChange", []).append(_query(item))
+    sem = asyncio.Semaphore(ONCOKB_BATCH_CONCURRENCY)
+
+    async def run(endpoint: str, chunk: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        async with sem:
+            try:
+                return await _post_batch(endpoint, chunk)
+            except UpstreamError:
+                return {}
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for res in await asyncio.gather(*(run(endpoint, qs[i:i + ONCOKB_BATCH_SIZE])
+                                      for endpoint, qs in groups.items()
+                                      for i in range(0, len(qs), ONCOKB_BATCH_SIZE))):
+        out.update(res)
+    return out
+
+async def annotate_many_async(items: Iterable[Tuple[str, ...]]) -> Dict[str, Dict[str, Any]]:
+    """Versión por lotes de annotate_async. items = (gen, cambio) o (gen, cambio, chrom, pos,
+    ref, alt). Devuelve {cache_key: anotación}."""
+    by_key: Dict[str, Tuple[str, ...]] = {}
+    for item in items:
+        k = cache_key(*item)
+        if len(item) > len(by_key.get(k, ())):
+            by_key[k] = tuple(item)
+    return await batch_lookup.lookup_many("ONCOKB", by_key, fetch_async, fetch_many_async)
@@ -0,0 +1,493 @@
+import asyncio, time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..core.config import ANNOTATION_CONCURRENCY, ANNOTATION_DEADLINE
+from ..core.database import cache_lookup_many, cache_set_many
+from ..core import singleflight, revalidate, resilience, kb
+from ..core.resilience import UpstreamError
+from ..utils.evidence import local_actions_for_variant
+from . import civic_service, clinvar_service, oncokb_service, vep_service
+
+# Orden fijo de proveedores: define también el orden de los details.
+# Cada servicio expone cache_key(gene, pc) y fetch_async(gene, pc) (red, sin cache); los que
+# además exponen fetch_many_async(pares) -> {cache_key: resultado} reciben sus faltantes en lote.
+# Con ACCEPTS_COORDS=True el servicio recibe también (chrom, pos, ref, alt) si la variante los trae.
+PROVIDERS = {
+    "CIVIC": civic_service,
+    "CLINVAR": clinvar_service,
+    "ONCOKB": oncokb_service,
+}
+
+# Nombre visible de cada proveedor en la respuesta
+SOURCE_NAMES = {"CIVIC": "CIViC", "CLINVAR": "ClinVar", "ONCOKB": "OncoKB", "VEP": "VEP"}
+
+REFS_COMMON = [{"label":"NCCN", "url":"https://www.nccn.org/"}]
+
+def normalize_variant(var: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "gene": (var.get("gene") or "").upper(),
+        "protein_change": (var.get("protein_change") or "").upper(),
+    }
+
+def has_coords(var: Dict[str, Any]) -> bool:
+    return all(var.get(k) not in (None, "") for k in ("chrom", "pos", "ref", "alt"))
+
+def has_gene_change(var: Dict[str, Any]) -> bool:
+    """Los proveedores por (gen, cambio) solo se consultan si la variante trae los dos."""
+    return bool(var.get("gene") and var.get("protein_change"))
+
+async def fill_from_vep(variants: List[Dict[str, Any]], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Completa gen y cambio proteico de los registros de VCF que solo traen coordenadas con
+    la consecuencia más grave de VEP (queda en cache para la anotación). Los que VEP no
+    resuelve siguen como están y se informan solo con la anotación de VEP."""
+    bare = [v for v in variants if has_coords(v) and not has_gene_change(v)]
+    if not bare:
+        return variants
+    try:
+        vep = await asyncio.wait_for(vep_service.annotate_regions(bare), deadline or ANNOTATION_DEADLINE)
+    except asyncio.TimeoutError:
+        return variants
+    out = []
+    for var in variants:
+        if has_coords(var) and not has_gene_change(var):
+            gene, pc = vep_service.gene_and_change(vep.get(vep_service.cache_key(
+                str(var["chrom"]), str(var["pos"]), var["ref"], var["alt"])))
+            var = {**var, "gene": var.get("gene") or gene, "protein_change": var.get("protein_change") or pc}
+        out.append(var)
+    return out
+
+def _local_hits(wanted: Dict[Tuple[str, str], Tuple]) -> Dict[Tuple[str, str], Any]:
+    """Claves que responde la base local (servicios con local_lookup, según PROVIDER_MODE)."""
+    out = {}
+    for pk, args in wanted.items():
+        lookup = getattr(PROVIDERS[pk[0]], "local_lookup", None)
+        if lookup is not None:
+            value = lookup(args[0], args[1])
+            if value is not None:
+                out[pk] = value
+    return out
+
+async def annotate_variants(
+    variants: List[Dict[str, Any]],
+    concurrency: Optional[int] = None,
+    deadline: Optional[float] = None,
+    on_result: Optional[Callable[[str, str, Any], None]] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Anota todas las variantes contra todos los proveedores. El cache se resuelve en una
+    sola consulta y se escribe en una sola transacción; los faltantes salen a la red a la vez,
+    con límite de concurrencia y un tope de tiempo por análisis.
+
+    Devuelve (resultados, meta): resultados es, en el orden de entrada, {proveedor: resultado}
+    (lo que falle o no llegue a tiempo queda en None); meta["stale_sources"] lista las fuentes
+    que se sirvieron vencidas mientras se refrescan en segundo plano y meta["failed_sources"]
+    las que fallaron (error upstream, circuito abierto o deadline).
+
+    on_result(proveedor, clave, valor), si se pasa, se llama con cada resultado apenas está
+    disponible (base local y cache primero, después lo que llega de la red); lo usa el
+    análisis en streaming."""
+    emit = on_result or (lambda provider, key, value: None)
+    norm = [normalize_variant(v) for v in variants]
+    # (proveedor, clave) -> argumentos de fetch_async
+    wanted: Dict[Tuple[str, str], Tuple] = {}
+    for var, v in zip(variants, norm):
+        if not has_gene_change(v):
+            continue
+        for name, svc in PROVIDERS.items():
+            pk = (name, svc.cache_key(v["gene"], v["protein_change"]))
+            args = (v["gene"], v["protein_change"])
+            if getattr(svc, "ACCEPTS_COORDS", False) and has_coords(var):
+                args += (str(var["chrom"]), str(var["pos"]), var["ref"], var["alt"])
+            if len(args) > len(wanted.get(pk, ())):
+                wanted[pk] = args
+
+    found: Dict[Tuple[str, str], Any] = {}
+    if kb.mode() != kb.NETWORK:
+        # La base local va antes que el cache: una release nueva se ve enseguida
+        found.update(await asyncio.to_thread(_local_hits, wanted))
+        for pk, value in found.items():
+            emit(pk[0], pk[1], value)
+    stale_sources = set()
+    pending_keys = [pk for pk in wanted if pk not in found]
+    for pk, (value, stale) in (await asyncio.to_thread(cache_lookup_many, pending_keys)).items():
+        found[pk] = value
+        emit(pk[0], pk[1], value)
+        if stale:
+            # Se sirve ya el valor vencido y se refresca fuera del request
+            svc = PROVIDERS[pk[0]]
+            revalidate.schedule(pk[0], pk[1], lambda svc=svc, args=wanted[pk]: svc.fetch_async(*args))
+            stale_sources.add(SOURCE_NAMES.get(pk[0], pk[0]))
+    fetched: Dict[Tuple[str, str], Any] = {}
+    written = set()
+    failed_sources = set()
+    sem = asyncio.Semaphore(concurrency or ANNOTATION_CONCURRENCY)
+
+    async def run(pk: Tuple[str, str], args: Tuple):
+        fetch = lambda: PROVIDERS[pk[0]].fetch_async(*args)
+        async with sem:
+            try:
+                # Análisis concurrentes con la misma clave comparten una sola consulta upstream;
+                # el breaker corta en milisegundos si el proveedor está caído
+                fetched[pk], shared = await singleflight.do(
+                    pk[0], pk[1], lambda: resilience.call(pk[0], pk[1], fetch))
+                emit(pk[0], pk[1], fetched[pk])
+                if shared:
+                    written.add(pk)
+            except UpstreamError:
+                # Un fallo no es "sin resultados": no se cachea
+                failed_sources.add(SOURCE_NAMES.get(pk[0], pk[0]))
+
+    async def run_batch(name: str, keys: List[str]):
+        svc = PROVIDERS[name]
+        res, shared = await singleflight.do_many(
+            name, keys, lambda ks: svc.fetch_many_async([wanted[(name, k)] for k in ks]))
+        for k, value in res.items():
+            fetched[(name, k)] = value
+            emit(name, k, value)
+        written.update((name, k) for k in shared)
+        if len(res) < len(keys):
+            failed_sources.add(SOURCE_NAMES.get(name, name))
+
+    # Una sola consulta por clave aunque la variante se repita
+    tasks = []
+    batches: Dict[str, List[str]] = {}
+    for pk, args in wanted.items():
+        if pk in found:
+            continue
+        if hasattr(PROVIDERS[pk[0]], "fetch_many_async"):
+            batches.setdefault(pk[0], []).append(pk[1])
+        else:
+            tasks.append(asyncio.create_task(run(pk, args)))
+    tasks += [asyncio.create_task(run_batch(name, keys)) for name, keys in batches.items()]
+    # VEP va por coordenadas (variantes de VCF) y en lotes de hasta VEP_BATCH_SIZE
+    coords = [v for v in variants if has_coords(v)]
+    vep: Dict[str, Any] = {}
+    if coords:
+        async def run_vep():
+            vep.update(await vep_service.annotate_regions(coords))
+            for k, value in vep.items():
+                emit("VEP", k, value)
+        tasks.append(asyncio.create_task(run_vep()))
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=deadline or ANNOTATION_DEADLINE)
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            for pk, _ in wanted.items():
+                if pk not in found and pk not in fetched:
+                    failed_sources.add(SOURCE_NAMES.get(pk[0], pk[0]))
+    vep_keys = [vep_service.cache_key(str(v["chrom"]), str(v["pos"]), v["ref"], v["alt"]) for v in coords]
+    if any(k not in vep for k in vep_keys):
+        failed_sources.add(SOURCE_NAMES["VEP"])
+    to_write = [(p, k, data) for (p, k), data in fetched.items() if (p, k) not in written]
+    if to_write:
+        await asyncio.to_thread(cache_set_many, to_write)
+
+    results: List[Dict[str, Any]] = []
+    for var, v in zip(variants, norm):
+        ann = {}
+        for name, svc in PROVIDERS.items():
+            pk = (name, svc.cache_key(v["gene"], v["protein_change"]))
+            ann[name] = found.get(pk, fetched.get(pk)) if pk in wanted else None
+        ann["VEP"] = None
+        if has_coords(var):
+            ann["VEP"] = vep.get(vep_service.cache_key(str(var["chrom"]), str(var["pos"]), var["ref"], var["alt"]))
+        results.append(ann)
+    return results, {"stale_sources": sorted(stale_sources), "failed_sources": sorted(failed_sources)}
+
+def local_details(gene: str, pc: str, local_actions: list) -> List[Dict[str, Any]]:
+    details = []
+    for act in (local_actions or []):
+        details.append({
+            "action": act.get("action",""),
+            "drug": act.get("drug",""),
+            "variant": {"gene": gene, "protein_change": pc},
+            "strict_badge": bool(act.get("strict", True)),
+            "mechanistic_badge": bool(act.get("mechanistic", True)),
+            "references": (act.get("references") or REFS_COMMON),
+            "study_meta": act.get("study_meta") or {"level":"-"},
+            "sources": act.get("sources") or ["LocalEvidence"],
+            "clinical_context": act.get("clinical_context") or {},
+        })
+    return details
+
+def civic_details(gene: str, pc: str, civic: Any) -> List[Dict[str, Any]]:
+    if not (civic and civic.get("items")):
+        return []
+    top = civic["items"][0]
+    drug = (top.get("drugNames") or [None])[0]
+    return [{
+        "action": "Terapia/Asociación (CIViC)",
+        "drug": drug or "—",
+        "variant": {"gene": gene, "protein_change": pc},
+        "strict_badge": True if top.get("evidenceLevel") in ("A","B","1","2") else False,
+        "mechanistic_badge": True,
+        "references": [{"label": top.get("journal") or "CIViC", "url": top.get("url")}] + REFS_COMMON,
+        "study_meta": {"level": top.get("evidenceLevel") or "-", "year": top.get("year")},
+        "sources": ["CIViC"],
+        "clinical_context": {"why_now": top.get("desc") or "", "timing": top.get("disease") or ""}
+    }]
+
+def clinvar_details(gene: str, pc: str, clin: Any) -> List[Dict[str, Any]]:
+    if not clin:
+        return []
+    return [{
+        "action": "Significado Clínico (ClinVar)",
+        "drug": "—",
+        "variant": {"gene": gene, "protein_change": pc},
+        "strict_badge": False,
+        "mechanistic_badge": False,
+        "references": [{"label":"ClinVar", "url":"https://www.ncbi.nlm.nih.gov/clinvar/"}],
+        "study_meta": {"level": "db", "year": "-"},
+        "sources": ["ClinVar"],
+        "clinical_context": {"why_now": "Resumen de registros", "timing": ""}
+    }]
+
+def _oncokb_known(okb: Any) -> bool:
+    # Respuesta real de annotate (IndicatorQueryResp) o la forma {"data": [...]} sin token
+    if not (okb and isinstance(okb, dict)):
+        return False
+    if "data" in okb:
+        return bool(okb["data"])
+    return bool(okb.get("variantExist") or okb.get("oncogenic") not in (None, "", "Unknown"))
+
+def oncokb_details(gene: str, pc: str, okb: Any) -> List[Dict[str, Any]]:
+    if not _oncokb_known(okb):
+        return []
+    treatments = okb.get("treatments") or []
+    drugs = [d.get("drugName") for d in ((treatments[0].get("drugs") or []) if treatments else []) if d.get("drugName")]
+    level = (okb.get("highestSensitiveLevel") or "").replace("LEVEL_", "")
+    effect = (okb.get("mutationEffect") or {}).get("knownEffect") or ""
+    why = " · ".join(x for x in (okb.get("oncogenic"), effect) if x and x != "Unknown")
+    return [{
+        "action": "Anotación (OncoKB)",
+        "drug": " + ".join(drugs) or "—",
+        "variant": {"gene": gene, "protein_change": pc},
+        "strict_badge": level in ("1", "2"),
+        "mechanistic_badge": True,
+        "references": [{"label":"OncoKB", "url":"https://www.oncokb.org/"}],
+        "study_meta": {"level": level or "KB", "year": "-"},
+        "sources": ["OncoKB"],
+        "clinical_context": {"why_now": why or "Anotación estandarizada", "timing": ""}
+    }]
+
+def vep_details(gene: str, pc: str, vep: Any) -> List[Dict[str, Any]]:
+    if not (vep and isinstance(vep, dict) and vep.get("most_severe_consequence")):
+        return []
+    return [{
+        "action": "Consecuencia (VEP)",
+        "drug": "—",
+        "variant": {"gene": gene, "protein_change": pc},
+        "strict_badge": False,
+        "mechanistic_badge": True,
+        "references": [{"label":"Ensembl VEP", "url":"https://www.ensembl.org/info/docs/tools/vep/"}],
+        "study_meta": {"level": "pred", "year": "-"},
+        "sources": ["VEP"],
+        "clinical_context": {"why_now": vep["most_severe_consequence"], "timing": ""}
+    }]
+
+def rule_details(gene: str, pc: str) -> List[Dict[str, Any]]:
+    """Determinístico mínimo (por si nada devolvió)."""
+    if gene == "EGFR" and ("L858R" in pc or "EX19DEL" in pc or "DEL" in pc):
+        return [{
+            "action": "Terapia dirigida",
+            "drug": "Osimertinib",
+            "variant": {"gene": gene, "protein_change": pc},
+            "strict_badge": True,
+            "mechanistic_badge": True,
+            "references": REFS_COMMON,
+            "study_meta": {"level":"1", "study_type":"Phase III", "year": 2018, "sample_size": 682, "disease": "NSCLC"},
+            "sources": ["Rule"],
+            "clinical_context": {"why_now": "Mutación clásica sensible", "timing":"primera línea", "alternatives": ["Gefitinib","Erlotinib"]}
+        }]
+    if gene == "KRAS" and "G12D" in pc:
+        return [{
+            "action": "Ensayos clínicos",
+            "drug": "KRASi (en desarrollo)",
+            "variant": {"gene": gene, "protein_change": pc},
+            "strict_badge": False,
+            "mechanistic_badge": True,
+            "references": REFS_COMMON,
+            "study_meta": {"level":"Investigacional"},
+            "sources": ["Rule"],
+            "clinical_context": {"why_now": "Mutación KRAS clásica", "timing":"segundas líneas", "alternatives": ["Quimioterapia"]}
+        }]
+    if gene == "BRAF" and "V600E" in pc:
+        return [{
+            "action": "Terapia combinada",
+            "drug": "Dabrafenib + Trametinib",
+            "variant": {"gene": gene, "protein_change": pc},
+            "strict_badge": True,
+            "mechanistic_badge": True,
+            "references": REFS_COMMON,
+            "study_meta": {"level":"2"},
+            "sources": ["Rule"],
+            "clinical_context": {"why_now": "Activación MAPK", "timing":"segundas líneas", "alternatives": ["Vemurafenib"]}
+        }]
+    return []
+
+def variant_details(gene: str, pc: str, local_actions: list, annotations: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Details de una variante en orden fijo: Local, CIViC, ClinVar, OncoKB, VEP, Regla."""
+    civic = annotations.get("CIVIC")
+    clin = annotations.get("CLINVAR")
+    okb = annotations.get("ONCOKB")
+    details = local_details(gene, pc, local_actions)
+    details += civic_details(gene, pc, civic)
+    details += clinvar_details(gene, pc, clin)
+    details += oncokb_details(gene, pc, okb)
+    details += vep_details(gene, pc, annotations.get("VEP"))
+    if not local_actions and not civic and not clin and not _oncokb_known(okb):
+        details += rule_details(gene, pc)
+    return details
+
+TIMELINE = [
+    {"title": "Ingreso de datos", "description": "Se procesaron entradas múltiples", "tags": ["VCF","Manual","Biomarcadores"]},
+    {"title": "Anotación", "description": "Fuentes: Local / CIViC / ClinVar / OncoKB / VEP", "tags": ["Fuentes"]},
+]
+
+def _variant_label(var: Dict[str, Any]) -> str:
+    if not has_gene_change(var) and has_coords(var):
+        # Registro de VCF que VEP no pudo llevar a un cambio proteico
+        return f"{var.get('gene') or ''} {var['chrom']}:{var['pos']} {var['ref']}>{var['alt']}".strip()
+    return f"{var.get('gene','?')} {var.get('protein_change','?')}"
+
+def report_summary(pseudonym: str, tumor_type: str, variants: List[Dict[str, Any]],
+                   biomarkers: List[Dict[str, Any]]) -> str:
+    return (
+        f"Paciente {pseudonym}. Tumor: {tumor_type}. Variantes detectadas: "
+        + (", ".join([_variant_label(v) for v in variants]) or "ninguna")
+        + ". Biomarcadores: "
+        + (", ".join([b.get('name','') for b in (biomarkers or [])]) or "no reportados")
+        + "."
+    )
+
+def build_report(
+    pseudonym: str,
+    tumor_type: str,
+    variants: List[Dict[str, Any]],
+    biomarkers: List[Dict[str, Any]],
+    annotations: List[Dict[str, Any]],
+    meta: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Payload de un paciente (summary, details, fuentes vencidas/fallidas, timeline) a partir
+    de sus variantes y las anotaciones en el mismo orden; lo usan /analyze/unified y el lote."""
+    details = []
+    for var, ann in zip(variants, annotations):
+        v = normalize_variant(var)
+        gene, pc = v["gene"], v["protein_change"]
+        local_actions = local_actions_for_variant(gene, pc, tumor_type)
+        # VEP se incluye solo para variantes con coordenadas (VCF)
+        details.extend(variant_details(gene, pc, local_actions, ann))
+    return {
+        "summary": report_summary(pseudonym, tumor_type, variants, biomarkers),
+        "details": details,
+        # Fuentes servidas desde cache vencido (se están refrescando en segundo plano)
+        "stale_sources": meta["stale_sources"],
+        # Fuentes que fallaron o se saltearon por circuito abierto (resultado parcial)
+        "failed_sources": meta["failed_sources"],
+        "timeline": TIMELINE,
+    }
+
+# Details por fuente, en el mismo orden que variant_details
+_SOURCE_DETAILS = {
+    "CIVIC": civic_details, "CLINVAR": clinvar_details, "ONCOKB": oncokb_details, "VEP": vep_details,
+}
+
+async def stream_report(
+    pseudonym: str,
+    tumor_type: str,
+    variants: List[Dict[str, Any]],
+    biomarkers: List[Dict[str, Any]],
+) -> AsyncIterator[Dict[str, Any]]:
+    """Eventos del análisis a medida que hay resultados: "start", un "details" por fuente y
+    variante (evidencia local primero, después cache y red en orden de llegada), las reglas
+    de respaldo al final y "report" con el payload completo de build_report.
+
+    Los registros de VCF que solo traen coordenadas no frenan al resto: se resuelven con VEP
+    en paralelo y, cuando llegan, se emite "variant" (variant_index y su gen y cambio) y
+    después sus details como los de cualquier otra variante."""
+    started = time.monotonic()
+    ms = lambda: int((time.monotonic() - started) * 1000)
+    variants = list(variants)
+    norm = [normalize_variant(v) for v in variants]
+    yield {"event": "start", "t_ms": ms(), "variants": norm}
+
+    local: List[list] = [[] for _ in variants]
+    # (proveedor, clave de cache) -> índices de las variantes que la usan
+    by_key: Dict[Tuple[str, str], List[int]] = {}
+
+    def register(i: int) -> Iterator[Dict[str, Any]]:
+        v = norm[i]
+        local[i] = local_actions_for_variant(v["gene"], v["protein_change"], tumor_type)
+        details = local_details(v["gene"], v["protein_change"], local[i])
+        if details:
+            yield {"event": "details", "t_ms": ms(), "source": "Local", "variant_index": i, "details": details}
+        for name, svc in (PROVIDERS.items() if has_gene_change(v) else ()):
+            by_key.setdefault((name, svc.cache_key(v["gene"], v["protein_change"])), []).append(i)
+
+    bare = [i for i, v in enumerate(variants) if has_coords(v) and not has_gene_change(v)]
+    ready = [i for i, v in enumerate(variants) if not (has_coords(v) and not has_gene_change(v))]
+    for i in ready:
+        for ev in register(i):
+            yield ev
+    for i, var in enumerate(variants):
+        if has_coords(var):
+            by_key.setdefault(("VEP", vep_service.cache_key(
+                str(var["chrom"]), str(var["pos"]), var["ref"], var["alt"])), []).append(i)
+
+    queue: "asyncio.Queue[Optional[Tuple]]" = asyncio.Queue()
+    emit = lambda provider, key, value: queue.put_nowait(("result", provider, key, value))
+
+    async def resolve():
+        resolved = await fill_from_vep([variants[i] for i in bare])
+        for i, var in zip(bare, resolved):
+            if has_gene_change(var):
+                queue.put_nowait(("variant", i, var))
+        return await annotate_variants(resolved, on_result=emit)
+
+    tasks = [asyncio.ensure_future(annotate_variants([variants[i] for i in ready], on_result=emit))]
+    if bare:
+        tasks.append(asyncio.ensure_future(resolve()))
+    for t in tasks:
+        t.add_done_callback(lambda _: queue.put_nowait(None))
+    sent = set()
+    running = len(tasks)
+    while running:
+        item = await queue.get()
+        if item is None:
+            running -= 1
+            continue
+        if item[0] == "variant":
+            _, i, var = item
+            variants[i], norm[i] = var, normalize_variant(var)
+            yield {"event": "variant", "t_ms": ms(), "variant_index": i, "variant": norm[i]}
+            for ev in register(i):
+                yield ev
+            continue
+        _, provider, key, value = item
+        render = _SOURCE_DETAILS.get(provider)
+        for i in by_key.get((provider, key), []):
+            if render is None or (provider, i) in sent:
+                continue
+            sent.add((provider, i))
+            details = render(norm[i]["gene"], norm[i]["protein_change"], value)
+            if details:
+                yield {"event": "details", "t_ms": ms(), "source": SOURCE_NAMES.get(provider, provider),
+                       "variant_index": i, "details": details}
+
+    annotations: List[Dict[str, Any]] = [{} for _ in variants]
+    meta: Dict[str, Any] = {"stale_sources": set(), "failed_sources": set()}
+    for idx, t in zip((ready, bare), tasks):
+        anns, m = t.result()
+        for i, ann in zip(idx, anns):
+            annotations[i] = ann
+        for k in meta:
+            meta[k].update(m[k])
+    meta = {k: sorted(v) for k, v in meta.items()}
+    for i, (v, ann) in enumerate(zip(norm, annotations)):
+        if not local[i] and not ann.get("CIVIC") and not ann.get("CLINVAR") and not _oncokb_known(ann.get("ONCOKB")):
+            details = rule_details(v["gene"], v["protein_change"])
+            if details:
+                yield {"event": "details", "t_ms": ms(), "source": "Rule", "variant_index": i, "details": details}
+    yield {"event": "report", "t_ms": ms(),
+           **build_report(pseudonym, tumor_type, variants, biomarkers, annotations, meta)}
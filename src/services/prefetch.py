@@ -0,0 +1,150 @@
+import asyncio, time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..core.config import (
+    CACHE_TTLS, PREFETCH_CHUNK, PREFETCH_REFRESH_MARGIN, PREFETCH_ON_STARTUP, PREFETCH_INTERVAL, PREFETCH_FILE,
+    ONCOKB_TOKEN,
+)
+from ..core.database import cache_ts_many, cache_set_many
+from ..core import kb
+from ..utils.tumor_utils import hotspots_de_panel
+from ..utils.vcf_parser import read_vcf_variants
+from . import vep_service
+from .pipeline import PROVIDERS, has_coords
+
+# Precarga del cache: para una lista de variantes (de los paneles por tumor o de un archivo)
+# trae por los caminos en lote todo lo que falte o esté por vencer, así los primeros requests
+# tras un deploy o tras el TTL no salen a la red.
+
+# Los proveedores por (gen, cambio) son los del pipeline; VEP va aparte (necesita coordenadas).
+# Con PROVIDER_MODE=local estos responden desde la base local y no se cachean.
+_LOCAL_SOURCES = ("CIVIC", "CLINVAR")
+
+Variant = Dict[str, Any]
+Progress = Callable[[Dict[str, Any]], None]
+
+def read_variants(path: str) -> List[Variant]:
+    """Variantes de un archivo: VCF (.vcf/.vcf.gz, con coordenadas) o texto con una por línea,
+    'GEN VARIANTE [CHROM POS REF ALT]' separadas por espacios, tabs o comas ('#' comenta)."""
+    if ".vcf" in path.lower():
+        with open(path, "rb") as f:
+            return read_vcf_variants(f)
+    out: List[Variant] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split("#", 1)[0].replace(",", " ").split()
+            if len(parts) < 2:
+                continue
+            var: Variant = {"gene": parts[0].upper(), "protein_change": parts[1].upper()}
+            if len(parts) >= 6:
+                var.update(chrom=parts[2], pos=parts[3], ref=parts[4], alt=parts[5])
+            out.append(var)
+    return out
+
+def panel_variants(tumors: Optional[List[str]] = None) -> List[Variant]:
+    return [{"gene": g, "protein_change": pc} for g, pc in hotspots_de_panel(tumors)]
+
+def _due(provider: str, keys: Iterable[str], now: float, margin: float) -> List[str]:
+    """Claves ausentes o a menos de `margin` segundos de pasar el TTL blando."""
+    keys = list(keys)
+    ts = cache_ts_many([(provider, k) for k in keys])
+    limit = CACHE_TTLS.get(provider, 7*24*3600) - margin
+    return [k for k in keys if (provider, k) not in ts or now - ts[(provider, k)] > limit]
+
+async def _fill(provider: str, fetch_many, items: Dict[str, Tuple], margin: float, stats: Dict[str, int]) -> None:
+    due = await asyncio.to_thread(_due, provider, items, time.time(), margin)
+    stats["fresh"] += len(items) - len(due)
+    if not due:
+        return
+    fetched = await fetch_many([items[k] for k in due])
+    if fetched:
+        await asyncio.to_thread(cache_set_many, [(provider, k, v) for k, v in fetched.items()])
+    stats["fetched"] += len(fetched)
+    stats["failed"] += len(due) - len(fetched)
+
+async def prefetch(
+    variants: List[Variant],
+    providers: Optional[List[str]] = None,
+    margin: float = PREFETCH_REFRESH_MARGIN,
+    chunk: int = PREFETCH_CHUNK,
+    progress: Optional[Progress] = None,
+) -> Dict[str, Any]:
+    """Llena el cache de CIViC/ClinVar/OncoKB (y VEP para las variantes con coordenadas) en
+    tandas de `chunk` variantes; dentro de cada tanda los proveedores van en paralelo y cada
+    uno usa su camino en lote con su propio límite de concurrencia."""
+    names = [p.upper() for p in (providers or list(PROVIDERS) + ["VEP"])]
+    if kb.mode() == kb.LOCAL:
+        names = [p for p in names if p not in _LOCAL_SOURCES]
+    if not ONCOKB_TOKEN:
+        # Sin token OncoKB responde el marcador {"data": []}: no hay nada que precargar
+        names = [p for p in names if p != "ONCOKB"]
+    stats = {p: {"fresh": 0, "fetched": 0, "failed": 0} for p in names}
+    started = time.time()
+    done = 0
+    for i in range(0, len(variants), chunk):
+        part = variants[i:i + chunk]
+        jobs = []
+        for name in names:
+            if name == "VEP":
+                coords = {}
+                for v in part:
+                    if has_coords(v):
+                        c = (str(v["chrom"]), str(v["pos"]), v["ref"], v["alt"])
+                        coords[vep_service.cache_key(*c)] = c
+                if coords:
+                    jobs.append(_fill("VEP", vep_service.fetch_many_async, coords, margin, stats[name]))
+                continue
+            svc = PROVIDERS[name]
+            items: Dict[str, Tuple] = {}
+            for v in part:
+                gene, pc = (v.get("gene") or "").upper(), (v.get("protein_change") or "").upper()
+                if not (gene and pc):
+                    # Registro de VCF sin anotar: solo VEP
+                    continue
+                args: Tuple = (gene, pc)
+                if getattr(svc, "ACCEPTS_COORDS", False) and has_coords(v):
+                    args += (str(v["chrom"]), str(v["pos"]), v["ref"], v["alt"])
+                items.setdefault(svc.cache_key(gene, pc), args)
+            jobs.append(_fill(name, svc.fetch_many_async, items, margin, stats[name]))
+        await asyncio.gather(*jobs)
+        done += len(part)
+        if progress:
+            elapsed = time.time() - started
+            progress({"done": done, "total": len(variants), "elapsed_s": round(elapsed, 2),
+                      "variants_per_s": round(done / elapsed, 1) if elapsed else done})
+    elapsed = time.time() - started
+    return {
+        "variants": len(variants), "providers": stats, "elapsed_s": round(elapsed, 3),
+        "variants_per_s": round(len(variants) / elapsed, 1) if elapsed else len(variants),
+    }
+
+def default_variants() -> List[Variant]:
+    return read_variants(PREFETCH_FILE) if PREFETCH_FILE else panel_variants()
+
+_task: Optional[asyncio.Task] = None
+last_report: Optional[Dict[str, Any]] = None
+
+async def _loop(interval: float) -> None:
+    global last_report
+    while True:
+        try:
+            last_report = await prefetch(await asyncio.to_thread(default_variants))
+        except Exception:
+            # Igual que el mantenimiento: un fallo puntual no mata la tarea
+            pass
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+def start() -> None:
+    """Precarga en segundo plano al arrancar y, con PREFETCH_INTERVAL > 0, periódicamente."""
+    global _task
+    if PREFETCH_ON_STARTUP and _task is None:
+        _task = asyncio.get_running_loop().create_task(_loop(PREFETCH_INTERVAL))
+
+async def stop() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
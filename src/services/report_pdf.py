@@ -0,0 +1,182 @@
+import asyncio, hashlib, io, json, multiprocessing, os, threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib import colors
+
+from ..core.config import PDF_EXECUTOR, PDF_WORKERS, PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES
+
+# Render del reporte PDF de un análisis. Es CPU puro: /export/pdf lo corre en un pool acotado
+# (procesos por defecto) fuera del event loop y guarda el resultado en un cache en disco por
+# hash del payload; los workers de la cola de trabajos llaman a render_pdf directamente.
+
+# Cambiar si cambia el formato del PDF: invalida lo cacheado
+_RENDER_VERSION = "1"
+
+# Estilos construidos una vez por proceso
+_STYLES = getSampleStyleSheet()
+_TABLE_STYLE = TableStyle([('BACKGROUND',(0,0),(-1,0), colors.lightgrey), ('GRID',(0,0),(-1,-1), 0.5, colors.grey)])
+
+def _story(payload: Dict[str, Any]) -> list:
+    styles = _STYLES
+    story = []
+    story.append(Paragraph("Reporte PGx", styles["Title"]))
+    story.append(Spacer(1, 12))
+    patient = payload.get("patient", {})
+    result = payload.get("result", {})
+    story.append(Paragraph(f"Paciente: {patient.get('pseudonym','-')}", styles["Normal"]))
+    story.append(Paragraph(f"Tumor: {patient.get('tumor_type','-')}", styles["Normal"]))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph("Resumen", styles["Heading2"]))
+    story.append(Paragraph(result.get("summary","-"), styles["Normal"]))
+    story.append(Spacer(1, 12))
+    details = result.get("details") or []
+    data = [["Acción","Fármaco","Variante","Nivel","Año"]]
+    for d in details:
+        meta = d.get("study_meta",{})
+        var = d.get("variant",{})
+        data.append([d.get("action",""), d.get("drug",""), f"{var.get('gene','')} {var.get('protein_change','')}", meta.get("level","-"), str(meta.get("year","-"))])
+    if len(data) > 1:
+        # La cabecera se repite en cada página cuando la tabla se parte
+        table = Table(data, hAlign='LEFT', repeatRows=1)
+        table.setStyle(_TABLE_STYLE)
+        story.append(table)
+    return story
+
+def render_pdf(payload: Dict[str, Any]) -> bytes:
+    """PDF de {patient, result} (result con la forma de /analyze/unified)."""
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(_story(payload))
+    return buffer.getvalue()
+
+def render_to_file(payload: Dict[str, Any], path: str) -> int:
+    """Renderiza directo a `path` (escritura atómica) y devuelve el tamaño. Corre en el pool:
+    solo viaja el payload de ida y un entero de vuelta."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    SimpleDocTemplate(tmp, pagesize=A4).build(_story(payload))
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """Hash del payload canónico (claves ordenadas, sin espacios): mismo reporte, mismo hash."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256((_RENDER_VERSION + canonical).encode("utf-8")).hexdigest()
+
+# ---------------- Cache en disco ----------------
+
+class _PdfCache:
+    """Directorio de PDFs por hash, compartido entre procesos. Al pasar el tope de bytes se
+    borran los menos usados (el mtime se renueva en cada acierto)."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.pdf")
+
+    def get(self, digest: str) -> Optional[str]:
+        path = self.path(digest)
+        try:
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.name.endswith(".pdf"):
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, e.path))
+        return entries
+
+    def added(self, path: str, size: int) -> None:
+        """Registra un PDF nuevo y desaloja si se pasó del tope (nunca el recién agregado,
+        que está por enviarse)."""
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(s for _, s, _ in self._scan())
+            else:
+                self._bytes += size
+            if self._bytes <= self.max_bytes:
+                return
+            # Otros procesos también escriben: se recalcula desde el disco antes de borrar
+            entries = sorted(self._scan())
+            total = sum(s for _, s, _ in entries)
+            for _, s, old in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                if old == path:
+                    continue
+                try:
+                    os.remove(old)
+                except OSError:
+                    continue
+                total -= s
+                self.evictions += 1
+            self._bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        return {"dir": self.directory, "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+cache = _PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+# ---------------- Pool ----------------
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_inflight: Dict[str, "asyncio.Future[str]"] = {}
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if PDF_EXECUTOR == "process":
+                # spawn: el hijo no hereda hilos ni conexiones del servidor
+                _executor = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _executor = ThreadPoolExecutor(PDF_WORKERS, thread_name_prefix="pdf")
+        return _executor
+
+async def _render(payload: Dict[str, Any], digest: str) -> str:
+    path = cache.path(digest)
+    size = await asyncio.get_running_loop().run_in_executor(_get_executor(), render_to_file, payload, path)
+    # El desalojo recorre el directorio y borra archivos: fuera del event loop
+    await asyncio.to_thread(cache.added, path, size)
+    return path
+
+async def render_cached(payload: Dict[str, Any], digest: Optional[str] = None) -> str:
+    """Ruta del PDF del payload: del cache o renderizado en el pool. Pedidos simultáneos del
+    mismo reporte comparten un solo render."""
+    digest = digest or payload_hash(payload)
+    path = cache.get(digest)
+    if path is not None:
+        return path
+    fut = _inflight.get(digest)
+    if fut is None:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        fut = asyncio.ensure_future(_render(payload, digest))
+        _inflight[digest] = fut
+        fut.add_done_callback(lambda _: _inflight.pop(digest, None))
+    return await asyncio.shield(fut)
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
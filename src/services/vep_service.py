@@ -1,35 +1,168 @@
-from typing import Any, Dict, List
-import httpx
+import asyncio
+from typing import Any, Dict, Iterable, List, Tuple
 
-from ..core.config import VEP_URL, HTTP_TIMEOUT
-from ..core.database import cache_get, cache_set
+from ..core.config import VEP_URL, VEP_BATCH_SIZE, VEP_BATCH_CONCURRENCY
+from ..core.database import cache_get, cache_set, cache_lookup_many, cache_set_many
+from ..core import http_clients, resilience, revalidate
+from ..core.resilience import UpstreamError
+from ..utils.vcf_parser import short_protein_change
 
 def ping() -> bool:
     try:
-        with httpx.Client(timeout=HTTP_TIMEOUT) as c:
-            # ping suave: OPTIONS o GET sin enviar payload pesado
-            r = c.get(VEP_URL, headers={"Content-Type":"application/json", "Accept":"application/json"})
-            # Algunos endpoints devuelven 400 por falta de payload; si responde, lo tomamos como vivo.
-            return r.status_code in (200, 400, 405)
+        # ping suave: OPTIONS o GET sin enviar payload pesado
+        r = http_clients.request("VEP", "GET", VEP_URL, retries=0,
+                                 headers={"Content-Type":"application/json", "Accept":"application/json"})
+        # Algunos endpoints devuelven 400 por falta de payload; si responde, lo tomamos como vivo.
+        return r.status_code in (200, 400, 405)
     except Exception:
         return False
 
+_HEADERS = {"Content-Type":"application/json", "Accept":"application/json"}
+
+def cache_key(chrom: str, pos: str, ref: str, alt: str) -> str:
+    return f"VEP::{chrom}:{pos}:{ref}>{alt}"
+
+def _input(chrom: str, pos: str, ref: str, alt: str) -> str:
+    # Formato VCF que acepta el endpoint region; VEP lo devuelve tal cual en "input"
+    return f"{chrom} {pos} . {ref} {alt} . . ."
+
+# canonical y hgvs: sin ellos VEP no devuelve transcript_consequences[].canonical ni .hgvsp,
+# que gene_and_change usa para elegir el transcripto y la numeración proteica
+_OPTIONS = {"canonical": 1, "hgvs": 1}
+
+def _payload(chrom: str, pos: str, ref: str, alt: str) -> Dict[str, Any]:
+    return {"variants": [_input(chrom, pos, ref, alt)], **_OPTIONS}
+
+def _parse(r) -> Dict[str, Any]:
+    if r.status_code != 200:
+        raise UpstreamError(f"VEP HTTP {r.status_code}")
+    j = r.json()
+    if j and isinstance(j, list):
+        return j[0]
+    return {"transcript_consequences": []}
+
+def _coords(rec) -> Tuple[str, str, str, str]:
+    if isinstance(rec, dict):
+        return str(rec["chrom"]), str(rec["pos"]), rec["ref"], rec["alt"]
+    if hasattr(rec, "chrom"):
+        return str(rec.chrom), str(rec.pos), rec.ref, rec.alt
+    chrom, pos, ref, alt = rec
+    return str(chrom), str(pos), ref, alt
+
+def _protein_change(tc: Dict[str, Any]) -> str:
+    if tc.get("hgvsp"):
+        # VEP REST devuelve el "=" de las sinónimas codificado
+        return short_protein_change(tc["hgvsp"].replace("%3D", "="))
+    aa, start = tc.get("amino_acids") or "", tc.get("protein_start")
+    if start and aa:
+        ref, _, alt = aa.partition("/")
+        return f"{ref}{start}{alt or '='}".upper()
+    return ""
+
+def gene_and_change(result: Any) -> Tuple[str, str]:
+    """(gen, cambio proteico corto) de un resultado de VEP pedido con canonical y hgvs. Va
+    primero el transcripto canónico (numeración estándar) con cambio proteico y, entre esos,
+    el de la consecuencia más grave. ("", "") si VEP no trae transcriptos con gen."""
+    if not isinstance(result, dict):
+        return "", ""
+    worst = result.get("most_severe_consequence")
+    tcs = [t for t in result.get("transcript_consequences") or [] if isinstance(t, dict) and t.get("gene_symbol")]
+    if not tcs:
+        return "", ""
+    top = min(tcs, key=lambda t: (not t.get("canonical"), not _protein_change(t),
+                                  worst not in (t.get("consequence_terms") or [])))
+    return str(top["gene_symbol"]).upper(), _protein_change(top)
+
+async def ping_async(timeout: float) -> bool:
+    r = await http_clients.arequest("VEP", "GET", VEP_URL, retries=0, timeout=timeout, headers=_HEADERS)
+    return r.status_code in (200, 400, 405)
+
 def annotate_region(chrom: str, pos: str, ref: str, alt: str) -> Dict[str, Any]:
     """Consulta VEP para una coordenada simplificada. Cachea y no rompe flujo."""
-    key = f"VEP::{chrom}:{pos}:{ref}>{alt}"
+    key = cache_key(chrom, pos, ref, alt)
     data, ok = cache_get("VEP", key)
     if ok and data:
         return data
-    out = {"transcript_consequences": []}
     try:
-        payload = [{"variant": f"{chrom}:{pos}-{pos}:{ref}/{alt}"}]
-        with httpx.Client(timeout=HTTP_TIMEOUT) as c:
-            r = c.post(VEP_URL, json=payload, headers={"Content-Type":"application/json", "Accept":"application/json"})
-            if r.status_code == 200:
-                j = r.json()
-                if j and isinstance(j, list):
-                    out = j[0] if j else out
-    except Exception:
-        pass
+        out = resilience.call_sync("VEP", key, lambda: _parse(http_clients.request(
+            "VEP", "POST", VEP_URL, json=_payload(chrom, pos, ref, alt), headers=_HEADERS)))
+    except UpstreamError:
+        return {"transcript_consequences": []}
+    cache_set("VEP", key, out)
+    return out
+
+async def fetch_async(chrom: str, pos: str, ref: str, alt: str) -> Dict[str, Any]:
+    r = await http_clients.arequest("VEP", "POST", VEP_URL, json=_payload(chrom, pos, ref, alt), headers=_HEADERS)
+    return _parse(r)
+
+async def annotate_region_async(chrom: str, pos: str, ref: str, alt: str) -> Dict[str, Any]:
+    """Versión async de annotate_region."""
+    key = cache_key(chrom, pos, ref, alt)
+    data, ok = cache_get("VEP", key)
+    if ok and data:
+        return data
+    try:
+        out = await resilience.call("VEP", key, lambda: fetch_async(chrom, pos, ref, alt))
+    except UpstreamError:
+        return {"transcript_consequences": []}
     cache_set("VEP", key, out)
     return out
+
+async def _post_batch(inputs: List[str]) -> Dict[str, Any]:
+    """Un POST con hasta VEP_BATCH_SIZE variantes; devuelve {input: resultado}."""
+    async def go():
+        r = await http_clients.arequest("VEP", "POST", VEP_URL, json={"variants": inputs, **_OPTIONS}, headers=_HEADERS)
+        if r.status_code != 200:
+            raise UpstreamError(f"VEP HTTP {r.status_code}")
+        return r.json() or []
+    items = await resilience.call("VEP", f"batch::{inputs[0]}", go)
+    by_input = {it.get("input"): it for it in items if isinstance(it, dict)}
+    # VEP omite las entradas que no puede anotar: eso es "sin consecuencias", no un fallo
+    return {i: by_input.get(i) or {"transcript_consequences": []} for i in inputs}
+
+async def fetch_many_async(records: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+    """Consulta de red (sin cache) de muchas coordenadas en POSTs de hasta VEP_BATCH_SIZE, con
+    paralelismo acotado. Devuelve {cache_key: resultado}; las de lotes que fallaron quedan ausentes."""
+    inputs: Dict[str, str] = {}
+    for rec in records:
+        c = _coords(rec)
+        inputs[cache_key(*c)] = _input(*c)
+    keys = list(inputs)
+    key_by_input = {inputs[k]: k for k in keys}
+    chunks = [keys[i:i + VEP_BATCH_SIZE] for i in range(0, len(keys), VEP_BATCH_SIZE)]
+    sem = asyncio.Semaphore(VEP_BATCH_CONCURRENCY)
+
+    async def run(chunk: List[str]) -> Dict[str, Any]:
+        async with sem:
+            try:
+                return await _post_batch([inputs[k] for k in chunk])
+            except UpstreamError:
+                return {}
+
+    out: Dict[str, Any] = {}
+    for res in await asyncio.gather(*(run(c) for c in chunks)):
+        for inp, value in res.items():
+            out[key_by_input[inp]] = value
+    return out
+
+async def annotate_regions(records: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+    """Anota muchas coordenadas: resuelve el cache de todas en una consulta y manda solo los
+    faltantes en lote (fetch_many_async). Devuelve {cache_key: resultado}; las claves de lotes
+    que fallaron quedan ausentes."""
+    coords: Dict[str, Tuple[str, str, str, str]] = {}
+    for rec in records:
+        c = _coords(rec)
+        coords[cache_key(*c)] = c
+    if not coords:
+        return {}
+    found = await asyncio.to_thread(cache_lookup_many, [("VEP", k) for k in coords])
+    out: Dict[str, Dict[str, Any]] = {}
+    for (_, k), (value, stale) in found.items():
+        out[k] = value
+        if stale:
+            revalidate.schedule("VEP", k, lambda c=coords[k]: fetch_async(*c))
+    fetched = await fetch_many_async([coords[k] for k in coords if k not in out])
+    if fetched:
+        await asyncio.to_thread(cache_set_many, [("VEP", k, v) for k, v in fetched.items()])
+    out.update(fetched)
+    return out
@@ -1,40 +1,203 @@
-import json, os
-from typing import Any, Dict, Tuple
+import json, os, sqlite3, threading, time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from ..core.config import EVIDENCE_DIR, EVIDENCE_FILES
-from ..core.database import cache_get, cache_set
+from ..core.config import (
+    EVIDENCE_DIR, EVIDENCE_FILES, EVIDENCE_CHECK_INTERVAL, EVIDENCE_INDEX_MIN_BYTES, EVIDENCE_INDEX_DB,
+)
 
-def load_local_evidence() -> Tuple[dict, dict]:
-    """Carga evidencia local desde clinical_evidence/. Cachea y no rompe si faltan."""
-    cache_key = "EVIDENCE_LOCAL::v1"
-    data, ok = cache_get("EVIDENCE_LOCAL", cache_key)
-    if ok and data:
-        return data.get("cancer",{}), data.get("pharmgx",{})
-    cancer, pharmgx = {}, {}
+# Índice en proceso de la evidencia local, por (tumor, gen, variante) normalizados.
+# Se construye una vez (startup o primera consulta) y se reemplaza entero cuando cambia el
+# mtime/tamaño de algún JSON. Con archivos grandes las acciones viven en un SQLite compacto
+# (WITHOUT ROWID) que comparten todos los workers y solo se recompila si cambió la fuente.
+
+_Signature = Tuple[Tuple[str, int, int], ...]
+
+def _paths() -> Dict[str, str]:
+    return {name: os.path.join(EVIDENCE_DIR, fname) for name, fname in EVIDENCE_FILES.items()}
+
+def _signature() -> _Signature:
+    sig = []
+    for name, path in sorted(_paths().items()):
+        try:
+            st = os.stat(path)
+            sig.append((name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append((name, 0, -1))
+    return tuple(sig)
+
+def _read_json(path: str) -> dict:
     try:
-        cancer_path = os.path.join(EVIDENCE_DIR, EVIDENCE_FILES["cancer"])
-        pharm_path = os.path.join(EVIDENCE_DIR, EVIDENCE_FILES["pharmgx"])
-        if os.path.exists(cancer_path):
-            with open(cancer_path, "r", encoding="utf-8") as f:
-                cancer = json.load(f)
-        if os.path.exists(pharm_path):
-            with open(pharm_path, "r", encoding="utf-8") as f:
-                pharmgx = json.load(f)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
     except Exception:
-        pass
-    cache_set("EVIDENCE_LOCAL", cache_key, {"cancer": cancer, "pharmgx": pharmgx})
-    return cancer, pharmgx
+        return {}
+
+def load_local_evidence() -> Tuple[dict, dict]:
+    """Carga completa de clinical_evidence/ (cancer, pharmgx). No rompe si faltan."""
+    paths = _paths()
+    return _read_json(paths["cancer"]), _read_json(paths["pharmgx"])
+
+def normalize_key(tumor: str, gene: str, variant: str) -> Tuple[str, str, str]:
+    return " ".join((tumor or "").lower().split()), (gene or "").upper().strip(), (variant or "").upper().strip()
+
+def _iter_actions(cancer: dict) -> Iterator[Tuple[Tuple[str, str, str], List[Dict[str, Any]]]]:
+    # Estructura esperada (flexible): cancer[tumor][gene][variant] -> {"actions": [...]}
+    for tumor, genes in cancer.items():
+        if not isinstance(genes, dict):
+            continue
+        for gene, variants in genes.items():
+            if not isinstance(variants, dict):
+                continue
+            for variant, node in variants.items():
+                if isinstance(node, dict) and node.get("actions"):
+                    yield normalize_key(tumor, gene, variant), node["actions"]
+
+class _MemoryIndex:
+    def __init__(self, signature: _Signature, cancer: dict):
+        self.signature = signature
+        self.actions: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = dict(_iter_actions(cancer))
+
+    def lookup(self, key: Tuple[str, str, str]) -> List[Dict[str, Any]]:
+        return self.actions.get(key) or []
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+class _DiskIndex:
+    """Índice compilado en SQLite: una fila por clave con las acciones en JSON."""
+
+    def __init__(self, signature: _Signature, path: str):
+        self.signature = signature
+        self.path = path
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """Cierra las conexiones de todos los hilos (índice ya reemplazado)."""
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+
+    def lookup(self, key: Tuple[str, str, str]) -> List[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT actions FROM evidence WHERE tumor=? AND gene=? AND variant=?", key).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM evidence").fetchone()[0]
+
+def _disk_signature(path: str) -> Optional[str]:
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key='signature'").fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+def compile_disk_index(path: str = EVIDENCE_INDEX_DB, signature: Optional[_Signature] = None) -> int:
+    """Compila el JSON de cáncer a un SQLite de solo lectura. Escribe en un temporal y lo
+    reemplaza con os.replace para que los lectores nunca vean un índice a medio armar."""
+    signature = signature or _signature()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE evidence (tumor TEXT, gene TEXT, variant TEXT, actions TEXT, "
+                     "PRIMARY KEY(tumor, gene, variant)) WITHOUT ROWID")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        cancer = _read_json(_paths()["cancer"])
+        rows = ((t, g, v, json.dumps(actions, ensure_ascii=False, separators=(",", ":")))
+                for (t, g, v), actions in _iter_actions(cancer))
+        conn.executemany("REPLACE INTO evidence VALUES (?, ?, ?, ?)", rows)
+        conn.execute("INSERT INTO meta VALUES ('signature', ?)", (json.dumps(signature),))
+        conn.commit()
+        n = conn.execute("SELECT COUNT(*) FROM evidence").fetchone()[0]
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return n
+
+def _build(signature: _Signature):
+    cancer_size = dict((name, size) for name, _, size in signature).get("cancer", -1)
+    if cancer_size >= EVIDENCE_INDEX_MIN_BYTES:
+        # Otro worker pudo haberlo compilado ya con la misma fuente
+        if _disk_signature(EVIDENCE_INDEX_DB) != json.dumps(signature):
+            compile_disk_index(EVIDENCE_INDEX_DB, signature)
+        return _DiskIndex(signature, EVIDENCE_INDEX_DB)
+    return _MemoryIndex(signature, _read_json(_paths()["cancer"]))
+
+_index = None
+_checked = 0.0
+_lock = threading.Lock()
+# El índice reemplazado se cierra después de este margen: las consultas que ya lo tenían
+# en la mano terminan en microsegundos
+_RETIRE_DELAY = 5.0
+
+def _refresh(now: float) -> None:
+    """Revisa las firmas y, si cambiaron, arma el índice nuevo y lo publica con una sola
+    asignación (recarga atómica). Se llama con _lock tomado y lo libera."""
+    global _index, _checked
+    try:
+        sig = _signature()
+        old = _index
+        if old is None or old.signature != sig:
+            _index = _build(sig)
+            if isinstance(old, _DiskIndex):
+                timer = threading.Timer(_RETIRE_DELAY, old.close)
+                timer.daemon = True
+                timer.start()
+    finally:
+        _checked = now
+        _lock.release()
+
+def get_index():
+    """Índice vigente; revisa los mtimes como mucho cada EVIDENCE_CHECK_INTERVAL segundos.
+    Se llama desde los handlers async: la revisión y la recarga corren en un hilo aparte y
+    mientras tanto se sigue sirviendo el índice anterior. Solo la primera construcción (si
+    no hubo warm) bloquea al llamador."""
+    now = time.monotonic()
+    idx = _index
+    if idx is not None and now - _checked < EVIDENCE_CHECK_INTERVAL:
+        return idx
+    if not _lock.acquire(blocking=idx is None):
+        return idx
+    if _index is None:
+        _refresh(now)
+    elif now - _checked < EVIDENCE_CHECK_INTERVAL:
+        # Otro hilo lo acaba de construir o revisar
+        _lock.release()
+    else:
+        threading.Thread(target=_refresh, args=(now,), name="evidence-reload", daemon=True).start()
+        return _index
+    return _index
+
+def warm() -> int:
+    """Construye el índice (startup). Devuelve la cantidad de entradas."""
+    return len(get_index())
 
 def local_actions_for_variant(gene: str, protein_change: str, tumor: str) -> list:
-    """Ejemplo: mapea desde evidencia local a acciones (si existen)."""
-    cancer, pharm = load_local_evidence()
-    out = []
-    # Estructura esperada (flexible): cancer[tumor][gene][variant] -> actions[]
-    tkey = (tumor or "").lower().strip()
+    """Acciones de la evidencia local para (tumor, gen, variante). La lista es compartida:
+    no modificarla."""
     try:
-        node = (((cancer or {}).get(tkey) or {}).get(gene.upper()) or {}).get(protein_change.upper())
-        if node and isinstance(node, dict):
-            out = node.get("actions") or []
+        return get_index().lookup(normalize_key(tumor, gene, protein_change))
     except Exception:
-        pass
-    return out
+        return []
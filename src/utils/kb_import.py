@@ -0,0 +1,186 @@
+import os, re, time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..core import kb
+from ..core.config import KB_ASSEMBLY, KB_PROGRESS_EVERY
+from .vcf_parser import iter_lines, short_protein_change
+
+# Importadores en streaming de los dumps de CIViC y ClinVar a la base local (core/kb).
+# Cada import es una release: las filas se insertan/actualizan con su número y, al final, se
+# borran las que la release nueva del mismo formato ya no trae. Todo va en una transacción,
+# así que los lectores ven la release anterior completa hasta el commit.
+
+_HGVS_P = re.compile(r"\(p\.([^)]+)\)")
+
+def _tsv(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Filas de un TSV con cabecera (la primera línea que no empieza con '##')."""
+    header: Optional[List[str]] = None
+    for line in lines:
+        if not line or line.startswith("##"):
+            continue
+        parts = line.rstrip("\r").split("\t")
+        if header is None:
+            header = [h.lstrip("#").strip() for h in parts]
+            continue
+        yield dict(zip(header, parts))
+
+def _int(value: Optional[str], default: int = 0) -> int:
+    try:
+        return int(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return default
+
+def _na(value: Optional[str]) -> Optional[str]:
+    return None if value in (None, "", "na", "-", "-1") else value
+
+def civic_rows(lines: Iterable[str], release: int) -> Iterator[Tuple]:
+    """nightly-ClinicalEvidenceSummaries.tsv (formato v1 gene/variant o v2 molecular_profile)."""
+    for rec in _tsv(lines):
+        eid = _int(rec.get("evidence_id"), -1)
+        if eid < 0:
+            continue
+        status = rec.get("evidence_status")
+        if status and status.lower() != "accepted":
+            continue
+        gene, variant = rec.get("gene") or "", rec.get("variant") or ""
+        if not gene:
+            # v2: "BRAF V600E"; los perfiles compuestos ("A & B") no mapean a una variante
+            profile = rec.get("molecular_profile") or ""
+            if "&" in profile or " " not in profile:
+                continue
+            gene, _, variant = profile.partition(" ")
+        yield (
+            eid, gene.upper().strip(), variant.upper().strip(), rec.get("disease"),
+            ",".join(d.strip() for d in (rec.get("therapies") or rec.get("drugs") or "").split(",") if d.strip()),
+            rec.get("evidence_type"), rec.get("evidence_level"),
+            rec.get("significance") or rec.get("clinical_significance"),
+            rec.get("evidence_statement"), rec.get("citation"),
+            rec.get("evidence_civic_url") or f"https://civicdb.org/evidence/{eid}",
+            _int(rec.get("rating")), release,
+        )
+
+def clinvar_summary_rows(lines: Iterable[str], release: int, assembly: str = KB_ASSEMBLY) -> Iterator[Tuple]:
+    """variant_summary.txt(.gz): una fila por variante y ensamblado; se queda con `assembly`."""
+    for rec in _tsv(lines):
+        if rec.get("Assembly") not in (assembly, "na"):
+            continue
+        vid = _int(rec.get("VariationID"), -1)
+        if vid < 0:
+            continue
+        name = rec.get("Name") or ""
+        m = _HGVS_P.search(name)
+        pos = _int(rec.get("PositionVCF"), -1)
+        yield (
+            vid, (rec.get("GeneSymbol") or "").split(";", 1)[0].upper(),
+            short_protein_change(m.group(1)) if m else "", name,
+            rec.get("ClinicalSignificance") or rec.get("GermlineClassification"),
+            rec.get("ReviewStatus"), _na(rec.get("LastEvaluated")),
+            _na(rec.get("Chromosome")), pos if pos > 0 else None,
+            _na(rec.get("ReferenceAlleleVCF")), _na(rec.get("AlternateAlleleVCF")), release,
+        )
+
+def _info(info: str) -> Dict[str, str]:
+    return dict(kv.split("=", 1) for kv in info.split(";") if "=" in kv)
+
+def clinvar_vcf_rows(lines: Iterable[str], release: int) -> Iterator[Tuple]:
+    """clinvar.vcf.gz: el ID es el VariationID; no trae cambio proteico (se conserva el de
+    variant_summary si ya estaba importado)."""
+    for line in lines:
+        if not line or line[0] == "#":
+            continue
+        parts = line.rstrip("\r").split("\t")
+        if len(parts) < 8:
+            continue
+        vid = _int(parts[2], -1)
+        if vid < 0:
+            continue
+        info = _info(parts[7])
+        yield (
+            vid, (info.get("GENEINFO") or "").split(":", 1)[0].upper(), "", info.get("CLNHGVS") or "",
+            (info.get("CLNSIG") or "").replace("_", " "), (info.get("CLNREVSTAT") or "").replace("_", " "),
+            None, parts[0], _int(parts[1]), parts[3], parts[4], release,
+        )
+
+_CIVIC_SQL = "REPLACE INTO civic_evidence VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_CLINVAR_SQL = (
+    "INSERT INTO clinvar_variant VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(variation_id) DO UPDATE SET "
+    "gene=COALESCE(NULLIF(excluded.gene, ''), gene), "
+    "protein_change=COALESCE(NULLIF(excluded.protein_change, ''), protein_change), "
+    # El nombre HGVS con (p.) de variant_summary no se pisa con el genómico del VCF
+    "name=CASE WHEN COALESCE(name, '') = '' OR excluded.name LIKE '%(p.%' THEN excluded.name ELSE name END, "
+    "clinical_significance=excluded.clinical_significance, review_status=excluded.review_status, "
+    "last_evaluated=COALESCE(excluded.last_evaluated, last_evaluated), "
+    "chrom=excluded.chrom, pos=excluded.pos, ref=excluded.ref, alt=excluded.alt, release=excluded.release"
+)
+
+# formato -> (fuente, tabla, SQL, generador de filas)
+FORMATS: Dict[str, Tuple[str, str, str, Callable[..., Iterator[Tuple]]]] = {
+    "civic-tsv": ("CIVIC", "civic_evidence", _CIVIC_SQL, civic_rows),
+    "clinvar-summary": ("CLINVAR", "clinvar_variant", _CLINVAR_SQL, clinvar_summary_rows),
+    "clinvar-vcf": ("CLINVAR", "clinvar_variant", _CLINVAR_SQL, clinvar_vcf_rows),
+}
+
+def detect_format(source: str, path: str) -> str:
+    if source.upper() == "CIVIC":
+        return "civic-tsv"
+    return "clinvar-vcf" if ".vcf" in os.path.basename(path).lower() else "clinvar-summary"
+
+def import_file(
+    source: str,
+    path: str,
+    fmt: Optional[str] = None,
+    force: bool = False,
+    prune: bool = True,
+    progress: Optional[Callable[[int, float], None]] = None,
+) -> Dict[str, Any]:
+    """Importa un dump a la base local. Si el mismo archivo (nombre, tamaño, mtime) ya se
+    importó, no hace nada salvo force=True. Con prune se borran las filas de releases
+    anteriores del mismo formato que este archivo ya no trae (usar prune=False para archivos
+    parciales)."""
+    fmt = fmt or detect_format(source, path)
+    src, table, sql, rows_fn = FORMATS[fmt]
+    st = os.stat(path)
+    fname = os.path.basename(path)
+    conn = kb.connect()
+    try:
+        kb.init(conn)
+        if not force and conn.execute(
+                "SELECT 1 FROM kb_imports WHERE source=? AND file=? AND size=? AND mtime=? AND finished IS NOT NULL",
+                (src, fname, st.st_size, int(st.st_mtime))).fetchone():
+            return {"source": src, "file": fname, "format": fmt, "skipped": True}
+        with conn:
+            release = conn.execute(
+                "INSERT INTO kb_imports (source, file, size, mtime, started, format) VALUES (?, ?, ?, ?, ?, ?)",
+                (src, fname, st.st_size, int(st.st_mtime), time.time(), fmt)).lastrowid
+        conn.execute("PRAGMA cache_size=-65536")
+        started = time.time()
+        count = [0]
+
+        def counted(rows: Iterator[Tuple]) -> Iterator[Tuple]:
+            for row in rows:
+                count[0] += 1
+                if progress and count[0] % KB_PROGRESS_EVERY == 0:
+                    progress(count[0], time.time() - started)
+                yield row
+
+        with open(path, "rb") as f, conn:
+            conn.executemany(sql, counted(rows_fn(iter_lines(f), release)))
+            removed = 0
+            if prune:
+                # Filas que la release nueva no trajo (retiradas upstream). Solo las que escribió
+                # por última vez este mismo formato: variant_summary y el VCF comparten tabla y
+                # cada uno trae variantes que el otro no tiene
+                removed = conn.execute(
+                    f"DELETE FROM {table} WHERE release < ? AND release IN "
+                    "(SELECT id FROM kb_imports WHERE format=?)", (release, fmt)).rowcount
+            conn.execute("UPDATE kb_imports SET rows=?, removed=?, finished=? WHERE id=?",
+                         (count[0], removed, time.time(), release))
+        elapsed = time.time() - started
+        return {
+            "source": src, "file": fname, "format": fmt, "release": release, "rows": count[0],
+            "removed": removed, "elapsed_s": round(elapsed, 3),
+            "rows_per_s": int(count[0] / elapsed) if elapsed > 0 else count[0],
+        }
+    finally:
+        conn.close()
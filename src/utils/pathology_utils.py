@@ -1,46 +1,241 @@
+import multiprocessing, re, threading
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
-import re
-from typing import List, Dict
+from ..core.config import HGNC_GENES_FILE, PATHOLOGY_WORKERS
+from .tumor_utils import HOTSPOTS_POR_GEN, _ALIAS_GEN
+from .vcf_parser import short_protein_change
+
+# Extracción de variantes y biomarcadores de informes de patología. Las expresiones se compilan
+# una vez al importar y el texto se recorre en una sola pasada: cada palabra con forma de
+# símbolo se busca en el diccionario de genes y solo tras un acierto se lee el cambio proteico
+# que la sigue. Los hallazgos salen deduplicados y con offsets de caracteres.
+
+# Genes que se reconocen aunque no haya archivo de HGNC
+_GENES_BASE = set(HOTSPOTS_POR_GEN) | set("""
+ABL1 AKT1 ALK APC AR ARID1A ATM ATR AXL BAP1 BARD1 BCL2 BRAF BRCA1 BRCA2 BRIP1 BTK CCND1 CDH1
+CDK12 CDK4 CDK6 CDKN2A CHEK1 CHEK2 CTNNB1 DDR2 DNMT3A EGFR EPCAM ERBB2 ERBB3 ERBB4 ESR1 EZH2
+FANCA FBXW7 FGFR1 FGFR2 FGFR3 FGFR4 FLT3 GNA11 GNAQ GNAS HRAS IDH1 IDH2 JAK1 JAK2 KDR KEAP1
+KIT KMT2A KRAS MAP2K1 MAP2K2 MDM2 MET MLH1 MPL MSH2 MSH6 MTOR MYC MYCN NF1 NF2 NOTCH1 NPM1
+NRAS NRG1 NTRK1 NTRK2 NTRK3 PALB2 PDGFRA PIK3CA PIK3R1 PMS2 POLE PTEN RAD51C RAD51D RAF1 RB1
+RET RNF43 ROS1 SF3B1 SMAD4 SMARCA4 SMARCB1 SMO STK11 TERT TP53 TSC1 TSC2 U2AF1 VHL
+""".split())
+
+# Genes cuya sola mención cuenta como biomarcador (mismo criterio que la versión anterior)
+_GENE_BIOMARKERS = {"ERBB2": "HER2", "EGFR": "EGFR", "KRAS": "KRAS", "BRAF": "BRAF"}
+
+# (biomarcador, expresión, calificador que tiene que aparecer después en la misma frase)
+_BIOMARKER_TERMS: List[Tuple[str, str, Optional[str]]] = [
+    ("MSI-H", r"MSI[-\s]?(?:H(?:igh)?|alta)\b", None),
+    ("MSI-H", r"MSI\b|microsatellite instability|inestabilidad de microsat[eé]lites", r"high|alta|elevada"),
+    ("TMB-H", r"TMB[-\s]?(?:H(?:igh)?|alta)\b|(?:high|alta) (?:tumor mutational burden|carga mutacional)", None),
+    ("TMB-H", r"TMB\b|tumor mutational burden|carga mutacional", r"high|alta|elevada"),
+    ("PD-L1", r"PD[-\s]?L1\b|programmed death[-\s]ligand[-\s]1", None),
+    ("HRD", r"HRD\b|homologous recombination deficiency|deficiencia de recombinaci[oó]n hom[oó]loga", None),
+]
+
+_SCAN = re.compile(
+    "|".join(rf"(?<!\w)(?P<b{i}>(?i:{expr}))" for i, (_, expr, _) in enumerate(_BIOMARKER_TERMS))
+    + r"|(?<!\w)(?P<gene>(?:[cC]-)?[A-Z][A-Z0-9]+(?:-[A-Z0-9]+)*)(?!\w)"
+)
+_QUALIFIERS = [re.compile(rf"[^\n.;]{{0,80}}?\b(?:{q})\b", re.I) if q else None for _, _, q in _BIOMARKER_TERMS]
+_PERCENT = re.compile(r"[^\n.;%]{0,60}?(\d+(?:[.,]\d+)?)\s*%")
+# Negación del biomarcador en la misma frase ("PD-L1 negativo", "MSI alta: no detectada"); para
+# los genes solo cuenta pegada al símbolo ("KRAS negativo", no "EGFR L858R y KRAS no mutado")
+_NEG_WORDS = r"negativ[oa]s?|negative|no detectad[oa]s?|not detected|ausente|absent|no mutad[oa]|wild[-\s]?type"
+_NEGATION = re.compile(rf"[^\n.;,]{{0,40}}?\b(?:{_NEG_WORDS})\b", re.I)
+_GENE_NEGATION = re.compile(rf"\s*(?:[:(]\s*)?(?:{_NEG_WORDS})\b", re.I)
+
+# Cambio proteico: una letra (V600E, E746_A750del, W288fs), tres letras (Val600Glu) o exón
+_AA = "ACDEFGHIKLMNPQRSTVWY"
+_ONE = rf"[{_AA}]\d{{1,4}}(?:_[{_AA}]\d{{1,4}})?(?:(?i:delins)[{_AA}]+|(?i:del|dup)|(?i:ins)[{_AA}]+|(?i:fs)(?:\*\d+)?|[{_AA}*X])"
+_THREE = (r"[A-Z][a-z]{2}\d{1,4}(?:_[A-Z][a-z]{2}\d{1,4})?"
+          r"(?:delins(?:[A-Z][a-z]{2})+|del|dup|ins(?:[A-Z][a-z]{2})+|fs(?:Ter\d+|\*\d+)?|[A-Z][a-z]{2}|\*)")
+_PROTEIN = rf"(?:(?P<one>{_ONE})|(?P<three>{_THREE}))"
+_EXON = (r"(?i:ex(?:[oó]n|on)?\s*(?P<exon>\d{1,2})\s*(?P<event>del|ins|skip|omisi)\w*"
+         r"|(?P<event2>del|ins|omisi)\w*\s+(?:del\s+|en\s+(?:el\s+)?|in\s+)?ex[oó]n\s*(?P<exon2>\d{1,2}))")
+_LEAD = (
+    r"\s{0,8}(?:[:(]\s*)?"
+    r"(?:(?i:(?:con|with)\s+(?:una?\s+|la\s+|an?\s+)?)?"
+    r"(?i:mutaci[oó]n|mutad[oa]|mutation|mutated|mutant|alteraci[oó]n|alteration|variante|variant|mut)\b\.?[\s:]*)?"
+    r"(?:c\.[\w>+*-]+\s*[(,;]?\s*)?"
+    r"(?:(?i:p)\.\s*\(?)?"
+)
+_CHANGE = re.compile(rf"{_LEAD}(?:{_PROTEIN}|{_EXON})(?![A-Za-z0-9])")
+# Más cambios del mismo gen: "EGFR L858R y T790M", "KRAS G12C/G12D"
+_NEXT = re.compile(rf"(?:\s*[,/;&]\s*|\s+(?i:y|e|and)\s+)(?:(?i:p)\.\s*)?{_PROTEIN}(?![A-Za-z0-9])")
+_VALID = re.compile(rf"[{_AA}*]\d+(?:_[{_AA}]\d+)?(?:DELINS[{_AA}]+|DEL|DUP|INS[{_AA}]+|FS(?:\*\d+)?|[{_AA}*X])")
+_EXON_EVENTS = {"del": "DEL", "ins": "INS", "ski": "SKIP", "omi": "SKIP"}
+
+class Mention(NamedTuple):
+    kind: str   # "variant" o "biomarker"
+    name: str   # símbolo aprobado del gen o nombre del biomarcador
+    value: str  # cambio proteico (sin 'p.', en mayúsculas) o valor del biomarcador ('' si no hay)
+    start: int
+    end: int
+    status: str = ""  # biomarcadores: "positive" o "negative"
+
+def _protein_change(m: "re.Match[str]") -> Optional[str]:
+    if m.group("one"):
+        return m.group("one").upper()
+    if m.group("three"):
+        pc = short_protein_change(m.group("three"))
+        return pc if _VALID.fullmatch(pc) else None
+    exon = m.group("exon") or m.group("exon2")
+    event = (m.group("event") or m.group("event2")).lower()[:3]
+    return f"EX{int(exon)}{_EXON_EVENTS[event]}"
+
+def _split_field(raw: str) -> List[str]:
+    return [s for s in (x.strip().upper() for x in raw.strip().strip('"').split("|")) if s]
+
+def load_gene_symbols(path: str = HGNC_GENES_FILE) -> Dict[str, str]:
+    """Símbolo o alias en mayúsculas -> símbolo aprobado. Lee hgnc_complete_set.txt (columnas
+    symbol, alias_symbol y prev_symbol) o una lista de un símbolo por línea. Los alias ambiguos
+    o que son el símbolo aprobado de otro gen se descartan."""
+    approved = {g: g for g in _GENES_BASE}
+    aliases: Dict[str, set] = {}
+    try:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            first = f.readline()
+            header = first.rstrip("\r\n").split("\t")
+            if "symbol" in header:
+                cols = {name: i for i, name in enumerate(header)}
+                extra = [cols[c] for c in ("alias_symbol", "prev_symbol") if c in cols]
+                for line in f:
+                    fields = line.rstrip("\r\n").split("\t")
+                    symbol = fields[cols["symbol"]].strip().upper()
+                    if not symbol:
+                        continue
+                    approved[symbol] = symbol
+                    for i in extra:
+                        for alias in _split_field(fields[i]) if i < len(fields) else ():
+                            aliases.setdefault(alias, set()).add(symbol)
+            else:
+                for line in [first, *f]:
+                    symbol = line.split("#", 1)[0].strip().upper()
+                    if symbol:
+                        approved[symbol] = symbol
+    except OSError:
+        pass
+    table = dict(approved)
+    for alias, symbols in aliases.items():
+        if alias not in approved and len(symbols) == 1:
+            table[alias] = next(iter(symbols))
+    table.update(_ALIAS_GEN)
+    return table
+
+class PathologyExtractor:
+    """Extractor compilado: `genes` es el diccionario de load_gene_symbols."""
+
+    def __init__(self, genes: Dict[str, str]):
+        self.genes = genes
+
+    def scan(self, text: str) -> Iterator[Mention]:
+        """Menciones en orden de aparición, sin deduplicar."""
+        genes = self.genes
+        for m in _SCAN.finditer(text):
+            kind = m.lastgroup
+            if kind != "gene":
+                i = int(kind[1:])
+                qualifier = _QUALIFIERS[i]
+                if qualifier is not None and qualifier.match(text, m.end()) is None:
+                    continue
+                name, value = _BIOMARKER_TERMS[i][0], ""
+                if name == "PD-L1":
+                    p = _PERCENT.match(text, m.end())
+                    value = f"{p.group(1)}%" if p else ""
+                status = "negative" if _NEGATION.match(text, m.end()) else "positive"
+                yield Mention("biomarker", name, value, m.start(), m.end(), status)
+                continue
+            token = m.group("gene").upper()
+            symbol = genes.get(token)
+            if symbol is None and "-" in token:
+                # "EGFR-TKI", "KRAS-mutado": vale el símbolo antes del guion
+                symbol = genes.get(token.split("-", 1)[0])
+            if symbol is None:
+                continue
+            if symbol in _GENE_BIOMARKERS:
+                status = "negative" if _GENE_NEGATION.match(text, m.end()) else "positive"
+                yield Mention("biomarker", _GENE_BIOMARKERS[symbol], "", m.start(), m.end(), status)
+            c = _CHANGE.match(text, m.end())
+            if c is None:
+                continue
+            pc = _protein_change(c)
+            if pc:
+                yield Mention("variant", symbol, pc, m.start(), c.end())
+            end = c.end()
+            while True:
+                n = _NEXT.match(text, end)
+                if n is None:
+                    break
+                pc = _protein_change(n)
+                if pc:
+                    yield Mention("variant", symbol, pc, n.start("one") if n.group("one") else n.start("three"), n.end())
+                end = n.end()
+
+    def extract(self, text: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Variantes y biomarcadores únicos; cada uno con el offset de su primera mención
+        (start/end, como en text[start:end]) y cuántas veces aparece."""
+        variants: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        biomarkers: Dict[str, Dict[str, Any]] = {}
+        for mt in self.scan(text or ""):
+            if mt.kind == "variant":
+                hit = variants.get((mt.name, mt.value))
+                if hit is None:
+                    variants[(mt.name, mt.value)] = {"gene": mt.name, "protein_change": mt.value,
+                                                     "start": mt.start, "end": mt.end, "mentions": 1}
+                else:
+                    hit["mentions"] += 1
+                continue
+            hit = biomarkers.get(mt.name)
+            if hit is None:
+                hit = biomarkers[mt.name] = {"name": mt.name, "status": mt.status,
+                                             "start": mt.start, "end": mt.end, "mentions": 1}
+            else:
+                hit["mentions"] += 1
+                if mt.status == "positive":
+                    # Alcanza con una mención afirmativa ("HER2 negativo por IHQ; HER2 amplificado")
+                    hit["status"] = "positive"
+            if mt.value and "value" not in hit:
+                hit["value"] = mt.value
+        return {"variants": list(variants.values()), "biomarkers": list(biomarkers.values())}
+
+_extractor: Optional[PathologyExtractor] = None
+_extractor_lock = threading.Lock()
+
+def get_extractor() -> PathologyExtractor:
+    """Extractor del proceso; el diccionario de genes se carga una sola vez."""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = PathologyExtractor(load_gene_symbols())
+    return _extractor
+
+def _extract_one(text: str) -> Dict[str, List[Dict[str, Any]]]:
+    return get_extractor().extract(text)
+
+def extract_many(texts: Iterable[str], workers: int = PATHOLOGY_WORKERS,
+                 chunksize: int = 64) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+    """extract() de muchos informes, en el mismo orden. Con workers > 1 se reparte entre
+    procesos (spawn): es CPU puro y con hilos no se gana nada por el GIL."""
+    if workers <= 1:
+        extractor = get_extractor()
+        for text in texts:
+            yield extractor.extract(text)
+        return
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        yield from pool.imap(_extract_one, texts, chunksize)
 
 def extract_variants_from_text(text: str) -> List[Dict[str, str]]:
-    variants = []
-    patterns = [
-        r'([A-Z0-9]+)\s+(?:mutación|mutado|alteración|variante)[:\s]+([A-Za-z0-9_*delins]+)',
-        r'([A-Z0-9]+)\s+([A-Z][0-9]+[A-Z*]*)',
-        r'([A-Z0-9]+)\s+(?:p\.)?([A-Z][a-z]{2}[0-9]+[A-Za-z*]*)'
-    ]
-    for pattern in patterns:
-        for match in re.finditer(pattern, text, re.IGNORECASE):
-            gene = match.group(1).upper()
-            change = match.group(2).upper()
-            if not change.startswith('P.'):
-                change = f"p.{change}"
-            variants.append({'gene': gene, 'protein_change': change})
-    return variants
+    """Variantes únicas del texto con la misma forma que las manuales (sin 'p.', en mayúsculas)."""
+    return [{"gene": v["gene"], "protein_change": v["protein_change"]}
+            for v in get_extractor().extract(text)["variants"]]
 
 def extract_biomarkers_from_text(text: str) -> List[Dict[str, str]]:
-    biomarkers = []
-    text_lower = text.lower()
-    patterns = {
-        "MSI-H": [r"MSI[-\\s]?H", r"microsatellite instability.*high", r"MSI.*high"],
-        "TMB-H": [r"TMB[-\\s]?H", r"tumor mutational burden.*high", r"high tumor mutational burden"],
-        "PD-L1": [r"PD[-\\s]?L1", r"programmed death ligand 1"],
-        "HRD": [r"HRD", r"homologous recombination deficiency"],
-        "HER2": [r"HER2", r"ERBB2"],
-        "EGFR": [r"EGFR"],
-        "KRAS": [r"KRAS"],
-        "BRAF": [r"BRAF"]
-    }
-    import re as _re
-    for biomarker, pattern_list in patterns.items():
-        for pattern in pattern_list:
-            if _re.search(pattern, text_lower, _re.IGNORECASE):
-                biomarkers.append({"name": biomarker, "status": "positive"})
-                break
-    m = _re.search(r"PD[-\\s]?L1.*?([0-9]+)%", text, _re.IGNORECASE)
-    if m:
-        for b in biomarkers:
-            if b["name"] == "PD-L1":
-                b["value"] = f"{m.group(1)}%"
-                break
-    return biomarkers
+    out = []
+    for b in get_extractor().extract(text)["biomarkers"]:
+        bio = {"name": b["name"], "status": b["status"]}
+        if "value" in b:
+            bio["value"] = b["value"]
+        out.append(bio)
+    return out
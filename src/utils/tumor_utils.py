@@ -1,5 +1,9 @@
 
-from typing import List, Tuple
+import json, re, unicodedata
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from ..core.config import ONCOTREE_FILE
 
 TUMORES_VALIDOS = [
     "adenocarcinoma de pulmón", "cáncer de pulmón nsclc", "cáncer de pulmón sclc",
@@ -31,20 +35,314 @@ BIOMARCADORES_POR_TUMOR = {
     "linfoma no-hodgkin": ["PD-L1", "CD19", "CD20", "MYC", "BCL2"]
 }
 
+# Variantes hotspot por gen (símbolo HGNC): concentran casi todo el tráfico real y son las
+# que se precargan en el cache (ver services/prefetch).
+HOTSPOTS_POR_GEN = {
+    "EGFR": ["L858R", "T790M", "C797S", "G719S", "G719A", "L861Q", "S768I", "EX19DEL"],
+    "KRAS": ["G12C", "G12D", "G12V", "G12A", "G12R", "G12S", "G13D", "Q61H", "Q61L", "Q61R", "A146T"],
+    "NRAS": ["G12D", "G12V", "G13D", "G13R", "Q61K", "Q61R", "Q61L"],
+    "BRAF": ["V600E", "V600K", "V600D", "K601E", "G469A", "L597R"],
+    "ALK": ["F1174L", "G1202R", "L1196M", "R1275Q"],
+    "ROS1": ["G2032R", "D2033N"],
+    "MET": ["D1228N", "Y1230C", "D1010H"],
+    "RET": ["M918T", "V804M", "C634R"],
+    "ERBB2": ["S310F", "L755S", "V777L", "V842I"],
+    "PIK3CA": ["E542K", "E545K", "H1047R", "H1047L", "N345K", "C420R"],
+    "ESR1": ["D538G", "Y537S", "Y537N", "E380Q", "L536H"],
+    "KIT": ["D816V", "L576P", "K642E", "V560D", "W557R"],
+    "IDH1": ["R132H", "R132C", "R132G", "R132S"],
+    "IDH2": ["R140Q", "R172K"],
+    "FLT3": ["D835Y", "D835H", "N676K"],
+    "NPM1": ["W288FS"],
+    "TP53": ["R175H", "R248Q", "R248W", "R273H", "R273C", "G245S", "R282W", "Y220C"],
+}
+
+# Nombres de los paneles que no son el símbolo del gen
+_ALIAS_GEN = {"HER2": "ERBB2", "C-KIT": "KIT"}
+
+def hotspots_de_panel(tumores: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """(gen, variante) hotspot de los genes de los paneles de BIOMARCADORES_POR_TUMOR
+    (todos los tumores si no se indican). Los biomarcadores sin hotspots (PD-L1, MSI-H...)
+    no aportan nada."""
+    tumores = tumores or list(BIOMARCADORES_POR_TUMOR)
+    out: Dict[Tuple[str, str], None] = {}
+    for tumor in tumores:
+        for marcador in BIOMARCADORES_POR_TUMOR.get(normalizar_tumor(tumor) or "", []):
+            gen = _ALIAS_GEN.get(marcador.upper(), marcador.upper())
+            for variante in HOTSPOTS_POR_GEN.get(gen, []):
+                out[(gen, variante)] = None
+    return list(out)
+
+# Sinónimos (castellano/inglés, siglas) y código OncoTree de cada tumor de TUMORES_VALIDOS.
+# Las tildes, mayúsculas y signos no importan: todo se compara plegado (ver _plegar).
+SINONIMOS_TUMOR = {
+    "adenocarcinoma de pulmón": ["lung adenocarcinoma", "adenocarcinoma pulmonar"],
+    "cáncer de pulmón nsclc": ["nsclc", "non-small cell lung cancer", "cáncer de pulmón de células no pequeñas", "cpcnp"],
+    "cáncer de pulmón sclc": ["sclc", "small cell lung cancer", "cáncer de pulmón de células pequeñas", "cpcp"],
+    "cáncer de colon": ["colon cancer", "adenocarcinoma de colon", "colon adenocarcinoma"],
+    "cáncer colorectal": ["cáncer colorrectal", "colorectal cancer", "crc"],
+    "cáncer de mama": ["breast cancer", "carcinoma de mama", "cáncer mamario"],
+    "cáncer gástrico": ["cáncer de estómago", "gastric cancer", "adenocarcinoma gástrico"],
+    "cáncer de próstata": ["prostate cancer", "adenocarcinoma de próstata"],
+    "cáncer de ovario": ["ovarian cancer", "carcinoma de ovario"],
+    "cáncer de tiroides": ["thyroid cancer", "carcinoma de tiroides"],
+    "cáncer de vejiga": ["bladder cancer", "carcinoma urotelial", "urothelial carcinoma"],
+    "cáncer de riñón": ["kidney cancer", "carcinoma renal", "renal cell carcinoma"],
+    "cáncer de hígado": ["liver cancer", "hepatocarcinoma", "carcinoma hepatocelular", "hepatocellular carcinoma"],
+    "cáncer de páncreas": ["pancreatic cancer", "adenocarcinoma de páncreas", "adenocarcinoma ductal de páncreas"],
+    "cáncer de cabeza y cuello": ["head and neck cancer", "carcinoma escamoso de cabeza y cuello"],
+    "glioblastoma": ["glioblastoma multiforme", "gbm"],
+    "tumores neuroendocrinos": ["tumor neuroendocrino", "neuroendocrine tumor", "net"],
+    "cáncer de mama triple negativo": ["triple negativo", "tnbc", "triple negative breast cancer"],
+    "melanoma cutáneo": ["cutaneous melanoma"],
+    "melanoma uveal": ["uveal melanoma", "melanoma ocular"],
+    "melanoma mucosal": ["mucosal melanoma", "melanoma de mucosas"],
+    "leucemia mieloide aguda (lma)": ["lma", "aml", "acute myeloid leukemia"],
+    "leucemia linfoide aguda (lla)": ["lla", "all", "acute lymphoblastic leukemia", "leucemia linfoblástica aguda"],
+    "leucemia mieloide crónica (lmc)": ["lmc", "cml", "chronic myeloid leukemia"],
+    "linfoma no-hodgkin": ["lnh", "nhl", "non-hodgkin lymphoma"],
+    "linfoma de hodgkin": ["hodgkin lymphoma"],
+    "mieloma múltiple": ["multiple myeloma", "mieloma"],
+    "síndromes mielodisplásicos": ["smd", "síndrome mielodisplásico", "myelodysplastic syndrome"],
+    "linfoma difuso de células b grandes": ["ldcbg", "dlbcl", "diffuse large b-cell lymphoma"],
+    "linfoma folicular": ["follicular lymphoma"],
+    "linfoma de células del manto": ["mantle cell lymphoma"],
+    "linfoma de hodgkin clásico": ["classical hodgkin lymphoma"],
+}
+
+ONCOTREE_POR_TUMOR = {
+    "adenocarcinoma de pulmón": "LUAD", "cáncer de pulmón nsclc": "NSCLC", "cáncer de pulmón sclc": "SCLC",
+    "cáncer de colon": "COAD", "cáncer colorectal": "COADREAD", "cáncer de mama": "BRCA",
+    "cáncer gástrico": "STAD", "melanoma": "MEL", "cáncer de próstata": "PRAD", "cáncer de ovario": "OVT",
+    "cáncer de tiroides": "THYROID", "cáncer de vejiga": "BLCA", "cáncer de riñón": "RCC",
+    "cáncer de hígado": "HCC", "cáncer de páncreas": "PAAD", "cáncer de cabeza y cuello": "HNSC",
+    "glioblastoma": "GB", "melanoma cutáneo": "SKCM", "melanoma uveal": "UM",
+    "leucemia mieloide aguda (lma)": "AML", "leucemia mieloide crónica (lmc)": "CML",
+    "mieloma múltiple": "PCM", "síndromes mielodisplásicos": "MDS",
+    "linfoma difuso de células b grandes": "DLBCLNOS", "linfoma folicular": "FL",
+    "linfoma de células del manto": "MCL", "linfoma de hodgkin clásico": "CHL",
+}
+
+# Términos que no alcanzan para elegir un tumor
+_GENERICOS = {"tumor", "cancer", "neoplasia", "maligno"}
+_SUGERENCIAS_GENERICAS = [
+    "adenocarcinoma de pulmón", "cáncer de mama", "cáncer de colon",
+    "melanoma", "leucemia mieloide aguda (lma)", "linfoma no-hodgkin",
+]
+# Palabras que no sirven para buscar por prefijo ("de" traería casi todo)
+_VACIAS = {"de", "del", "la", "el", "y", "en", "con", "of", "and", "the"}
+
+_NO_ALFANUM = re.compile(r"[^a-z0-9+]+")
+
+def _plegar(texto: str) -> str:
+    """Clave de comparación: sin tildes, en minúsculas y con los signos como espacios
+    ('Cáncer de pulmón (NSCLC)' -> 'cancer de pulmon nsclc')."""
+    sin_tildes = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    return " ".join(_NO_ALFANUM.sub(" ", sin_tildes.lower()).split())
+
+def _trigramas(clave: str) -> FrozenSet[str]:
+    s = f"  {clave} "
+    return frozenset(s[i:i + 3] for i in range(len(s) - 2))
+
+def _levenshtein(a: str, b: str, tope: int) -> int:
+    """Distancia de edición, cortando en tope + 1 en cuanto se sabe que la supera."""
+    if abs(len(a) - len(b)) > tope:
+        return tope + 1
+    previa = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(previa[j] + 1, actual[j - 1] + 1, previa[j - 1] + (ca != cb)))
+        if min(actual) > tope:
+            return tope + 1
+        previa = actual
+    return previa[-1]
+
+def _typo_por_palabra(palabras: List[str], otras: List[str]) -> bool:
+    if len(palabras) != len(otras) or palabras == otras:
+        return False
+    for a, b in zip(palabras, otras):
+        if a == b:
+            continue
+        if not (a.isalpha() and b.isalpha() and min(len(a), len(b)) >= 4 and _levenshtein(a, b, 1) <= 1):
+            return False
+    return True
+
+class _Nodo:
+    __slots__ = ("hijos", "ids")
+
+    def __init__(self):
+        self.hijos: Dict[str, "_Nodo"] = {}
+        self.ids: set = set()
+
+class _IndiceTumores:
+    """Vocabulario de tumores indexado una sola vez: claves plegadas exactas (nombre,
+    sinónimos y código OncoTree), un trie de palabras para autocompletar y trigramas con
+    distancia de edición para los errores de tipeo."""
+
+    def __init__(self, entradas: List[Tuple[str, List[str], Optional[str]]]):
+        self.nombres: List[str] = []
+        self.plegados: List[str] = []
+        self.codigos: List[Optional[str]] = []
+        self.exactas: Dict[str, int] = {}
+        self.claves: List[Tuple[str, int, int]] = []  # (clave plegada, id del tumor, nº de trigramas)
+        self.claves_por_tumor: List[List[str]] = []
+        self._raiz = _Nodo()
+        self._trigramas: Dict[str, List[int]] = {}
+        for nombre, sinonimos, codigo in entradas:
+            tid = len(self.nombres)
+            self.nombres.append(nombre)
+            self.plegados.append(_plegar(nombre))
+            self.codigos.append(codigo)
+            self.claves_por_tumor.append([])
+            for termino in [nombre, *sinonimos, *([codigo] if codigo else [])]:
+                clave = _plegar(termino)
+                if not clave or clave in self.exactas:
+                    continue
+                self.exactas[clave] = tid
+                self.claves_por_tumor[tid].append(clave)
+                kid = len(self.claves)
+                trigramas = _trigramas(clave)
+                self.claves.append((clave, tid, len(trigramas)))
+                for t in trigramas:
+                    self._trigramas.setdefault(t, []).append(kid)
+                for palabra in clave.split():
+                    if palabra in _VACIAS:
+                        continue
+                    nodo = self._raiz
+                    for c in palabra:
+                        nodo = nodo.hijos.setdefault(c, _Nodo())
+                        nodo.ids.add(tid)
+        # Cada nodo guarda todos los tumores con alguna palabra que empieza así: una consulta
+        # es bajar por el trie e intersecar, sin recorrer subárboles
+        pendientes = [self._raiz]
+        while pendientes:
+            nodo = pendientes.pop()
+            nodo.ids = frozenset(nodo.ids)
+            pendientes.extend(nodo.hijos.values())
+
+    def buscar(self, texto: str) -> Optional[str]:
+        """Nombre canónico si `texto` es exactamente un nombre, sinónimo o código (plegados)."""
+        tid = self.exactas.get(_plegar(texto))
+        return None if tid is None else self.nombres[tid]
+
+    def codigo(self, texto: str) -> Optional[str]:
+        tid = self.exactas.get(_plegar(texto))
+        return None if tid is None else self.codigos[tid]
+
+    def _por_prefijo(self, palabras: List[str]) -> FrozenSet[int]:
+        ids: Optional[FrozenSet[int]] = None
+        for palabra in palabras:
+            nodo = self._raiz
+            for c in palabra:
+                nodo = nodo.hijos.get(c)
+                if nodo is None:
+                    return frozenset()
+            ids = nodo.ids if ids is None else ids & nodo.ids
+            if not ids:
+                break
+        return ids or frozenset()
+
+    def parecidos(self, clave: str, limite: int) -> List[int]:
+        """Ids de los tumores con claves más parecidas a `clave` (coeficiente de Dice sobre
+        trigramas), del más al menos parecido."""
+        propios = _trigramas(clave)
+        comunes: Counter = Counter()
+        for t in propios:
+            for kid in self._trigramas.get(t, ()):
+                comunes[kid] += 1
+        mejor: Dict[int, float] = {}
+        for kid, n in comunes.items():
+            _, tid, total = self.claves[kid]
+            dice = 2 * n / (len(propios) + total)
+            if dice >= 0.3 and dice > mejor.get(tid, 0.0):
+                mejor[tid] = dice
+        return sorted(mejor, key=lambda tid: (-mejor[tid], tid))[:limite]
+
+    def corregir(self, texto: str) -> Optional[str]:
+        """Nombre canónico para errores de tipeo chicos: mismas palabras y cada una distinta
+        por una sola edición entre letras (nunca '+', dígitos ni siglas cortas: 'hr-' no pasa a
+        'hr+'). None si no hay un único tumor que cumpla."""
+        clave = _plegar(texto)
+        palabras = clave.split()
+        if len(clave) < 5:
+            return None
+        cerca = {tid for tid in self.parecidos(clave, 5)
+                 if any(_typo_por_palabra(palabras, otra.split()) for otra in self.claves_por_tumor[tid])}
+        return self.nombres[cerca.pop()] if len(cerca) == 1 else None
+
+    def sugerir(self, texto: str, limite: int = 8) -> List[str]:
+        """Autocompletado: primero los tumores cuyas palabras empiezan con las del texto
+        ('cancer pulm', 'lma'); si no hay ninguno, los más parecidos por trigramas ('melanona')."""
+        clave = _plegar(texto)
+        if not clave:
+            return []
+        palabras = [p for p in clave.split() if p not in _VACIAS] or clave.split()
+        ids = self._por_prefijo(palabras)
+        exacto = self.exactas.get(clave)
+        orden = sorted(ids, key=lambda tid: (tid != exacto, not self.plegados[tid].startswith(clave), tid))
+        if not orden:
+            orden = self.parecidos(clave, limite)
+        return [self.nombres[tid] for tid in orden[:limite]]
+
+def _entradas_oncotree(path: str) -> Tuple[List[Tuple[str, List[str], Optional[str]]], Dict[str, List[str]]]:
+    """Tipos de tumor de OncoTree (JSON de /api/tumorTypes o TSV con columnas code y name):
+    entradas nuevas y, para los códigos que ya tienen un tumor propio, su nombre como sinónimo."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".json"):
+                filas = [(str(t.get("code") or ""), str(t.get("name") or "")) for t in json.load(f)]
+            else:
+                cabecera = f.readline().rstrip("\r\n").lower().split("\t")
+                ic, inom = cabecera.index("code"), cabecera.index("name")
+                filas = []
+                for linea in f:
+                    campos = linea.rstrip("\r\n").split("\t")
+                    if len(campos) > max(ic, inom):
+                        filas.append((campos[ic], campos[inom]))
+    except (OSError, ValueError):
+        return [], {}
+    propios = {codigo: tumor for tumor, codigo in ONCOTREE_POR_TUMOR.items()}
+    nuevas, sinonimos = [], {}
+    for codigo, nombre in filas:
+        codigo, nombre = codigo.strip().upper(), nombre.strip()
+        if not (codigo and nombre):
+            continue
+        if codigo in propios:
+            sinonimos.setdefault(propios[codigo], []).append(nombre)
+        else:
+            nuevas.append((nombre.lower(), [], codigo))
+    return nuevas, sinonimos
+
+def _construir_indice() -> _IndiceTumores:
+    nuevas, sinonimos = _entradas_oncotree(ONCOTREE_FILE)
+    entradas = [(t, SINONIMOS_TUMOR.get(t, []) + sinonimos.get(t, []), ONCOTREE_POR_TUMOR.get(t))
+                for t in TUMORES_VALIDOS]
+    return _IndiceTumores(entradas + nuevas)
+
+INDICE_TUMORES = _construir_indice()
+
+def normalizar_tumor(tumor_input: str) -> Optional[str]:
+    """Nombre canónico del tumor (el de TUMORES_VALIDOS u OncoTree) a partir del nombre con o
+    sin tildes, un sinónimo, el código OncoTree o un error de tipeo chico; None si no se
+    reconoce."""
+    return INDICE_TUMORES.buscar(tumor_input) or INDICE_TUMORES.corregir(tumor_input)
+
+def codigo_oncotree(tumor: str) -> Optional[str]:
+    return INDICE_TUMORES.codigo(tumor)
+
+def sugerir_tumores(query: str, limite: int = 8) -> List[str]:
+    return INDICE_TUMORES.sugerir(query, limite)
+
 def validar_tumor(tumor_input: str) -> Tuple[bool, str, list]:
     tumor = (tumor_input or "").lower().strip()
     if not tumor:
         return False, "Debe especificar el tipo de tumor", []
-    if tumor in ["tumor", "cáncer", "cancer", "neoplasia", "maligno"]:
-        sugerencias = [
-            "adenocarcinoma de pulmón", "cáncer de mama", "cáncer de colon",
-            "melanoma", "leucemia mieloide aguda (lma)", "linfoma no-hodgkin"
-        ]
-        return False, "Especifique el tipo de tumor (ej: 'adenocarcinoma de pulmón')", sugerencias
-    if tumor in TUMORES_VALIDOS:
+    if _plegar(tumor) in _GENERICOS:
+        return False, "Especifique el tipo de tumor (ej: 'adenocarcinoma de pulmón')", list(_SUGERENCIAS_GENERICAS)
+    if normalizar_tumor(tumor) is not None:
         return True, "", []
-    sugerencias = [t for t in TUMORES_VALIDOS if tumor in t]
-    return False, f"Tumor '{tumor_input}' no válido o no encontrado.", sugerencias[:5]
+    return False, f"Tumor '{tumor_input}' no válido o no encontrado.", sugerir_tumores(tumor, 5)
 
 def obtener_biomarcadores_sugeridos(tumor: str) -> list:
-    return BIOMARCADORES_POR_TUMOR.get((tumor or "").lower().strip(), [])
+    return BIOMARCADORES_POR_TUMOR.get(normalizar_tumor(tumor) or "", [])
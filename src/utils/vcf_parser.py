@@ -1,18 +1,304 @@
-
-from typing import List, Dict
+import asyncio, codecs, tempfile, zlib
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from fastapi import UploadFile
 
-async def process_vcf_file(vcf: UploadFile) -> List[Dict]:
-    # Minimal parser: read lines and try to find ANN or simple CHR POS REF ALT; return dummy variant
-    content = (await vcf.read()).decode(errors="ignore").splitlines()
-    for line in content:
-        if line.startswith("#"):
+# Parser VCF en streaming: lee el archivo por bloques (texto plano, gzip o BGZF), nunca lo
+# carga entero en memoria, y devuelve registros compactos que conservan las coordenadas.
+
+CHUNK_SIZE = 1 << 20  # 1 MiB por lectura
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+class VcfTooLarge(ValueError):
+    """El VCF supera el tope de registros que se procesan dentro de un request."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"El VCF tiene más de {limit} variantes distintas")
+        self.limit = limit
+
+# Códigos de tres letras -> una letra (HGVS p.)
+_AA3 = {
+    "Ala": "A", "Arg": "R", "Asn": "N", "Asp": "D", "Cys": "C", "Gln": "Q", "Glu": "E",
+    "Gly": "G", "His": "H", "Ile": "I", "Leu": "L", "Lys": "K", "Met": "M", "Phe": "F",
+    "Pro": "P", "Ser": "S", "Thr": "T", "Trp": "W", "Tyr": "Y", "Val": "V", "Ter": "*",
+    "Sec": "U", "Pyl": "O", "Xaa": "X",
+}
+
+class VariantRecord(NamedTuple):
+    chrom: str
+    pos: int
+    ref: str
+    alt: str
+    gene: str = ""
+    protein_change: str = ""
+    zygosity: str = "unknown"
+
+    def to_dict(self) -> Dict:
+        return {
+            "gene": self.gene, "protein_change": self.protein_change, "zygosity": self.zygosity,
+            "chrom": self.chrom, "pos": self.pos, "ref": self.ref, "alt": self.alt,
+        }
+
+class _LineDecoder:
+    """Convierte bloques de bytes (planos, gzip o BGZF multi-miembro) en líneas de texto."""
+
+    def __init__(self):
+        self._gz: Optional[bool] = None
+        self._z = None
+        self._tail = ""
+        # Incremental: un carácter multibyte partido entre dos bloques no se pierde
+        self._utf8 = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def _inflate(self, data: bytes) -> bytes:
+        out = []
+        while data:
+            if self._z is None:
+                self._z = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            out.append(self._z.decompress(data))
+            if self._z.eof:
+                # BGZF = muchos miembros gzip concatenados
+                data = self._z.unused_data
+                self._z = None
+            else:
+                data = b""
+        return b"".join(out)
+
+    def feed(self, chunk: bytes) -> List[str]:
+        if self._gz is None:
+            self._gz = chunk[:2] == _GZIP_MAGIC
+        if self._gz:
+            chunk = self._inflate(chunk)
+        text = self._tail + self._utf8.decode(chunk)
+        lines = text.split("\n")
+        self._tail = lines.pop()
+        return lines
+
+    def close(self) -> List[str]:
+        tail, self._tail = self._tail + self._utf8.decode(b"", final=True), ""
+        return [tail] if tail else []
+
+def short_protein_change(hgvs_p: str) -> str:
+    """'ENSP...:p.Leu858Arg' -> 'L858R'; deja igual lo que ya está en una letra."""
+    if not hgvs_p:
+        return ""
+    pc = hgvs_p.split(":", 1)[-1]
+    if pc.startswith("p."):
+        pc = pc[2:]
+    pc = pc.strip("()")
+    if any(c.islower() for c in pc):
+        for three, one in _AA3.items():
+            pc = pc.replace(three, one)
+    return pc.upper()
+
+def _zygosity(gt: str, allele: int) -> str:
+    """Cigosidad del ALT número `allele` (1-based) según el GT de la muestra."""
+    alleles = gt.replace("|", "/").split("/")
+    if "." in alleles:
+        return "unknown"
+    n = alleles.count(str(allele))
+    if n == 0:
+        return "absent"
+    return "homozygous" if n == len(alleles) else "heterozygous"
+
+def _carrier_zygosity(gts: List[str], allele: int) -> str:
+    """Cigosidad del ALT en la primera muestra que lo porta. En un VCF tumor/normal (Mutect2
+    pone la normal primero) la llamada somática solo aparece en la segunda columna."""
+    if not gts:
+        return "unknown"
+    zygs = [_zygosity(gt, allele) for gt in gts]
+    for zyg in zygs:
+        if zyg in ("heterozygous", "homozygous"):
+            return zyg
+    return "unknown" if "unknown" in zygs else "absent"
+
+def _info_value(info: str, key: str) -> Optional[str]:
+    """Busca KEY= en INFO sin partir todo el campo (parseo perezoso)."""
+    start = 0
+    needle = key + "="
+    while True:
+        i = info.find(needle, start)
+        if i < 0:
+            return None
+        if i == 0 or info[i - 1] == ";":
+            j = info.find(";", i)
+            return info[i + len(needle): j if j >= 0 else len(info)]
+        start = i + 1
+
+class VcfParser:
+    """Parser incremental: alimentar con líneas (cabecera incluida) y consumir registros."""
+
+    def __init__(self):
+        self.csq_fields: Optional[List[str]] = None
+        self.samples: List[str] = []
+
+    def _header(self, line: str) -> None:
+        if line.startswith("##INFO=<ID=CSQ") and "Format:" in line:
+            fmt = line.split("Format:", 1)[1].rstrip('">').strip()
+            self.csq_fields = fmt.split("|")
+        elif line.startswith("#CHROM"):
+            self.samples = line.rstrip("\r").split("\t")[9:]
+
+    def _annotation(self, info: str, alt: str, n_alts: int):
+        """(gen, cambio proteico) desde ANN (SnpEff), CSQ (VEP) o GENEINFO, para este ALT."""
+        ann = _info_value(info, "ANN")
+        if ann:
+            entries = [e.split("|") for e in ann.split(",")]
+            for f in entries:
+                if len(f) >= 11 and (f[0] == alt or n_alts == 1):
+                    return f[3], short_protein_change(f[10])
+                if len(f) == 2:
+                    # Forma abreviada GEN|CAMBIO (demos)
+                    return f[0], short_protein_change(f[1])
+        csq = _info_value(info, "CSQ")
+        if csq and self.csq_fields:
+            idx = {name: i for i, name in enumerate(self.csq_fields)}
+            gi, pi, ai = idx.get("SYMBOL"), idx.get("HGVSp"), idx.get("Allele")
+            for e in csq.split(","):
+                f = e.split("|")
+                if ai is not None and ai < len(f) and n_alts > 1 and f[ai] != alt:
+                    continue
+                gene = f[gi] if gi is not None and gi < len(f) else ""
+                pc = f[pi] if pi is not None and pi < len(f) else ""
+                if gene:
+                    return gene, short_protein_change(pc)
+        geneinfo = _info_value(info, "GENEINFO") or _info_value(info, "GENE")
+        if geneinfo:
+            return geneinfo.split(":", 1)[0].split("|", 1)[0], ""
+        return "", ""
+
+    def _fields(self, line: str) -> Optional[List[str]]:
+        """Columnas de una línea de datos (None para cabeceras y líneas inválidas)."""
+        if not line or line[0] == "#":
+            if line:
+                self._header(line)
+            return None
+        parts = line.rstrip("\r").split("\t")
+        if len(parts) < 5 or not parts[1].isdigit():
+            return None
+        return parts
+
+    def parse_line(self, line: str) -> Iterator[VariantRecord]:
+        parts = self._fields(line)
+        if parts is None:
+            return
+        chrom, pos, _id, ref, alts = parts[:5]
+        info = parts[7] if len(parts) > 7 else ""
+        gts = [s.split(":", 1)[0] for s in parts[9:]] if len(parts) > 9 and parts[8].startswith("GT") else []
+        alt_list = alts.split(",")
+        for n, alt in enumerate(alt_list, 1):
+            if alt in (".", "*"):
+                continue
+            zyg = _carrier_zygosity(gts, n)
+            if zyg == "absent":
+                # Ninguna muestra porta este ALT (0/0 o un alelo no usado de un sitio multialélico)
+                continue
+            gene, pc = self._annotation(info, alt, len(alt_list)) if info else ("", "")
+            yield VariantRecord(chrom, int(pos), ref, alt, gene.upper(), pc, zyg)
+
+    def parse_line_samples(self, line: str) -> Iterator[Tuple[int, VariantRecord]]:
+        """Como parse_line pero para VCF multi-muestra: (índice de muestra, registro) por cada
+        muestra que porta el ALT. Sin columnas de genotipo todo va a la muestra 0."""
+        parts = self._fields(line)
+        if parts is None:
+            return
+        if len(parts) <= 9 or not parts[8].startswith("GT"):
+            for rec in self.parse_line(line):
+                yield 0, rec
+            return
+        chrom, pos, _id, ref, alts = parts[:5]
+        info = parts[7]
+        gts = [s.split(":", 1)[0] for s in parts[9:]]
+        alt_list = alts.split(",")
+        for n, alt in enumerate(alt_list, 1):
+            if alt in (".", "*"):
+                continue
+            gene, pc = self._annotation(info, alt, len(alt_list)) if info else ("", "")
+            for i, gt in enumerate(gts):
+                zyg = _zygosity(gt, n)
+                if zyg in ("heterozygous", "homozygous"):
+                    yield i, VariantRecord(chrom, int(pos), ref, alt, gene.upper(), pc, zyg)
+
+    def parse_lines(self, lines: Iterable[str]) -> Iterator[VariantRecord]:
+        for line in lines:
+            yield from self.parse_line(line)
+
+def iter_lines(fileobj, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Líneas de un archivo binario (plano, gzip o BGZF) leído por bloques."""
+    dec = _LineDecoder()
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        yield from dec.feed(chunk)
+    yield from dec.close()
+
+def iter_vcf_file(fileobj, chunk_size: int = CHUNK_SIZE) -> Iterator[VariantRecord]:
+    """Versión síncrona para archivos en disco (CLI, workers)."""
+    return VcfParser().parse_lines(iter_lines(fileobj, chunk_size))
+
+def detach_upload(upload: UploadFile):
+    """Separa el archivo de un UploadFile que se lee mientras se transmite la respuesta:
+    Starlette cierra los archivos del form al volver del endpoint, así que el UploadFile se
+    queda con un temporal vacío. El llamador cierra el archivo devuelto al terminar."""
+    fileobj, upload.file = upload.file, tempfile.SpooledTemporaryFile()
+    return fileobj
+
+async def aiter_lines(fileobj, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[str]:
+    """Como iter_lines, pero las lecturas del archivo (síncrono, en disco) van a un hilo."""
+    dec = _LineDecoder()
+    while True:
+        chunk = await asyncio.to_thread(fileobj.read, chunk_size)
+        if not chunk:
+            break
+        for line in dec.feed(chunk):
+            yield line
+    for line in dec.close():
+        yield line
+
+async def iter_vcf_records(vcf: UploadFile, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[VariantRecord]:
+    """Lee el UploadFile por bloques y produce registros a medida que aparecen."""
+    dec, parser = _LineDecoder(), VcfParser()
+    while True:
+        chunk = await vcf.read(chunk_size)
+        if not chunk:
+            break
+        for rec in parser.parse_lines(dec.feed(chunk)):
+            yield rec
+    for rec in parser.parse_lines(dec.close()):
+        yield rec
+
+def variant_key(rec: VariantRecord) -> Tuple:
+    """Clave de deduplicación: (gen, cambio) si el registro viene anotado; si no, sus coordenadas
+    (los registros sin anotación se completan después con VEP)."""
+    if rec.gene and rec.protein_change:
+        return (rec.gene, rec.protein_change)
+    return (rec.chrom, rec.pos, rec.ref, rec.alt)
+
+def _unique(records: Iterable[VariantRecord]) -> Iterator[Dict]:
+    seen = set()
+    for rec in records:
+        k = variant_key(rec)
+        if k in seen:
+            continue
+        seen.add(k)
+        yield rec.to_dict()
+
+def read_vcf_variants(fileobj) -> List[Dict]:
+    """Versión síncrona de process_vcf_file para archivos en disco (workers)."""
+    return list(_unique(iter_vcf_file(fileobj)))
+
+async def process_vcf_file(vcf: UploadFile, max_records: int = 0) -> List[Dict]:
+    """Variantes del VCF sin duplicados y con coordenadas. Las que no traen gen y cambio proteico
+    (VCF sin anotar) se conservan: el pipeline los completa con VEP. Con `max_records` la lectura
+    se corta con VcfTooLarge apenas se supera ese número de variantes distintas."""
+    seen = set()
+    out: List[Dict] = []
+    async for rec in iter_vcf_records(vcf):
+        k = variant_key(rec)
+        if k in seen:
             continue
-        parts = line.split("\t")
-        if len(parts) >= 5:
-            chrom, pos, _id, ref, alt = parts[:5]
-            # Dummy protein change from POS/ALT length
-            change = f"p.V{pos}L" if ref != alt else "p.UNKNOWN"
-            return [{"gene": "EGFR", "protein_change": change, "zygosity": "unknown"}]
-    # Fallback demo
-    return [{"gene": "EGFR", "protein_change": "L858R", "zygosity": "unknown"}]
+        if max_records and len(out) >= max_records:
+            raise VcfTooLarge(max_records)
+        seen.add(k)
+        out.append(rec.to_dict())
+    return out
@@ -0,0 +1,242 @@
+"""Worker de la cola de trabajos. Uso: python -m src.worker [--processes N] [--concurrency M]
+
+Cada proceso reclama trabajos de la cola SQLite (core/jobs), los corre con su propio event
+loop y clientes HTTP, informa avance con latidos y deja el resultado en JOBS_DIR. La app lanza
+JOBS_WORKERS procesos al arrancar; se pueden sumar más en otras máquinas/contenedores que
+compartan el disco."""
+import argparse, asyncio, json, multiprocessing, os, signal, socket, sys, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .core.config import (
+    JOBS_POLL_INTERVAL, JOBS_HEARTBEAT, JOBS_STALE_AFTER, JOBS_RETENTION, JOBS_WORKERS,
+)
+from .core import jobs
+
+# ---------------- Handlers por tipo de trabajo ----------------
+# Reciben (trabajo, contexto) y devuelven la ruta del resultado. El contexto informa avance
+# y corta con jobs.Cancelled si se pidió cancelar.
+
+class JobContext:
+    def __init__(self, job: Dict[str, Any]):
+        self.job = job
+        self.progress_data: Dict[str, Any] = {}
+        self._last = 0.0
+
+    def progress(self, force: bool = False, **data: Any) -> None:
+        """Actualiza el avance; se escribe en la base como mucho una vez por segundo."""
+        self.progress_data.update(data)
+        now = time.monotonic()
+        if not force and now - self._last < 1.0:
+            return
+        self._last = now
+        if jobs.heartbeat(self.job["id"], self.progress_data):
+            raise jobs.Cancelled()
+
+Handler = Callable[[Dict[str, Any], JobContext], Awaitable[Optional[str]]]
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+async def run_analyze(job: Dict[str, Any], ctx: JobContext) -> str:
+    """Un paciente (como /analyze/unified); el VCF, si vino, se parsea acá y no en la app."""
+    from .services import cohort
+    from .utils.vcf_parser import read_vcf_variants
+    params = job["params"]
+    patient = cohort.patient_from_json(params)
+    if job["input_path"]:
+        def parse() -> List[Dict[str, Any]]:
+            with open(job["input_path"], "rb") as f:
+                return read_vcf_variants(f)
+        vcf_variants = await asyncio.to_thread(parse)
+        patient["variants"] = vcf_variants + patient["variants"]
+        ctx.progress(force=True, stage="annotate", variants=len(patient["variants"]))
+    result = await cohort.analyze_patient(patient)
+    path = jobs.path_for(job["id"], "json")
+    await asyncio.to_thread(_write_atomic, path, json.dumps(result, ensure_ascii=False).encode("utf-8"))
+    return path
+
+async def run_cohort(job: Dict[str, Any], ctx: JobContext) -> str:
+    """Cohorte completa (como /analyze/batch) a un NDJSON; el avance es por paciente."""
+    from .services import cohort
+    from .utils.vcf_parser import iter_lines
+    params = job["params"]
+    path = jobs.path_for(job["id"], "ndjson")
+    tmp = path + ".tmp"
+    done = 0
+    with open(job["input_path"], "rb") as src, open(tmp, "w", encoding="utf-8") as out:
+        patients = cohort.read_patients(cohort.aiter_sync(iter_lines(src)), params.get("filename"),
+                                        params.get("tumor_type"))
+        async for res in cohort.analyze_cohort(patients, window=params.get("window")):
+            out.write(json.dumps(res, ensure_ascii=False) + "\n")
+            if res["type"] == "summary":
+                ctx.progress(force=True, **{k: v for k, v in res.items() if k != "type"})
+            else:
+                done += 1
+                ctx.progress(patients=done)
+    os.replace(tmp, path)
+    return path
+
+async def run_pdf(job: Dict[str, Any], ctx: JobContext) -> str:
+    from .services.report_pdf import render_pdf
+    pdf = await asyncio.to_thread(render_pdf, job["params"].get("payload") or {})
+    path = jobs.path_for(job["id"], "pdf")
+    await asyncio.to_thread(_write_atomic, path, pdf)
+    return path
+
+HANDLERS: Dict[str, Handler] = {
+    "analyze": run_analyze,
+    "cohort": run_cohort,
+    "pdf": run_pdf,
+}
+
+# Tipo de contenido del resultado de cada tipo de trabajo (lo usa el router)
+RESULT_MEDIA_TYPES = {
+    "analyze": "application/json",
+    "cohort": "application/x-ndjson",
+    "pdf": "application/pdf",
+}
+
+# ---------------- Loop del worker ----------------
+
+def _cleanup(job_id: str) -> None:
+    for suffix in ("json", "ndjson", "pdf"):
+        for path in (jobs.path_for(job_id, suffix), jobs.path_for(job_id, suffix) + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+async def run_job(job: Dict[str, Any], stop: asyncio.Event) -> None:
+    """Corre un trabajo con latidos periódicos; lo corta si se pide cancelarlo y lo devuelve
+    a la cola si el worker se está apagando."""
+    handler = HANDLERS.get(job["kind"])
+    if handler is None:
+        await asyncio.to_thread(jobs.fail, job["id"], f"tipo de trabajo desconocido: {job['kind']}")
+        return
+    ctx = JobContext(job)
+    task = asyncio.ensure_future(handler(job, ctx))
+    stopping = False
+    while not task.done():
+        await asyncio.wait({task}, timeout=JOBS_HEARTBEAT)
+        if task.done():
+            break
+        if stop.is_set():
+            stopping = True
+            task.cancel()
+        elif await asyncio.to_thread(jobs.heartbeat, job["id"]):
+            task.cancel()
+    try:
+        path = task.result()
+    except (asyncio.CancelledError, jobs.Cancelled):
+        await asyncio.to_thread(_cleanup, job["id"])
+        if stopping:
+            await asyncio.to_thread(jobs.requeue, job["id"])
+        else:
+            await asyncio.to_thread(jobs.mark_cancelled, job["id"])
+        return
+    except Exception as e:
+        await asyncio.to_thread(_cleanup, job["id"])
+        await asyncio.to_thread(jobs.fail, job["id"], f"{type(e).__name__}: {e}")
+        return
+    await asyncio.to_thread(jobs.finish, job["id"], path, ctx.progress_data or None)
+
+async def serve(stop: asyncio.Event, concurrency: int = 1, name: Optional[str] = None) -> None:
+    """Reclama y corre trabajos hasta que se active `stop`; con concurrency > 1 corre varios
+    a la vez en este proceso (útil cuando son de red y no de CPU)."""
+    from .core import http_clients, revalidate
+    from .core.database import cache_init
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    cache_init()
+    revalidate.start()
+    running: set = set()
+    last_recover = last_purge = 0.0
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            if now - last_recover >= JOBS_STALE_AFTER / 2:
+                last_recover = now
+                await asyncio.to_thread(jobs.recover_stale, JOBS_STALE_AFTER)
+            if now - last_purge >= 3600:
+                last_purge = now
+                await asyncio.to_thread(jobs.purge, JOBS_RETENTION)
+            job = await asyncio.to_thread(jobs.claim, name) if len(running) < concurrency else None
+            if job is None:
+                # Cola vacía (o sin lugar): se espera un poco o a que termine alguno
+                waiters = [asyncio.ensure_future(stop.wait())] + list(running)
+                await asyncio.wait(waiters, timeout=JOBS_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                waiters[0].cancel()
+                continue
+            t = asyncio.ensure_future(run_job(job, stop))
+            running.add(t)
+            t.add_done_callback(running.discard)
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        await revalidate.stop()
+        await http_clients.shutdown()
+
+def main_process(concurrency: int = 1) -> None:
+    """Punto de entrada de cada proceso worker: SIGTERM/SIGINT apagan ordenadamente (el
+    trabajo en curso vuelve a la cola)."""
+    async def run() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await serve(stop, concurrency)
+    asyncio.run(run())
+
+# ---------------- Procesos lanzados por la app ----------------
+
+_procs: List[multiprocessing.Process] = []
+
+def start_embedded(n: int = JOBS_WORKERS) -> None:
+    """Lanza n procesos worker (spawn: no heredan el estado de la app)."""
+    if _procs or n <= 0:
+        return
+    ctx = multiprocessing.get_context("spawn")
+    for _ in range(n):
+        p = ctx.Process(target=main_process, name="pgx-worker", daemon=True)
+        p.start()
+        _procs.append(p)
+
+def stop_embedded(timeout: float = 10.0) -> None:
+    for p in _procs:
+        if p.is_alive():
+            p.terminate()
+    deadline = time.monotonic() + timeout
+    for p in _procs:
+        p.join(max(0.0, deadline - time.monotonic()))
+        if p.is_alive():
+            p.kill()
+    _procs.clear()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.worker", description="Worker de la cola de trabajos")
+    parser.add_argument("--processes", type=int, default=1, help="Procesos worker")
+    parser.add_argument("--concurrency", type=int, default=1, help="Trabajos simultáneos por proceso")
+    args = parser.parse_args(argv)
+    if args.processes <= 1:
+        main_process(args.concurrency)
+        return 0
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=main_process, args=(args.concurrency,), name="pgx-worker")
+             for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
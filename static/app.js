@@ -195,11 +195,39 @@ analyzeBtn?.addEventListener("click", async () => {
   if (vcfInput?.files?.[0]) fd.append("vcf", vcfInput.files[0]);
   if (pathologyReport?.value) fd.append("pathology_report", pathologyReport.value);
 
-  const r = await fetch("/analyze/unified", { method: "POST", body: fd, headers: { Accept: "application/json" } });
-  let d;
-  try { d = await r.json(); } catch {}
-  if (!r.ok) return showBanner(typeof d === "object" ? JSON.stringify(d) : "Error al analizar");
-  renderResults(d);
+  // Streaming NDJSON: cada fuente se pinta apenas responde; el evento "report" trae el
+  // resultado completo (mismo formato que /analyze/unified) y reemplaza lo parcial
+  const r = await fetch("/analyze/stream", { method: "POST", body: fd, headers: { Accept: "application/x-ndjson" } });
+  if (!r.ok || !r.body) {
+    let d;
+    try { d = await r.json(); } catch {}
+    return showBanner(typeof d === "object" ? JSON.stringify(d) : "Error al analizar");
+  }
+  const partial = { summary: "Analizando… (resultados parciales)", details: [] };
+  let final = null;
+  const handle = (ev) => {
+    if (ev.event === "details") {
+      partial.details.push(...(ev.details || []));
+      renderResults(partial);
+    } else if (ev.event === "report") {
+      final = ev;
+      renderResults(ev);
+    }
+  };
+  const reader = r.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    const lines = buf.split("\n");
+    buf = lines.pop();
+    lines.filter((l) => l.trim()).forEach((l) => handle(JSON.parse(l)));
+  }
+  if (buf.trim()) handle(JSON.parse(buf));
+  if (!final) return showBanner("El análisis se interrumpió; se muestran resultados parciales");
+  if (final.failed_sources?.length) showBanner(`Fuentes sin respuesta: ${final.failed_sources.join(", ")}`);
   toast("✔ Análisis completo");
 });
 
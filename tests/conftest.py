@@ -0,0 +1,9 @@
+import os, sys, tempfile
+
+# Los módulos de src crean sus SQLite al importarse: en los tests van a un directorio temporal
+_tmp = tempfile.mkdtemp(prefix="pgx-tests-")
+os.environ.setdefault("PGX_CACHE_DB", os.path.join(_tmp, "cache.sqlite"))
+os.environ.setdefault("PGX_KB_DB", os.path.join(_tmp, "kb.sqlite"))
+os.environ.setdefault("PGX_JOBS_DIR", os.path.join(_tmp, "jobs"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
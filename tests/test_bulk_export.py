@@ -0,0 +1,35 @@
+import asyncio, csv, io, json, zipfile
+
+from src.services import bulk_export
+
+async def _reports(items):
+    for item in items:
+        yield item
+
+def _zip(items, **kw):
+    async def run():
+        return b"".join([chunk async for chunk in bulk_export.zip_stream(_reports(items), **kw)])
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(run())))
+
+def test_zip_stream_json_members_and_summaries():
+    details = [{"action": "Terapia dirigida", "drug": "Osimertinib", "strict_badge": True,
+                "variant": {"gene": "EGFR", "protein_change": "L858R"}}]
+    items = [
+        {"patient": {"pseudonym": "P/1", "tumor_type": "pulmón"}, "result": {"details": details}},
+        {"patient": {"pseudonym": "P/1"}, "result": {"error": "falló"}},
+    ]
+    zf = _zip(items, formats=("json",))
+    assert zf.testzip() is None
+    names = zf.namelist()
+    assert {"reports/P_1.json", "reports/P_1-2.json", "summary.csv", "summary.ndjson", "manifest.json"} <= set(names)
+    rows = {r["files"]: r for r in csv.DictReader(io.StringIO(zf.read("summary.csv").decode()))}
+    assert rows["reports/P_1.json"]["variants"] == "EGFR L858R"
+    assert rows["reports/P_1.json"]["strict_actions"] == "1"
+    assert rows["reports/P_1-2.json"]["error"] == "falló"
+    assert json.loads(zf.read("manifest.json"))["reports"] == 2
+
+def test_as_report_skips_batch_summary():
+    assert bulk_export.as_report({"type": "summary", "patients": 1}) is None
+    line = {"type": "patient", "pseudonym": "A", "tumor_type": "melanoma", "summary": "s"}
+    assert bulk_export.as_report(line) == {"patient": {"pseudonym": "A", "tumor_type": "melanoma"},
+                                           "result": {"summary": "s"}}
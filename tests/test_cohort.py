@@ -0,0 +1,31 @@
+import asyncio, os
+
+from src.services import cohort
+
+ANN = "ANN=G|missense_variant|MODERATE|EGFR|x|x|x|x|x|c.2573T>G|p.Leu858Arg"
+HEADER = "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tA\tB\n"
+
+async def _lines(text):
+    for line in text.split("\n"):
+        yield line
+
+async def _collect(text):
+    return [p async for p in cohort.vcf_patients(_lines(text), "melanoma")]
+
+def test_vcf_patients_spills_and_reads_back_per_sample(monkeypatch):
+    monkeypatch.setattr(cohort, "COHORT_SPILL_BATCH", 1)
+    removed = []
+    close = cohort._SampleSpill.close
+    monkeypatch.setattr(cohort._SampleSpill, "close", lambda self: (close(self), removed.append(self.path)))
+    text = HEADER + "".join([
+        f"7\t1\t.\tT\tG\t.\tPASS\t{ANN}\tGT\t0/1\t0/0\n",
+        f"7\t2\t.\tT\tG\t.\tPASS\t{ANN}\tGT\t0/1\t1/1\n",  # mismo cambio: se deduplica en A
+        "1\t10\t.\tA\tC\t.\tPASS\t.\tGT\t0/0\t0/1\n",
+    ])
+    out = asyncio.run(_collect(text))
+    assert [p["pseudonym"] for p in out] == ["A", "B"]
+    assert [(v["gene"], v["pos"]) for v in out[0]["variants"]] == [("EGFR", 1)]
+    assert [(v["pos"], v["zygosity"]) for v in out[1]["variants"]] == [(2, "homozygous"), (10, "heterozygous")]
+    assert out[1]["variants"][0]["protein_change"] == "L858R"
+    assert out[0]["tumor_type"] == "melanoma"
+    assert removed and not os.path.exists(removed[0])
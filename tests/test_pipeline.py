@@ -0,0 +1,41 @@
+import asyncio
+
+from src.services import pipeline
+
+BARE = {"chrom": "7", "pos": 55191822, "ref": "T", "alt": "G", "gene": "", "protein_change": "", "zygosity": "unknown"}
+BRAF = {"gene": "BRAF", "protein_change": "V600E"}
+
+def test_stream_report_does_not_wait_for_vep(monkeypatch):
+    resolved = asyncio.Event()
+    annotated = []
+
+    async def fill_from_vep(variants, deadline=None):
+        await resolved.wait()
+        return [{**v, "gene": "EGFR", "protein_change": "L858R"} for v in variants]
+
+    async def annotate_variants(variants, on_result=None, **kw):
+        annotated.append([pipeline.normalize_variant(v)["gene"] for v in variants])
+        return [{name: None for name in (*pipeline.PROVIDERS, "VEP")} for _ in variants], \
+            {"stale_sources": [], "failed_sources": ["VEP"] if variants and "chrom" in variants[0] else []}
+
+    monkeypatch.setattr(pipeline, "fill_from_vep", fill_from_vep)
+    monkeypatch.setattr(pipeline, "annotate_variants", annotate_variants)
+    monkeypatch.setattr(pipeline, "local_actions_for_variant", lambda *a: [])
+
+    async def run():
+        events = []
+        async for ev in pipeline.stream_report("P", "melanoma", [BARE, BRAF], []):
+            events.append(ev)
+            if ev["event"] == "start":
+                # VEP solo responde después de que el stream empezó: si lo esperara, no terminaría
+                resolved.set()
+        return events
+
+    events = asyncio.run(asyncio.wait_for(run(), 5))
+    kinds = [ev["event"] for ev in events]
+    assert kinds[0] == "start" and kinds[-1] == "report"
+    variant = next(ev for ev in events if ev["event"] == "variant")
+    assert variant["variant_index"] == 0 and variant["variant"] == {"gene": "EGFR", "protein_change": "L858R"}
+    assert annotated == [["BRAF"], ["EGFR"]]
+    report = events[-1]
+    assert "EGFR L858R" in report["summary"] and report["failed_sources"] == ["VEP"]
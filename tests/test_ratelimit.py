@@ -0,0 +1,15 @@
+from src.core import ratelimit
+from src.core.ratelimit import TokenBucket
+
+def test_token_bucket_burst_then_paced(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    bucket = TokenBucket("test", rate=10, burst=2, shared=False)
+    assert [round(bucket.reserve(), 3) for _ in range(4)] == [0.0, 0.0, 0.1, 0.2]
+    # Con el tiempo vuelve a haber ráfaga disponible
+    now[0] += 10
+    assert bucket.reserve() == 0.0
+
+def test_token_bucket_without_rate_never_waits():
+    bucket = TokenBucket("test", rate=0, shared=False)
+    assert bucket.reserve() == 0.0
@@ -0,0 +1,55 @@
+import asyncio, gzip, io
+
+import pytest
+from fastapi import UploadFile
+
+from src.utils.vcf_parser import VcfParser, VcfTooLarge, iter_lines, process_vcf_file, read_vcf_variants
+
+HEADER = "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{}\n"
+
+def _vcf(samples, *rows):
+    return (HEADER.format("\t".join(samples)) + "".join(r + "\n" for r in rows)).encode()
+
+def test_tumor_normal_keeps_somatic_call():
+    # Mutect2: la normal va primero y no porta la variante somática
+    data = _vcf(["normal", "tumor"],
+                "7\t55191822\t.\tT\tG\t.\tPASS\tANN=G|missense_variant|MODERATE|EGFR|x|x|x|x|x|c.2573T>G|p.Leu858Arg"
+                "\tGT:AD\t0/0:30,0\t0/1:20,12")
+    out = read_vcf_variants(io.BytesIO(data))
+    assert [(v["gene"], v["protein_change"], v["zygosity"]) for v in out] == [("EGFR", "L858R", "heterozygous")]
+
+def test_record_absent_in_every_sample_is_dropped():
+    data = _vcf(["normal", "tumor"], "7\t100\t.\tT\tG\t.\tPASS\tGENE=EGFR\tGT\t0/0\t0/0")
+    assert read_vcf_variants(io.BytesIO(data)) == []
+
+def test_multiallelic_only_carried_alt():
+    data = _vcf(["s1"], "1\t10\t.\tA\tC,G\t.\tPASS\t.\tGT\t0/2")
+    assert [(v["alt"], v["zygosity"]) for v in read_vcf_variants(io.BytesIO(data))] == [("G", "heterozygous")]
+
+def test_missing_genotype_is_unknown():
+    data = _vcf(["s1"], "1\t10\t.\tA\tC\t.\tPASS\t.\tGT\t./.")
+    assert [v["zygosity"] for v in read_vcf_variants(io.BytesIO(data))] == ["unknown"]
+
+def test_parse_line_samples_assigns_each_sample():
+    parser = VcfParser()
+    lines = _vcf(["normal", "tumor"], "7\t100\t.\tT\tG\t.\tPASS\t.\tGT\t0/0\t1/1").decode().splitlines()
+    out = [(i, rec.zygosity) for line in lines for i, rec in parser.parse_line_samples(line)]
+    assert out == [(1, "homozygous")]
+    assert parser.samples == ["normal", "tumor"]
+
+def test_process_vcf_file_stops_past_max_records():
+    rows = [f"1\t{p}\t.\tA\tC\t.\tPASS\t.\tGT\t0/1" for p in range(1, 5)]
+    data = _vcf(["s1"], *rows, rows[0])
+    assert len(asyncio.run(process_vcf_file(UploadFile(io.BytesIO(data)), 4))) == 4
+    with pytest.raises(VcfTooLarge):
+        asyncio.run(process_vcf_file(UploadFile(io.BytesIO(data)), 3))
+
+def test_iter_lines_utf8_split_across_chunks():
+    data = "##comentario=señal\n1\t10\n".encode()
+    cut = data.index("ñ".encode()) + 1  # corta el carácter de dos bytes a la mitad
+    assert list(iter_lines(io.BytesIO(data), chunk_size=cut)) == ["##comentario=señal", "1\t10"]
+
+def test_iter_lines_bgzf_multi_member():
+    # BGZF: miembros gzip concatenados, leídos en bloques que no coinciden con los miembros
+    data = gzip.compress(b"a\nb") + gzip.compress(b"c\n") + gzip.compress(b"d")
+    assert list(iter_lines(io.BytesIO(data), chunk_size=7)) == ["a", "bc", "d"]
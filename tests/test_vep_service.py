@@ -0,0 +1,40 @@
+from src.services import vep_service
+
+# Forma real de /vep/human/region con canonical=1 y hgvs=1 (recortada)
+EGFR_L858R = {
+    "input": "7 55191822 . T G . . .",
+    "most_severe_consequence": "missense_variant",
+    "transcript_consequences": [
+        {"gene_symbol": "EGFR", "transcript_id": "ENST00000455089", "consequence_terms": ["missense_variant"],
+         "amino_acids": "L/R", "protein_start": 813, "hgvsp": "ENSP00000415559.1:p.Leu813Arg"},
+        {"gene_symbol": "EGFR-AS1", "transcript_id": "ENST00000442411", "canonical": 1,
+         "consequence_terms": ["intron_variant", "non_coding_transcript_variant"]},
+        {"gene_symbol": "EGFR", "transcript_id": "ENST00000275493", "canonical": 1,
+         "consequence_terms": ["missense_variant"], "amino_acids": "L/R", "protein_start": 858,
+         "hgvsc": "ENST00000275493.7:c.2573T>G", "hgvsp": "ENSP00000275493.2:p.Leu858Arg"},
+    ],
+}
+
+def test_gene_and_change_prefers_canonical_numbering():
+    assert vep_service.gene_and_change(EGFR_L858R) == ("EGFR", "L858R")
+
+def test_gene_and_change_synonymous_hgvsp_is_decoded():
+    res = {"most_severe_consequence": "synonymous_variant", "transcript_consequences": [
+        {"gene_symbol": "KRAS", "canonical": 1, "consequence_terms": ["synonymous_variant"],
+         "amino_acids": "G", "protein_start": 12, "hgvsp": "ENSP00000256078.4:p.Gly12%3D"}]}
+    assert vep_service.gene_and_change(res) == ("KRAS", "G12=")
+
+def test_gene_and_change_without_hgvsp_uses_amino_acids():
+    res = {"most_severe_consequence": "missense_variant", "transcript_consequences": [
+        {"gene_symbol": "braf", "canonical": 1, "consequence_terms": ["missense_variant"],
+         "amino_acids": "V/E", "protein_start": 600}]}
+    assert vep_service.gene_and_change(res) == ("BRAF", "V600E")
+
+def test_gene_and_change_intergenic():
+    assert vep_service.gene_and_change({"most_severe_consequence": "intergenic_variant"}) == ("", "")
+    assert vep_service.gene_and_change(None) == ("", "")
+
+def test_payload_requests_canonical_and_hgvs():
+    payload = vep_service._payload("7", "55191822", "T", "G")
+    assert payload["canonical"] == 1 and payload["hgvs"] == 1
+    assert payload["variants"] == ["7 55191822 . T G . . ."]